@@ -1,60 +1,129 @@
 from __future__ import annotations
 
-import json
-import os
-import tempfile
-import uuid
-from datetime import datetime, timedelta
+import time
+from typing import Any, Callable
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
+from flask.json.provider import JSONProvider
+
+import codec
+import inventory
+import metrics
+import profiling
+from cache import ResponseCache, respond
+from config import Settings
+from datastore import DataStore
+from events import EventHub
+from storage import COLLECTIONS, ConflictError, open_storage
+
+settings = Settings.from_env()
+DATA_FILE = settings.data_file
+# Request, storage and lock timings, when EQUIPMENT_ELLIE_METRICS is set.
+stats = metrics.enable() if settings.metrics else None
+
+
+def _timed_dumps(payload: Any) -> bytes:
+    started = time.perf_counter()
+    body = codec.dumps(payload)
+    stats.encode_seconds.observe(time.perf_counter() - started)
+    return body
+
+
+# Encodes response bodies; timed only while metrics are on.
+_encode: Callable[[Any], bytes] = codec.dumps if stats is None else _timed_dumps
+
+
+class _CodecJSONProvider(JSONProvider):
+    """Encodes responses and decodes request bodies with ``codec``."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return _encode(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return codec.loads(s)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_FILE = os.path.join(BASE_DIR, "data.json")
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
+app.json = _CodecJSONProvider(app)
+backend = open_storage(DATA_FILE, durability=settings.durability, pretty_json=settings.pretty_json)
+if stats is not None:
+    backend = metrics.InstrumentedStore(backend, stats)
+store = DataStore(backend, commit_window=settings.commit_window)
+hub = EventHub(store)
+response_cache = ResponseCache()
 
+if stats is not None:
+    store.lock = metrics.TimedLock(store.lock, "store", stats)
+    stats.records.collect = lambda: {(name,): store.count(name) for name in COLLECTIONS}
 
-def _now_iso() -> str:
-    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+    @app.before_request
+    def _start_timer() -> None:
+        g.request_started = time.perf_counter()
 
+    @app.after_request
+    def _record_request(response: Response) -> Response:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        elapsed = time.perf_counter() - g.request_started
+        stats.request_seconds.observe(
+            elapsed, request.method, route, str(response.status_code)
+        )
+        return response
 
-def _due_iso() -> str:
-    return (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0).isoformat() + "Z"
+    @app.route("/metrics", methods=["GET"])
+    def prometheus_metrics() -> object:
+        return Response(stats.render(), mimetype="text/plain; version=0.0.4")
 
 
-def _load_data() -> dict:
-    if not os.path.exists(DATA_FILE):
-        return {"equipment": [], "people": [], "checkouts": []}
-    with open(DATA_FILE, "r", encoding="utf-8") as handle:
-        return json.load(handle)
+# Samples requests into cProfile captures, when EQUIPMENT_ELLIE_PROFILE_DIR is set.
+profiler = profiling.Profiler.from_settings(settings)
 
+if profiler is not None:
 
-def _save_data(data: dict) -> None:
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(DATA_FILE))
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as handle:
-            json.dump(data, handle, indent=2)
-        os.replace(temp_path, DATA_FILE)
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    @app.before_request
+    def _start_profile() -> None:
+        g.profile = profiler.start()
+        g.profile_started = time.perf_counter()
 
+    @app.after_request
+    def _note_status(response: Response) -> Response:
+        g.profile_status = response.status_code
+        return response
 
-def _find_by_id(items: list[dict], item_id: str) -> dict | None:
-    return next((item for item in items if item["id"] == item_id), None)
+    @app.teardown_request
+    def _stop_profile(exc: Any) -> None:
+        # Runs even when the view raised, so the profiler is always released.
+        profile = g.pop("profile", None)
+        if profile is not None:
+            status = g.get("profile_status", 500)
+            label = f"{request.method} {request.full_path.rstrip('?')} {status}"
+            profiler.stop(profile, label, time.perf_counter() - g.profile_started)
 
 
-def _active_checkout(data: dict, equipment_id: str) -> dict | None:
-    return next(
-        (
-            checkout
-            for checkout in data["checkouts"]
-            if checkout["equipment_id"] == equipment_id
-            and checkout["checked_in_at"] is None
-        ),
-        None,
-    )
+@app.before_request
+def _refresh_store() -> None:
+    # Other worker processes may have written since this one last looked.
+    store.refresh()
+
+
+@app.errorhandler(inventory.NotFoundError)
+def _not_found(exc: inventory.NotFoundError) -> object:
+    return jsonify({"error": str(exc)}), 404
+
+
+@app.errorhandler(inventory.ValidationError)
+def _invalid(exc: inventory.ValidationError) -> object:
+    return jsonify({"error": str(exc)}), 400
+
+
+@app.errorhandler(ConflictError)
+def _conflict(exc: ConflictError) -> object:
+    return jsonify({"error": str(exc)}), 409
+
+
+def _bulk(collection: str) -> object:
+    action = inventory.BULK_ACTIONS[request.method]
+    rows = inventory.bulk_rows(request.get_data(), request.mimetype)
+    return jsonify(store.transact(lambda view: inventory.bulk(view, collection, action, rows)))
 
 
 @app.route("/")
@@ -62,232 +131,162 @@ def index() -> object:
     return send_from_directory(app.static_folder, "index.html")
 
 
+def _cached_json(
+    name: str, collections: tuple, build: Callable[[], tuple]
+) -> Response:
+    """Serve a JSON body from ``response_cache``, honouring ETags and gzip.
+
+    Responses are cached per ``name`` and query string. ``build`` returns
+    ``(payload, headers)``; it only runs when one of ``collections`` changed
+    since the cached copy was made.
+    """
+    if request.args.get("status") == "overdue":
+        # Depends on the clock as well as the data, so it is never cached.
+        payload, headers = build()
+        response = jsonify(payload)
+        response.headers.update(headers)
+        return response
+    # Versions are read before building, so a concurrent write can only make
+    # the cached body newer than its key, which the next lookup discards.
+    version = tuple(store.collection_versions[name] for name in collections)
+    key = (name, tuple(sorted(request.args.items(multi=True))))
+    cached = response_cache.fetch(key, version, build, _encode)
+    status, body, headers = respond(
+        cached, request.headers.get("If-None-Match"), request.headers.get("Accept-Encoding")
+    )
+    return Response(body, status=status, headers=headers)
+
+
+def _list(collection: str) -> Response:
+    args = request.args
+    return _cached_json(
+        collection,
+        inventory.list_collections(collection, args),
+        lambda: inventory.list_page(store, collection, args),
+    )
+
+
 @app.route("/api/equipment", methods=["GET"])
 def list_equipment() -> object:
-    data = _load_data()
-    return jsonify(data["equipment"])
+    return _list("equipment")
+
+
+@app.route("/api/bootstrap", methods=["GET"])
+def bootstrap() -> object:
+    return _cached_json(
+        "bootstrap",
+        ("equipment", "people"),
+        lambda: (inventory.bootstrap(store, request.args), {}),
+    )
+
+
+@app.route("/api/equipment/<equipment_id>", methods=["GET"])
+def get_equipment(equipment_id: str) -> object:
+    equipment = store.get("equipment", equipment_id)
+    if not equipment:
+        raise inventory.NotFoundError("Equipment not found.")
+    return jsonify(equipment)
+
+
+@app.route("/api/equipment/<equipment_id>/history", methods=["GET"])
+def equipment_history(equipment_id: str) -> object:
+    return jsonify(inventory.checkout_history(store, equipment_id))
+
+
+@app.route("/api/changes", methods=["GET"])
+def changes() -> object:
+    return jsonify(inventory.changes(store, request.args))
+
+
+@app.route("/api/stream", methods=["GET"])
+def stream() -> object:
+    # EventSource sends Last-Event-ID when it reconnects.
+    resume = request.headers.get("Last-Event-ID") or request.args.get("since")
+    since = inventory.parse_version(resume) if resume else store.version
+    return Response(
+        hub.subscribe(since),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/search", methods=["GET"])
+def search() -> object:
+    return jsonify(inventory.search(store, request.args))
+
+
+@app.route("/api/overdue", methods=["GET"])
+def overdue() -> object:
+    return jsonify(inventory.overdue(store, request.args))
 
 
 @app.route("/api/people", methods=["GET"])
 def list_people() -> object:
-    data = _load_data()
-    return jsonify(data["people"])
+    return _list("people")
 
 
 @app.route("/api/equipment", methods=["POST"])
 def create_equipment() -> object:
     payload = request.get_json(force=True)
-    name = payload.get("name", "").strip()
-    if not name:
-        return jsonify({"error": "Equipment name is required."}), 400
-
-    data = _load_data()
-    new_equipment = {
-        "id": str(uuid.uuid4()),
-        "name": name,
-        "tag": payload.get("tag", "").strip(),
-        "description": payload.get("description", "").strip(),
-        "status": "available",
-        "checked_out_to": None,
-        "due_at": None,
-    }
-    data["equipment"].append(new_equipment)
-    _save_data(data)
-    return jsonify(new_equipment), 201
+    return jsonify(store.transact(lambda view: inventory.create_equipment(view, payload))), 201
 
 
 @app.route("/api/people", methods=["POST"])
 def create_person() -> object:
     payload = request.get_json(force=True)
-    name = payload.get("name", "").strip()
-    if not name:
-        return jsonify({"error": "Person name is required."}), 400
-
-    data = _load_data()
-    new_person = {
-        "id": str(uuid.uuid4()),
-        "name": name,
-        "email": payload.get("email", "").strip(),
-        "role": payload.get("role", "").strip(),
-    }
-    data["people"].append(new_person)
-    _save_data(data)
-    return jsonify(new_person), 201
+    return jsonify(store.transact(lambda view: inventory.create_person(view, payload))), 201
 
 
 @app.route("/api/equipment/<equipment_id>", methods=["PUT"])
 def update_equipment(equipment_id: str) -> object:
     payload = request.get_json(force=True)
-    data = _load_data()
-    equipment = _find_by_id(data["equipment"], equipment_id)
-    if not equipment:
-        return jsonify({"error": "Equipment not found."}), 404
-
-    if "name" in payload and not payload["name"].strip():
-        return jsonify({"error": "Equipment name is required."}), 400
-
-    for key in ["name", "tag", "description"]:
-        if key in payload:
-            equipment[key] = payload[key].strip()
-
-    _save_data(data)
-    return jsonify(equipment)
+    return jsonify(
+        store.transact(lambda view: inventory.update_equipment(view, equipment_id, payload))
+    )
 
 
 @app.route("/api/people/<person_id>", methods=["PUT"])
 def update_person(person_id: str) -> object:
     payload = request.get_json(force=True)
-    data = _load_data()
-    person = _find_by_id(data["people"], person_id)
-    if not person:
-        return jsonify({"error": "Person not found."}), 404
-
-    if "name" in payload and not payload["name"].strip():
-        return jsonify({"error": "Person name is required."}), 400
-
-    for key in ["name", "email", "role"]:
-        if key in payload:
-            person[key] = payload[key].strip()
-
-    _save_data(data)
-    return jsonify(person)
+    return jsonify(store.transact(lambda view: inventory.update_person(view, person_id, payload)))
 
 
 @app.route("/api/equipment/<equipment_id>", methods=["DELETE"])
 def delete_equipment(equipment_id: str) -> object:
-    data = _load_data()
-    equipment = _find_by_id(data["equipment"], equipment_id)
-    if not equipment:
-        return jsonify({"error": "Equipment not found."}), 404
-    if equipment["status"] == "checked_out":
-        return jsonify({"error": "Cannot delete checked-out equipment."}), 400
-
-    data["equipment"] = [item for item in data["equipment"] if item["id"] != equipment_id]
-    _save_data(data)
-    return jsonify({"status": "deleted"})
+    return jsonify(store.transact(lambda view: inventory.delete_equipment(view, equipment_id)))
 
 
 @app.route("/api/people/<person_id>", methods=["DELETE"])
 def delete_person(person_id: str) -> object:
-    data = _load_data()
-    person = _find_by_id(data["people"], person_id)
-    if not person:
-        return jsonify({"error": "Person not found."}), 404
+    return jsonify(store.transact(lambda view: inventory.delete_person(view, person_id)))
 
-    checked_out = [
-        equipment
-        for equipment in data["equipment"]
-        if equipment["checked_out_to"] == person_id
-    ]
-    if checked_out:
-        return jsonify({"error": "Person currently has equipment checked out."}), 400
 
-    data["people"] = [item for item in data["people"] if item["id"] != person_id]
-    _save_data(data)
-    return jsonify({"status": "deleted"})
+@app.route("/api/equipment/bulk", methods=["POST", "PUT", "DELETE"])
+def bulk_equipment() -> object:
+    return _bulk("equipment")
+
+
+@app.route("/api/people/bulk", methods=["POST", "PUT", "DELETE"])
+def bulk_people() -> object:
+    return _bulk("people")
 
 
 @app.route("/api/checkout", methods=["POST"])
 def checkout_equipment() -> object:
     payload = request.get_json(force=True)
-    equipment_id = payload.get("equipment_id")
-    person_id = payload.get("person_id")
-
-    data = _load_data()
-    equipment = _find_by_id(data["equipment"], equipment_id)
-    person = _find_by_id(data["people"], person_id)
-
-    if not equipment:
-        return jsonify({"error": "Equipment not found."}), 404
-    if not person:
-        return jsonify({"error": "Person not found."}), 404
-    if equipment["status"] == "checked_out":
-        return jsonify({"error": "Equipment already checked out."}), 400
-
-    checkout_record = {
-        "id": str(uuid.uuid4()),
-        "equipment_id": equipment_id,
-        "person_id": person_id,
-        "checked_out_at": _now_iso(),
-        "due_at": _due_iso(),
-        "checked_in_at": None,
-        "handoff": False,
-    }
-
-    equipment["status"] = "checked_out"
-    equipment["checked_out_to"] = person_id
-    equipment["due_at"] = checkout_record["due_at"]
-
-    data["checkouts"].append(checkout_record)
-    _save_data(data)
-    return jsonify(checkout_record), 201
+    return jsonify(store.transact(lambda view: inventory.checkout(view, payload))), 201
 
 
 @app.route("/api/checkin", methods=["POST"])
 def checkin_equipment() -> object:
     payload = request.get_json(force=True)
-    equipment_id = payload.get("equipment_id")
-
-    data = _load_data()
-    equipment = _find_by_id(data["equipment"], equipment_id)
-    if not equipment:
-        return jsonify({"error": "Equipment not found."}), 404
-    if equipment["status"] != "checked_out":
-        return jsonify({"error": "Equipment is not checked out."}), 400
-
-    checkout_record = _active_checkout(data, equipment_id)
-    if not checkout_record:
-        return jsonify({"error": "Active checkout not found."}), 400
-
-    checkout_record["checked_in_at"] = _now_iso()
-    equipment["status"] = "available"
-    equipment["checked_out_to"] = None
-    equipment["due_at"] = None
-
-    _save_data(data)
-    return jsonify({"status": "checked_in"})
+    return jsonify(store.transact(lambda view: inventory.checkin(view, payload)))
 
 
 @app.route("/api/transfer", methods=["POST"])
 def transfer_equipment() -> object:
     payload = request.get_json(force=True)
-    equipment_id = payload.get("equipment_id")
-    person_id = payload.get("person_id")
-
-    data = _load_data()
-    equipment = _find_by_id(data["equipment"], equipment_id)
-    person = _find_by_id(data["people"], person_id)
-    if not equipment:
-        return jsonify({"error": "Equipment not found."}), 404
-    if not person:
-        return jsonify({"error": "Person not found."}), 404
-    if equipment["status"] != "checked_out":
-        return jsonify({"error": "Equipment is not checked out."}), 400
-
-    checkout_record = _active_checkout(data, equipment_id)
-    if not checkout_record:
-        return jsonify({"error": "Active checkout not found."}), 400
-
-    checkout_record["checked_in_at"] = _now_iso()
-    checkout_record["handoff"] = True
-
-    new_checkout = {
-        "id": str(uuid.uuid4()),
-        "equipment_id": equipment_id,
-        "person_id": person_id,
-        "checked_out_at": _now_iso(),
-        "due_at": _due_iso(),
-        "checked_in_at": None,
-        "handoff": True,
-        "handoff_from": checkout_record["person_id"],
-    }
-
-    equipment["checked_out_to"] = person_id
-    equipment["due_at"] = new_checkout["due_at"]
-
-    data["checkouts"].append(new_checkout)
-    _save_data(data)
-    return jsonify(new_checkout), 201
+    return jsonify(store.transact(lambda view: inventory.transfer(view, payload))), 201
 
 
 if __name__ == "__main__":
@@ -0,0 +1,403 @@
+"""ASGI server for the ``/api`` routes with a single writer.
+
+Reads are answered on the event loop straight from the in-memory
+``DataStore``. Every mutation is handed to ``writer.Writer``, which applies
+them one batch at a time in arrival order and persists them from a thread,
+so a slow disk never stalls readers and concurrent checkouts of one item
+are decided strictly first come, first served.
+
+Run it in a single process (``python asgi.py``, or any ASGI server with one
+worker): the writer orders writes within its own process only. Writes made
+elsewhere, such as by ``cli.py``, are picked up before the next batch or
+within ``writer.POLL_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qsl
+
+import codec
+import inventory
+from cache import ResponseCache, respond
+from config import Settings
+from datastore import DataStore
+from events import HEARTBEAT_SECONDS, frame
+from storage import ConflictError, open_storage
+from writer import Writer
+
+settings = Settings.from_env()
+backend = open_storage(
+    settings.data_file, durability=settings.durability, pretty_json=settings.pretty_json
+)
+store = DataStore(backend)
+writer = Writer(store)
+response_cache = ResponseCache()
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    # First value of each query parameter, like ``request.args.get`` in Flask.
+    args: Dict[str, str]
+    query: Tuple[Tuple[str, str], ...]
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+class Response(NamedTuple):
+    status: int
+    body: Union[bytes, AsyncIterator[bytes]]
+    headers: Dict[str, str]
+
+
+Handler = Callable[..., Awaitable[Response]]
+ROUTES: List[Tuple[Pattern[str], Tuple[str, ...], Handler]] = []
+
+
+def route(path: str, methods: Tuple[str, ...] = ("GET",)) -> Callable[[Handler], Handler]:
+    """Register a handler; ``<name>`` segments are passed to it as keyword arguments."""
+    pattern = re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", path) + "$")
+
+    def register(handler: Handler) -> Handler:
+        ROUTES.append((pattern, methods, handler))
+        # Fixed paths win over placeholders, as in Flask.
+        ROUTES.sort(key=lambda entry: entry[0].groups)
+        return handler
+
+    return register
+
+
+def _json(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(
+        status, codec.dumps(payload), {"Content-Type": "application/json", **(headers or {})}
+    )
+
+
+def _cached_json(
+    request: Request, name: str, collections: tuple, build: Callable[[], tuple]
+) -> Response:
+    """Serve a JSON body from ``response_cache``, honouring ETags and gzip (see ``app.py``)."""
+    if request.args.get("status") == "overdue":
+        # Depends on the clock as well as the data, so it is never cached.
+        payload, headers = build()
+        return _json(payload, headers=headers)
+    version = tuple(store.collection_versions[name] for name in collections)
+    key = (name, tuple(sorted(request.query)))
+    cached = response_cache.fetch(key, version, build, codec.dumps)
+    if_none_match = request.headers.get("if-none-match")
+    return Response(*respond(cached, if_none_match, request.headers.get("accept-encoding")))
+
+
+def _list(request: Request, collection: str) -> Response:
+    return _cached_json(
+        request,
+        collection,
+        inventory.list_collections(collection, request.args),
+        lambda: inventory.list_page(store, collection, request.args),
+    )
+
+
+def _payload(request: Request) -> Any:
+    try:
+        return codec.loads(request.body)
+    except ValueError:
+        raise inventory.ValidationError("Request body must be JSON.") from None
+
+
+async def _bulk(request: Request, collection: str) -> Response:
+    action = inventory.BULK_ACTIONS[request.method]
+    rows = inventory.bulk_rows(request.body, request.mimetype)
+    return _json(
+        await writer.submit(lambda view: inventory.bulk(view, collection, action, rows))
+    )
+
+
+async def _events(since: int) -> AsyncIterator[bytes]:
+    yield b"retry: 3000\n\n"
+    version = since
+    while True:
+        if version == store.version and not await writer.wait(version, HEARTBEAT_SECONDS):
+            yield b": keepalive\n\n"
+            continue
+        delta = inventory.delta(store, version)
+        if delta["version"] == version:
+            continue
+        version = delta["version"]
+        yield frame(delta).encode("utf-8")
+
+
+@route("/api/equipment")
+async def list_equipment(request: Request) -> Response:
+    return _list(request, "equipment")
+
+
+@route("/api/bootstrap")
+async def bootstrap(request: Request) -> Response:
+    return _cached_json(
+        request,
+        "bootstrap",
+        ("equipment", "people"),
+        lambda: (inventory.bootstrap(store, request.args), {}),
+    )
+
+
+@route("/api/equipment/<equipment_id>")
+async def get_equipment(request: Request, equipment_id: str) -> Response:
+    equipment = store.get("equipment", equipment_id)
+    if not equipment:
+        raise inventory.NotFoundError("Equipment not found.")
+    return _json(equipment)
+
+
+@route("/api/equipment/<equipment_id>/history")
+async def equipment_history(request: Request, equipment_id: str) -> Response:
+    # Closed checkouts are read from the backend, so off the loop.
+    history = await asyncio.to_thread(inventory.checkout_history, store, equipment_id)
+    return _json(history)
+
+
+@route("/api/changes")
+async def changes(request: Request) -> Response:
+    return _json(inventory.changes(store, request.args))
+
+
+@route("/api/stream")
+async def stream(request: Request) -> Response:
+    # EventSource sends Last-Event-ID when it reconnects.
+    resume = request.headers.get("last-event-id") or request.args.get("since")
+    since = inventory.parse_version(resume) if resume else store.version
+    return Response(
+        200,
+        _events(since),
+        {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@route("/api/search")
+async def search(request: Request) -> Response:
+    return _json(inventory.search(store, request.args))
+
+
+@route("/api/overdue")
+async def overdue(request: Request) -> Response:
+    return _json(inventory.overdue(store, request.args))
+
+
+@route("/api/people")
+async def list_people(request: Request) -> Response:
+    return _list(request, "people")
+
+
+@route("/api/equipment", methods=("POST",))
+async def create_equipment(request: Request) -> Response:
+    payload = _payload(request)
+    return _json(
+        await writer.submit(lambda view: inventory.create_equipment(view, payload)), 201
+    )
+
+
+@route("/api/people", methods=("POST",))
+async def create_person(request: Request) -> Response:
+    payload = _payload(request)
+    return _json(await writer.submit(lambda view: inventory.create_person(view, payload)), 201)
+
+
+@route("/api/equipment/<equipment_id>", methods=("PUT",))
+async def update_equipment(request: Request, equipment_id: str) -> Response:
+    payload = _payload(request)
+    return _json(
+        await writer.submit(
+            lambda view: inventory.update_equipment(view, equipment_id, payload)
+        )
+    )
+
+
+@route("/api/people/<person_id>", methods=("PUT",))
+async def update_person(request: Request, person_id: str) -> Response:
+    payload = _payload(request)
+    return _json(
+        await writer.submit(lambda view: inventory.update_person(view, person_id, payload))
+    )
+
+
+@route("/api/equipment/<equipment_id>", methods=("DELETE",))
+async def delete_equipment(request: Request, equipment_id: str) -> Response:
+    return _json(
+        await writer.submit(lambda view: inventory.delete_equipment(view, equipment_id))
+    )
+
+
+@route("/api/people/<person_id>", methods=("DELETE",))
+async def delete_person(request: Request, person_id: str) -> Response:
+    return _json(await writer.submit(lambda view: inventory.delete_person(view, person_id)))
+
+
+@route("/api/equipment/bulk", methods=("POST", "PUT", "DELETE"))
+async def bulk_equipment(request: Request) -> Response:
+    return await _bulk(request, "equipment")
+
+
+@route("/api/people/bulk", methods=("POST", "PUT", "DELETE"))
+async def bulk_people(request: Request) -> Response:
+    return await _bulk(request, "people")
+
+
+@route("/api/checkout", methods=("POST",))
+async def checkout_equipment(request: Request) -> Response:
+    payload = _payload(request)
+    return _json(await writer.submit(lambda view: inventory.checkout(view, payload)), 201)
+
+
+@route("/api/checkin", methods=("POST",))
+async def checkin_equipment(request: Request) -> Response:
+    payload = _payload(request)
+    return _json(await writer.submit(lambda view: inventory.checkin(view, payload)))
+
+
+@route("/api/transfer", methods=("POST",))
+async def transfer_equipment(request: Request) -> Response:
+    payload = _payload(request)
+    return _json(await writer.submit(lambda view: inventory.transfer(view, payload)), 201)
+
+
+async def _dispatch(request: Request) -> Response:
+    method = "GET" if request.method == "HEAD" else request.method
+    allowed: List[str] = []
+    for pattern, methods, handler in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        if method not in methods:
+            allowed.extend(methods)
+            continue
+        try:
+            return await handler(request, **match.groupdict())
+        except inventory.NotFoundError as exc:
+            return _json({"error": str(exc)}, 404)
+        except inventory.ValidationError as exc:
+            return _json({"error": str(exc)}, 400)
+        except ConflictError as exc:
+            return _json({"error": str(exc)}, 409)
+    if allowed:
+        return _json({"error": "Method not allowed."}, 405, {"Allow": ", ".join(allowed)})
+    return _json({"error": "Not found."}, 404)
+
+
+async def _read_request(scope: Dict[str, Any], receive: Callable[[], Awaitable[dict]]) -> Request:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    query = tuple(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+    args: Dict[str, str] = {}
+    for name, value in query:
+        args.setdefault(name, value)
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    return Request(scope["method"], scope["path"], args, query, headers, b"".join(chunks))
+
+
+async def _disconnected(receive: Callable[[], Awaitable[dict]]) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send(
+    response: Response,
+    head_only: bool,
+    receive: Callable[[], Awaitable[dict]],
+    send: Callable[[dict], Awaitable[None]],
+) -> None:
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in response.headers.items()
+    ]
+    if isinstance(response.body, bytes):
+        headers.append((b"content-length", str(len(response.body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    if isinstance(response.body, bytes):
+        await send({"type": "http.response.body", "body": b"" if head_only else response.body})
+        return
+
+    async def pump(chunks: AsyncIterator[bytes]) -> None:
+        async for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    # Streams run until the client goes away.
+    streaming = asyncio.ensure_future(pump(response.body))
+    watching = asyncio.ensure_future(_disconnected(receive))
+    done, pending = await asyncio.wait(
+        {streaming, watching}, return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if streaming in done:
+        streaming.result()
+
+
+async def _lifespan(
+    receive: Callable[[], Awaitable[dict]], send: Callable[[dict], Awaitable[None]]
+) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            writer.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await writer.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(
+    scope: Dict[str, Any],
+    receive: Callable[[], Awaitable[dict]],
+    send: Callable[[dict], Awaitable[None]],
+) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    request = await _read_request(scope, receive)
+    try:
+        response = await _dispatch(request)
+    except Exception:
+        await _send(_json({"error": "Internal server error."}, 500), False, receive, send)
+        # Re-raised so the server logs it.
+        raise
+    await _send(response, request.method == "HEAD", receive, send)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving the ASGI app needs uvicorn: pip install uvicorn") from None
+    # One worker: the writer only orders the writes of its own process.
+    uvicorn.run(app, host="0.0.0.0", port=8000, workers=1, log_level="warning")
@@ -0,0 +1,78 @@
+"""Compare JSON codecs on snapshot save/load time and file size.
+
+    python -m benchmarks.codec --equipment 20000 --people 2000 --checkouts 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import codec
+from benchmarks.dataset import generate
+from journal import read_snapshot, write_snapshot
+
+
+def _median_seconds(action: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run(data: Dict[str, Any], repeat: int) -> List[Dict[str, Any]]:
+    """Save and load ``data`` with every available codec, compact and pretty."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.json")
+        for name, candidate in codec.available().items():
+            for pretty in (False, True):
+                codec.active = candidate
+                save = _median_seconds(lambda: write_snapshot(path, data, pretty=pretty), repeat)
+                load = _median_seconds(lambda: read_snapshot(path), repeat)
+                results.append(
+                    {
+                        "codec": name,
+                        "layout": "pretty" if pretty else "compact",
+                        "save_ms": round(save * 1000, 1),
+                        "load_ms": round(load * 1000, 1),
+                        "bytes": os.path.getsize(path),
+                    }
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--equipment", type=int, default=10000)
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--checkouts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    default = codec.active
+    try:
+        results = run(generate(args.equipment, args.people, args.checkouts), args.repeat)
+    finally:
+        codec.active = default
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'codec':<8} {'layout':<8} {'save ms':>9} {'load ms':>9} {'MB':>8}")
+    for row in results:
+        print(
+            f"{row['codec']:<8} {row['layout']:<8} {row['save_ms']:>9} {row['load_ms']:>9} "
+            f"{row['bytes'] / 1e6:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
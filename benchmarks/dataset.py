@@ -0,0 +1,93 @@
+"""Deterministic synthetic datasets for benchmarks."""
+
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+EPOCH = datetime(2024, 1, 1)
+
+
+def _iso(moment: datetime) -> str:
+    # Same form as the timestamps ``inventory`` writes.
+    return moment.isoformat(timespec="seconds") + "Z"
+
+
+def generate(
+    equipment: int,
+    people: int,
+    checkouts: int,
+    seed: int = 0,
+    active: float = 0.0,
+    overdue: float = 0.0,
+    now: Optional[datetime] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Build a dataset document with closed checkouts spread over the year before ``now``.
+
+    ``active`` is the fraction of equipment currently checked out and
+    ``overdue`` the fraction that is checked out and past due, so it cannot
+    exceed ``active``. ``now`` (naive UTC) defaults to a year after ``EPOCH``;
+    pass the current time for the overdue items to be overdue by the clock.
+    The same arguments always give the same records.
+    """
+    if not 0 <= overdue <= active <= 1:
+        raise ValueError("Expected 0 <= overdue <= active <= 1")
+    now = now or EPOCH + timedelta(days=365)
+    start = now - timedelta(days=365)
+    rng = random.Random(seed)
+    person_records = [
+        {
+            "id": f"person-{index:07d}",
+            "name": f"Person {index}",
+            "email": f"person{index}@example.org",
+            "role": rng.choice(("staff", "student", "faculty")),
+        }
+        for index in range(people)
+    ]
+    equipment_records = [
+        {
+            "id": f"equipment-{index:07d}",
+            "name": f"{rng.choice(('Camera', 'Tripod', 'Laptop', 'Projector'))} {index}",
+            "tag": f"T-{index:07d}",
+            "description": "Synthetic benchmark item",
+            "status": "available",
+            "checked_out_to": None,
+            "due_at": None,
+        }
+        for index in range(equipment)
+    ]
+    checkout_records = []
+    for index in range(checkouts if equipment and people else 0):
+        checked_out = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        checkout_records.append(
+            {
+                "id": f"checkout-{index:08d}",
+                "equipment_id": equipment_records[rng.randrange(equipment)]["id"],
+                "person_id": person_records[rng.randrange(people)]["id"],
+                "checked_out_at": _iso(checked_out),
+                "due_at": _iso(checked_out + timedelta(days=1)),
+                "checked_in_at": _iso(checked_out + timedelta(hours=rng.randrange(1, 48))),
+                "handoff": False,
+            }
+        )
+    borrowed = rng.sample(equipment_records, round(equipment * active)) if people else []
+    overdue_count = round(equipment * overdue)
+    for index, item in enumerate(borrowed):
+        if index < overdue_count:
+            checked_out = now - timedelta(days=rng.randrange(2, 15))
+        else:
+            checked_out = now - timedelta(minutes=rng.randrange(12 * 60))
+        person = person_records[rng.randrange(people)]
+        record = {
+            "id": f"checkout-{checkouts + index:08d}",
+            "equipment_id": item["id"],
+            "person_id": person["id"],
+            "checked_out_at": _iso(checked_out),
+            "due_at": _iso(checked_out + timedelta(days=1)),
+            "checked_in_at": None,
+            "handoff": False,
+        }
+        item.update(status="checked_out", checked_out_to=person["id"], due_at=record["due_at"])
+        checkout_records.append(record)
+    return {"equipment": equipment_records, "people": person_records, "checkouts": checkout_records}
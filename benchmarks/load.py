@@ -0,0 +1,460 @@
+"""Closed-loop load test: concurrent simulated desks driving the API on localhost.
+
+    python -m benchmarks.load --clients 20 --duration 30
+    python -m benchmarks.load --prepare --data-file /tmp/load.json
+    EQUIPMENT_ELLIE_DATA=/tmp/load.json python app.py
+    python -m benchmarks.load --url http://127.0.0.1:5000 --data-file /tmp/load.json
+
+Each desk sends one request at a time and picks the next from ``--mix`` as
+soon as the answer arrives (plus ``--think-ms``). Without ``--url`` a
+generated dataset is served in-process on a free local port; the desks then
+share the interpreter with the server, so use ``--url`` for numbers that
+compare across machines.
+
+Afterwards the data is checked for invariant violations: an item with two
+active checkouts, status and borrower fields that disagree with the active
+checkout, and items whose successful checkouts and check-ins do not add up
+to what the server reports. Active checkouts are read from ``--data-file``
+when there is one. The exit status is 1 if anything turned up.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from benchmarks.dataset import generate
+from benchmarks.suite import summarize
+from storage import is_history, open_storage
+
+OPERATIONS = ("list", "search", "checkout", "checkin", "transfer", "create")
+DEFAULT_MIX = "list=35,search=20,checkout=15,checkin=15,transfer=5,create=10"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Answers a desk can expect under contention, e.g. an item someone else just took.
+REJECTED_STATUSES = (400, 409)
+# Error messages kept per operation.
+MAX_ERROR_SAMPLES = 5
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """Parse ``op=weight`` pairs separated by commas."""
+    mix = {}
+    for pair in text.split(","):
+        name, sep, weight = pair.strip().partition("=")
+        if not sep or name not in OPERATIONS or not weight.isdigit():
+            raise ValueError(
+                f"Invalid mix entry '{pair}'; expected OP=WEIGHT with OP one of "
+                f"{', '.join(OPERATIONS)}"
+            )
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+@dataclass
+class OperationStats:
+    timings: List[float] = field(default_factory=list)
+    rejected: int = 0
+    errors: int = 0
+    error_samples: List[str] = field(default_factory=list)
+
+    def merge(self, other: "OperationStats") -> None:
+        self.timings.extend(other.timings)
+        self.rejected += other.rejected
+        self.errors += other.errors
+        room = MAX_ERROR_SAMPLES - len(self.error_samples)
+        self.error_samples.extend(other.error_samples[:room])
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        histogram = Counter(
+            next((f"<={bound}ms" for bound in BUCKETS_MS if timing * 1000 <= bound), "slower")
+            for timing in self.timings
+        )
+        result: Dict[str, Any] = {"requests": len(self.timings)}
+        if self.timings:
+            result.update(summarize(self.timings))
+            del result["iterations"], result["ops_per_s"]
+        result["per_s"] = round(len(self.timings) / seconds, 1)
+        result.update(rejected=self.rejected, errors=self.errors)
+        labels = [f"<={bound}ms" for bound in BUCKETS_MS] + ["slower"]
+        result["histogram"] = {label: histogram[label] for label in labels if histogram[label]}
+        if self.error_samples:
+            result["error_samples"] = self.error_samples
+        return result
+
+
+class Desk(threading.Thread):
+    """One simulated front desk sending requests back to back."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        mix: Dict[str, int],
+        equipment: List[str],
+        people: List[str],
+        deadline: float,
+        think: float,
+        seed: int,
+    ) -> None:
+        super().__init__(name=f"desk-{seed}", daemon=True)
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.equipment = list(equipment)
+        self.people = people
+        self.deadline = deadline
+        self.think = think
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, OperationStats] = defaultdict(OperationStats)
+        # Successful checkouts minus check-ins per item, to compare with the end state.
+        self.loans: Counter = Counter()
+        self.on_loan: List[str] = []
+
+    def run(self) -> None:
+        try:
+            while time.monotonic() < self.deadline:
+                operation = self.rng.choices(self.operations, self.weights)[0]
+                getattr(self, f"_{operation}")()
+                if self.think:
+                    time.sleep(self.rng.uniform(0, 2 * self.think))
+        finally:
+            self.connection.close()
+
+    def _list(self) -> None:
+        sort = self.rng.choice(("created", "name", "-name", "status"))
+        self._call("list", "GET", f"/api/equipment?limit=50&sort={sort}")
+
+    def _search(self) -> None:
+        terms = ("camera", "tripod", "laptop", "person", str(self.rng.randrange(100)))
+        term = self.rng.choice(terms)
+        self._call("search", "GET", f"/api/search?q={quote(term)}")
+
+    def _checkout(self) -> None:
+        equipment_id = self.rng.choice(self.equipment)
+        payload = {"equipment_id": equipment_id, "person_id": self.rng.choice(self.people)}
+        if self._call("checkout", "POST", "/api/checkout", payload) is not None:
+            self.loans[equipment_id] += 1
+            self.on_loan.append(equipment_id)
+
+    def _checkin(self) -> None:
+        equipment_id = self._borrowed(release=True)
+        payload = {"equipment_id": equipment_id}
+        if self._call("checkin", "POST", "/api/checkin", payload) is not None:
+            self.loans[equipment_id] -= 1
+
+    def _transfer(self) -> None:
+        equipment_id = self._borrowed(release=False)
+        payload = {"equipment_id": equipment_id, "person_id": self.rng.choice(self.people)}
+        self._call("transfer", "POST", "/api/transfer", payload)
+
+    def _create(self) -> None:
+        suffix = f"{self.name}-{self.rng.getrandbits(48):012x}"
+        payload = {"name": f"Load item {suffix}", "tag": f"L-{suffix}"}
+        created = self._call("create", "POST", "/api/equipment", payload)
+        if created is not None:
+            self.equipment.append(created["id"])
+
+    def _borrowed(self, release: bool) -> str:
+        """Mostly an item this desk lent out; sometimes any item, as a confused desk would."""
+        if self.on_loan and self.rng.random() < 0.9:
+            index = self.rng.randrange(len(self.on_loan))
+            return self.on_loan.pop(index) if release else self.on_loan[index]
+        return self.rng.choice(self.equipment)
+
+    def _call(
+        self, operation: str, method: str, path: str, payload: Any = None
+    ) -> Optional[Any]:
+        """Send one request; return the decoded body if it succeeded."""
+        stats = self.stats[operation]
+        body = None if payload is None else json.dumps(payload)
+        headers = {"Content-Type": "application/json"} if body else {}
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            self.connection.close()
+            self._error(stats, f"{method} {path}: {exc!r}")
+            return None
+        stats.timings.append(time.perf_counter() - start)
+        if response.status < 300:
+            return json.loads(data) if data else {}
+        if response.status in REJECTED_STATUSES:
+            stats.rejected += 1
+        else:
+            self._error(stats, f"{method} {path}: {response.status} {data[:200]!r}")
+        return None
+
+    @staticmethod
+    def _error(stats: OperationStats, message: str) -> None:
+        stats.errors += 1
+        if len(stats.error_samples) < MAX_ERROR_SAMPLES:
+            stats.error_samples.append(message)
+
+
+def find_violations(
+    equipment: List[Dict[str, Any]],
+    checkouts: Optional[List[Dict[str, Any]]],
+    people: List[Dict[str, Any]],
+    was_on_loan: Dict[str, bool],
+    loans: Counter,
+) -> List[str]:
+    """Return a description of every broken invariant in the end state.
+
+    ``checkouts`` may be ``None`` when the stored data cannot be read, which
+    skips the checks that need active checkouts. ``was_on_loan`` holds each
+    item's state before the run and ``loans`` the net successful checkouts.
+    """
+    violations = []
+    items = {item["id"]: item for item in equipment}
+    if checkouts is not None:
+        person_ids = {person["id"] for person in people}
+        active: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for checkout in checkouts:
+            if not is_history("checkouts", checkout):
+                active[checkout["equipment_id"]].append(checkout)
+        for equipment_id, open_checkouts in active.items():
+            if len(open_checkouts) > 1:
+                violations.append(
+                    f"{equipment_id} has {len(open_checkouts)} active checkouts"
+                )
+            if equipment_id not in items:
+                violations.append(f"Active checkout of missing equipment {equipment_id}")
+            for checkout in open_checkouts:
+                if checkout["person_id"] not in person_ids:
+                    violations.append(
+                        f"Checkout {checkout['id']} is held by missing person "
+                        f"{checkout['person_id']}"
+                    )
+        for equipment_id, item in items.items():
+            open_checkouts = active.get(equipment_id, [])
+            if item["status"] == "checked_out" and not open_checkouts:
+                violations.append(f"{equipment_id} is checked out without an active checkout")
+            elif item["status"] != "checked_out" and open_checkouts:
+                violations.append(f"{equipment_id} is {item['status']} with an active checkout")
+            elif open_checkouts and item.get("checked_out_to") != open_checkouts[0]["person_id"]:
+                violations.append(
+                    f"{equipment_id} is checked out to {item.get('checked_out_to')} but its "
+                    f"active checkout belongs to {open_checkouts[0]['person_id']}"
+                )
+    for equipment_id, net in loans.items():
+        expected = was_on_loan.get(equipment_id, False) + net
+        item = items.get(equipment_id)
+        if expected not in (0, 1):
+            violations.append(
+                f"{equipment_id} was lent {net:+d} times on balance; at most one loan may be open"
+            )
+        elif item is not None and (item["status"] == "checked_out") != bool(expected):
+            violations.append(
+                f"{equipment_id} is {item['status']} but the answers the desks got say "
+                f"{'checked_out' if expected else 'available'}"
+            )
+    return violations
+
+
+def _fetch(host: str, port: int, path: str) -> Any:
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"GET {path} returned {response.status}")
+    return json.loads(data)
+
+
+def prepare(data_file: str, equipment: int, people: int, checkouts: int, seed: int) -> None:
+    """Write a generated dataset with 30% of the equipment on loan and 5% overdue."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    data = generate(equipment, people, checkouts, seed=seed, active=0.3, overdue=0.05, now=now)
+    store = open_storage(data_file)
+    try:
+        store.save(data)
+    finally:
+        store.close()
+
+
+def _serve(data_file: str) -> Tuple[Any, threading.Thread]:
+    """Serve the app on a free localhost port; return the server and its thread."""
+    from werkzeug.serving import make_server
+
+    os.environ["EQUIPMENT_ELLIE_DATA"] = data_file
+    import app as web
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, web.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="load-server", daemon=True)
+    thread.start()
+    return server, thread
+
+
+def run(
+    host: str,
+    port: int,
+    clients: int,
+    duration: float,
+    mix: Dict[str, int],
+    think: float,
+    seed: int,
+    data_file: Optional[str],
+) -> Dict[str, Any]:
+    """Drive the server at ``host:port`` and return the report."""
+    equipment = _fetch(host, port, "/api/equipment")
+    people = [person["id"] for person in _fetch(host, port, "/api/people")]
+    if not equipment or not people:
+        raise RuntimeError("The server needs some equipment and people to lend out")
+    was_on_loan = {item["id"]: item["status"] == "checked_out" for item in equipment}
+    ids = list(was_on_loan)
+
+    deadline = time.monotonic() + duration
+    desks = [
+        Desk(host, port, mix, ids, people, deadline, think, seed + number)
+        for number in range(clients)
+    ]
+    started = time.monotonic()
+    for desk in desks:
+        desk.start()
+    for desk in desks:
+        desk.join()
+    elapsed = time.monotonic() - started
+
+    stats: Dict[str, OperationStats] = defaultdict(OperationStats)
+    loans: Counter = Counter()
+    for desk in desks:
+        for operation, desk_stats in desk.stats.items():
+            stats[operation].merge(desk_stats)
+        loans.update(desk.loans)
+    total = OperationStats()
+    for operation_stats in stats.values():
+        total.merge(operation_stats)
+
+    checkouts = None
+    if data_file:
+        store = open_storage(data_file)
+        try:
+            checkouts = store.load().get("checkouts", [])
+        finally:
+            store.close()
+    violations = find_violations(
+        _fetch(host, port, "/api/equipment"),
+        checkouts,
+        _fetch(host, port, "/api/people"),
+        was_on_loan,
+        loans,
+    )
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 1),
+        "mix": mix,
+        "operations": {name: stats[name].report(elapsed) for name in OPERATIONS if name in stats},
+        "total": total.report(elapsed),
+        "checked_checkouts": checkouts is not None,
+        "violations": violations,
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['clients']} desks for {report['seconds']} s")
+    print(
+        f"{'operation':<10} {'requests':>9} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'rejected':>9} {'errors':>7}"
+    )
+    rows = list(report["operations"].items()) + [("total", report["total"])]
+    for name, row in rows:
+        print(
+            f"{name:<10} {row['requests']:>9} {row['per_s']:>8} {row.get('p50_ms', '-'):>9} "
+            f"{row.get('p95_ms', '-'):>9} {row.get('p99_ms', '-'):>9} {row['rejected']:>9} "
+            f"{row['errors']:>7}"
+        )
+    print("latency histogram (all requests):")
+    for label, count in report["total"]["histogram"].items():
+        print(f"  {label:>9} {count:>9}")
+    for name, row in report["operations"].items():
+        for sample in row.get("error_samples", ()):
+            print(f"error ({name}): {sample}")
+    if not report["checked_checkouts"]:
+        print("active checkouts not checked; pass --data-file to read them")
+    for violation in report["violations"]:
+        print(f"VIOLATION: {violation}")
+    if not report["violations"]:
+        print("no invariant violations")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Running server, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--data-file", help="The server's data file (written by --prepare)")
+    parser.add_argument("--prepare", action="store_true", help="Write a dataset and exit")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Default {DEFAULT_MIX}")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause per desk")
+    parser.add_argument("--equipment", type=int, default=2000)
+    parser.add_argument("--people", type=int, default=200)
+    parser.add_argument("--checkouts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if args.prepare:
+        if not args.data_file:
+            parser.error("--prepare needs --data-file")
+        prepare(args.data_file, args.equipment, args.people, args.checkouts, args.seed)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if args.url:
+            url = urlsplit(args.url)
+            if url.scheme != "http" or url.hostname not in LOCAL_HOSTS:
+                parser.error("--url must be a plain http:// URL on localhost")
+            host, port, data_file = url.hostname, url.port or 80, args.data_file
+        else:
+            data_file = args.data_file or os.path.join(directory, "load.json")
+            if not args.data_file:
+                prepare(data_file, args.equipment, args.people, args.checkouts, args.seed)
+            server, _ = _serve(data_file)
+            host, port = "127.0.0.1", server.server_port
+        try:
+            report = run(
+                host, port, args.clients, args.duration, mix, args.think_ms / 1000, args.seed,
+                data_file,
+            )
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    if report["violations"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""Latency and throughput of the API, the services and storage as data grows.
+
+    python -m benchmarks.suite --scales 1k,10k,100k,1M --json > results.json
+    python -m benchmarks.suite --scales 1k,10k --baseline results.json
+
+A scale is the number of historical checkouts; equipment and people are a
+tenth and a hundredth of it, with ``--active``/``--overdue`` of the equipment
+checked out. Every case reports p50/p95/p99 latency and throughput. With
+``--baseline`` cases whose p50 grew by more than ``--tolerance`` are listed
+and the exit status is 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from itertools import cycle
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import codec
+from benchmarks.dataset import generate
+from cache import ResponseCache
+from datastore import DataStore
+from equipment_ellie import (
+    Checkout,
+    CheckoutRepository,
+    Equipment,
+    EquipmentStatus,
+    checkin_equipment,
+    checkout_equipment,
+)
+from equipment_service import EquipmentService
+from events import EventHub
+from people_service import PeopleService
+from storage import JsonStore, is_history
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# Rows per request in the bulk endpoint cases.
+BULK_ROWS = 100
+
+Result = Dict[str, Any]
+
+
+def summarize(timings: List[float]) -> Dict[str, Any]:
+    """Return the iteration count, nearest-rank percentiles in ms and operations per second."""
+    ordered = sorted(timings)
+
+    def percentile(fraction: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+        return round(ordered[index] * 1000, 3)
+
+    total = sum(timings)
+    return {
+        "iterations": len(timings),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "ops_per_s": round(len(timings) / total, 1) if total else None,
+    }
+
+
+class Runner:
+    """Times cases and collects their results for one scale."""
+
+    def __init__(self, scale: str, iterations: int, budget: float) -> None:
+        self.scale = scale
+        self.iterations = iterations
+        self.budget = budget
+        self.results: List[Result] = []
+
+    def measure(
+        self,
+        group: str,
+        name: str,
+        action: Callable[[Any], Any],
+        args: Optional[Iterable[Any]] = None,
+    ) -> None:
+        """Run ``action`` once per item of ``args`` (``iterations`` times by default).
+
+        Stops early once ``budget`` seconds have been spent, after at least one run.
+        """
+        timings: List[float] = []
+        deadline = time.perf_counter() + self.budget
+        for count, arg in enumerate(range(self.iterations) if args is None else args):
+            if count >= self.iterations or (timings and time.perf_counter() > deadline):
+                break
+            start = time.perf_counter()
+            action(arg)
+            timings.append(time.perf_counter() - start)
+        if not timings:
+            return
+        result = {"scale": self.scale, "group": group, "name": name}
+        result.update(summarize(timings))
+        self.results.append(result)
+        print(f"  {group:<8} {name:<48} p50 {result['p50_ms']:>10.3f} ms", file=sys.stderr)
+
+
+def _seed(path: str, data: Dict[str, Any]) -> JsonStore:
+    store = JsonStore(path=path)
+    store.save(data)
+    return store
+
+
+def bench_storage(runner: Runner, data: Dict[str, Any], directory: str) -> None:
+    """Raw snapshot save/load and building the API server's resident store."""
+    runner.measure(
+        "storage",
+        "JsonStore.save",
+        lambda i: JsonStore(path=os.path.join(directory, f"save-{i}.json")).save(data),
+    )
+    store = JsonStore(path=os.path.join(directory, "save-0.json"))
+    runner.measure("storage", "JsonStore.load", lambda _: store.load())
+    runner.measure(
+        "storage", "JsonStore.iter_history", lambda _: sum(1 for _ in store.iter_history())
+    )
+    runner.measure("storage", "DataStore startup", lambda _: DataStore(store))
+
+
+def bench_services(runner: Runner, data: Dict[str, Any], directory: str) -> None:
+    """Every ``EquipmentService`` and ``PeopleService`` method over a ``JsonStore``."""
+    store = _seed(os.path.join(directory, "services.json"), data)
+    for label, plural, service in (
+        ("equipment", "equipment", EquipmentService(store)),
+        ("person", "people", PeopleService(store)),
+    ):
+        listing = getattr(service, f"list_{plural}")
+        get = getattr(service, f"get_{label}")
+        add = getattr(service, f"add_{label}")
+        update = getattr(service, f"update_{label}")
+        remove = getattr(service, f"delete_{label}")
+        ids = cycle([record["id"] for record in data[plural][:1000]])
+        created: List[str] = []
+        runner.measure("services", f"list_{plural}()", lambda _: listing())
+        runner.measure("services", f"list_{plural}(limit=50)", lambda i: listing(i * 50, 50))
+        runner.measure("services", f"get_{label}", lambda _: get(next(ids)))
+        runner.measure(
+            "services", f"add_{label}", lambda i: created.append(add(f"Bench {i}")["id"])
+        )
+        runner.measure(
+            "services",
+            f"update_{label}",
+            lambda record_id: update(record_id, name="Renamed"),
+            created,
+        )
+        runner.measure("services", f"delete_{label}", remove, list(created))
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.rstrip("Z")).replace(tzinfo=timezone.utc)
+
+
+def bench_domain(runner: Runner, data: Dict[str, Any]) -> None:
+    """``equipment_ellie`` checkout/check-in and repository queries."""
+    numbers = {record["id"]: index for index, record in enumerate(data["equipment"], 1)}
+    items = [
+        Equipment(id=numbers[record["id"]], name=record["name"]) for record in data["equipment"]
+    ]
+    repository = CheckoutRepository()
+    start = time.perf_counter()
+    repository.create_many(
+        Checkout(
+            id=0,
+            equipment_id=numbers[record["equipment_id"]],
+            checked_out_at=_parse_time(record["checked_out_at"]),
+            due_at=_parse_time(record["due_at"]),
+            checked_in_at=_parse_time(record["checked_in_at"]),
+        )
+        for record in data["checkouts"]
+    )
+    runner.results.append(
+        {
+            "scale": runner.scale,
+            "group": "domain",
+            "name": "CheckoutRepository.create_many",
+            **summarize([time.perf_counter() - start]),
+        }
+    )
+    for item in items:
+        if repository.get_active_for_equipment(item.id) is not None:
+            item.status = EquipmentStatus.CHECKED_OUT
+    available = [item for item in items if item.status == EquipmentStatus.AVAILABLE]
+    borrowed: List[Equipment] = []
+    now = datetime.now(timezone.utc)
+    runner.measure(
+        "domain",
+        "checkout_equipment",
+        lambda item: (checkout_equipment(item, repository), borrowed.append(item)),
+        available,
+    )
+    runner.measure(
+        "domain", "checkin_equipment", lambda item: checkin_equipment(item, repository), borrowed
+    )
+    numbers_cycle = cycle(range(1, min(len(items), 1000) + 1))
+    runner.measure(
+        "domain",
+        "history_for_equipment",
+        lambda _: repository.history_for_equipment(next(numbers_cycle)),
+    )
+    runner.measure("domain", "due_before", lambda _: repository.due_before(now))
+
+
+def _web_app(store: DataStore) -> Any:
+    """Return the Flask app serving ``store``."""
+    import app as web
+
+    web.store = store
+    web.hub = EventHub(store)
+    web.response_cache = ResponseCache()
+    return web.app
+
+
+def bench_routes(runner: Runner, data: Dict[str, Any], directory: str) -> None:
+    """Every API route through the Flask test client, except the endless ``/api/stream``."""
+    store = DataStore(_seed(os.path.join(directory, "api.json"), data))
+    client = _web_app(store).test_client()
+
+    def call(method: str, url: str, body: Any = None) -> Any:
+        response = client.open(url, method=method, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+        return response.get_json(silent=True)
+
+    def route(
+        name: str, action: Callable[[Any], Any], args: Optional[Iterable[Any]] = None
+    ) -> None:
+        runner.measure("routes", name, action, args)
+
+    equipment_ids = cycle([record["id"] for record in data["equipment"][:1000]])
+    lender, receiver = data["people"][0]["id"], data["people"][-1]["id"]
+    version = store.version
+
+    route("GET /", lambda _: call("GET", "/"))
+    for url in (
+        "/api/equipment",
+        "/api/equipment?limit=50",
+        "/api/equipment?limit=50&q=camera",
+        "/api/equipment?status=overdue",
+        "/api/bootstrap?limit=50",
+        "/api/people",
+        "/api/people?limit=50",
+        "/api/search?q=person 1",
+        "/api/overdue",
+        f"/api/changes?since={version}",
+    ):
+        route(f"GET {url}", lambda _, url=url: call("GET", url))
+    route(
+        "GET /api/equipment/<id>", lambda _: call("GET", f"/api/equipment/{next(equipment_ids)}")
+    )
+    route(
+        "GET /api/equipment/<id>/history",
+        lambda _: call("GET", f"/api/equipment/{next(equipment_ids)}/history"),
+    )
+
+    created: Dict[str, List[str]] = {"equipment": [], "people": []}
+    for collection in created:
+        route(
+            f"POST /api/{collection}",
+            lambda i, collection=collection: created[collection].append(
+                call("POST", f"/api/{collection}", _new_row(collection, i))["id"]
+            ),
+        )
+        route(
+            f"PUT /api/{collection}/<id>",
+            lambda record_id, collection=collection: call(
+                "PUT", f"/api/{collection}/{record_id}", {"name": "Renamed"}
+            ),
+            created[collection],
+        )
+    borrowed: List[str] = []
+    route(
+        "POST /api/checkout",
+        lambda equipment_id: (
+            call("POST", "/api/checkout", {"equipment_id": equipment_id, "person_id": lender}),
+            borrowed.append(equipment_id),
+        ),
+        created["equipment"],
+    )
+    route(
+        "POST /api/transfer",
+        lambda equipment_id: call(
+            "POST", "/api/transfer", {"equipment_id": equipment_id, "person_id": receiver}
+        ),
+        borrowed,
+    )
+    route(
+        "POST /api/checkin",
+        lambda equipment_id: call("POST", "/api/checkin", {"equipment_id": equipment_id}),
+        borrowed,
+    )
+    for collection in created:
+        route(
+            f"DELETE /api/{collection}/<id>",
+            lambda record_id, collection=collection: call(
+                "DELETE", f"/api/{collection}/{record_id}"
+            ),
+            list(created[collection]),
+        )
+
+    for collection in created:
+        batches: List[List[str]] = []
+        url = f"/api/{collection}/bulk"
+        route(
+            f"POST {url} ({BULK_ROWS} rows)",
+            lambda i, url=url, collection=collection: batches.append(
+                _bulk_ids(
+                    call(
+                        "POST",
+                        url,
+                        [_new_row(collection, i * BULK_ROWS + row) for row in range(BULK_ROWS)],
+                    )
+                )
+            ),
+        )
+        route(
+            f"PUT {url} ({BULK_ROWS} rows)",
+            lambda ids, url=url: call("PUT", url, [{"id": id_, "name": "Renamed"} for id_ in ids]),
+            batches,
+        )
+        route(
+            f"DELETE {url} ({BULK_ROWS} rows)",
+            lambda ids, url=url: call("DELETE", url, ids),
+            batches,
+        )
+
+
+def _bulk_ids(summary: Dict[str, Any]) -> List[str]:
+    return [result["id"] for result in summary["results"] if "id" in result]
+
+
+def _new_row(collection: str, index: int) -> Dict[str, Any]:
+    if collection == "equipment":
+        return {"name": f"Bench item {index}", "tag": f"B-{uuid.uuid4().hex[:12]}"}
+    return {"name": f"Bench person {index}", "email": f"bench{uuid.uuid4().hex[:12]}@example.org"}
+
+
+def run_scale(
+    scale: str, active: float, overdue: float, iterations: int, budget: float, seed: int = 0
+) -> List[Result]:
+    """Generate the dataset for ``scale`` and run every benchmark group over it."""
+    checkouts = SCALES[scale]
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    data = generate(
+        max(checkouts // 10, 10),
+        max(checkouts // 100, 10),
+        checkouts,
+        seed=seed,
+        active=active,
+        overdue=overdue,
+        now=now,
+    )
+    runner = Runner(scale, iterations, budget)
+    print(
+        f"{scale}: {len(data['equipment'])} equipment, {len(data['people'])} people, "
+        f"{len(data['checkouts'])} checkouts "
+        f"({sum(not is_history('checkouts', c) for c in data['checkouts'])} active)",
+        file=sys.stderr,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        bench_storage(runner, data, directory)
+        bench_services(runner, data, directory)
+        bench_domain(runner, data)
+        bench_routes(runner, data, directory)
+    return runner.results
+
+
+def regressions(
+    results: List[Result], baseline: List[Result], tolerance: float
+) -> List[Tuple[Result, Result]]:
+    """Pair each result whose p50 exceeds its baseline's by more than ``tolerance``."""
+    previous = {(r["scale"], r["group"], r["name"]): r for r in baseline}
+    slower = []
+    for result in results:
+        before = previous.get((result["scale"], result["group"], result["name"]))
+        if before and result["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            slower.append((before, result))
+    return slower
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales", default="1k,10k", help=f"Comma-separated, from {', '.join(SCALES)}"
+    )
+    parser.add_argument("--active", type=float, default=0.3, help="Equipment checked out")
+    parser.add_argument("--overdue", type=float, default=0.05, help="Equipment overdue")
+    parser.add_argument("--iterations", type=int, default=200, help="Runs per case at most")
+    parser.add_argument("--budget", type=float, default=5.0, help="Seconds per case at most")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 growth")
+    args = parser.parse_args()
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scale {', '.join(unknown)}; expected {', '.join(SCALES)}")
+
+    # The API module opens its configured data file on import; keep it off real data.
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["EQUIPMENT_ELLIE_DATA"] = os.path.join(directory, "unused.json")
+        results = []
+        for scale in scales:
+            results.extend(
+                run_scale(scale, args.active, args.overdue, args.iterations, args.budget, args.seed)
+            )
+
+    if args.json:
+        document = {
+            "python": platform.python_version(),
+            "codec": codec.active.name,
+            "seed": args.seed,
+            "active": args.active,
+            "overdue": args.overdue,
+            "results": results,
+        }
+        print(json.dumps(document, indent=2))
+    else:
+        print(
+            f"{'scale':<6} {'case':<58} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} "
+            f"{'ops/s':>10}"
+        )
+        for row in results:
+            print(
+                f"{row['scale']:<6} {row['group'] + ' ' + row['name']:<58} {row['p50_ms']:>10} "
+                f"{row['p95_ms']:>10} {row['p99_ms']:>10} {row['ops_per_s']:>10}"
+            )
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)["results"]
+        slower = regressions(results, baseline, args.tolerance)
+        for before, after in slower:
+            print(
+                f"slower: {after['scale']} {after['group']} {after['name']}: "
+                f"p50 {before['p50_ms']} -> {after['p50_ms']} ms",
+                file=sys.stderr,
+            )
+        if slower:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
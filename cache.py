@@ -0,0 +1,121 @@
+"""Cache of serialized API responses, keyed by request and data version.
+
+``ResponseCache.fetch`` and ``respond`` are the framework-neutral half of a
+cached GET; ``app.py`` and ``asgi.py`` only translate requests and responses.
+"""
+
+from __future__ import annotations
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from werkzeug.http import parse_accept_header, parse_etags
+
+Version = Tuple[int, ...]
+
+MAX_CACHED_RESPONSES = 256
+# Bodies smaller than this are sent uncompressed; gzip would barely help.
+GZIP_MIN_BYTES = 1024
+
+
+class CachedResponse:
+    """A serialized body plus its headers; the gzipped form is built on first use.
+
+    ``etag`` is unquoted and meant to be sent as a weak tag: the plain and
+    gzipped bodies share it.
+    """
+
+    __slots__ = ("etag", "body", "headers", "_gzipped")
+
+    def __init__(self, etag: str, body: bytes, headers: Dict[str, str]) -> None:
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+        self._gzipped: Optional[bytes] = None
+
+    def gzipped(self) -> Optional[bytes]:
+        """Return the gzip-encoded body, or ``None`` if it is not worth compressing."""
+        if len(self.body) < GZIP_MIN_BYTES:
+            return None
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class ResponseCache:
+    """Least-recently-used responses, each valid for one data version.
+
+    ``version`` is the tuple of collection versions the response was built
+    from; a lookup with a different version misses, so a mutation
+    invalidates affected entries without touching the cache.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_RESPONSES) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Version, CachedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Version) -> Optional[CachedResponse]:
+        with self._lock:
+            found = self._entries.get(key)
+            if found is None or found[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return found[1]
+
+    def fetch(
+        self,
+        key: Hashable,
+        version: Version,
+        build: Callable[[], Tuple[Any, Dict[str, str]]],
+        encode: Callable[[Any], bytes],
+    ) -> CachedResponse:
+        """Return the response for ``key`` at ``version``, building and caching it on a miss.
+
+        ``build`` returns ``(payload, headers)``; the payload is serialized with ``encode``.
+        """
+        cached = self.get(key, version)
+        if cached is None:
+            payload, headers = build()
+            cached = self.put(key, version, encode(payload), headers)
+        return cached
+
+    def put(
+        self, key: Hashable, version: Version, body: bytes, headers: Dict[str, str]
+    ) -> CachedResponse:
+        versions = ".".join(str(part) for part in version)
+        digest = zlib.crc32(repr(key).encode("utf-8"))
+        response = CachedResponse(f"{versions}-{digest:08x}", body, headers)
+        with self._lock:
+            self._entries[key] = (version, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return response
+
+
+def respond(
+    cached: CachedResponse, if_none_match: Optional[str], accept_encoding: Optional[str]
+) -> Tuple[int, bytes, Dict[str, str]]:
+    """Return the status, body and headers answering a GET for ``cached``.
+
+    ``304`` with an empty body when ``If-None-Match`` names its ETag; otherwise
+    the JSON body, gzipped when ``Accept-Encoding`` allows it and it is worth it.
+    """
+    headers = {
+        "ETag": f'W/"{cached.etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if parse_etags(if_none_match).contains_weak(cached.etag):
+        return 304, b"", headers
+    body = cached.body
+    if parse_accept_header(accept_encoding)["gzip"]:
+        gzipped = cached.gzipped()
+        if gzipped is not None:
+            body = gzipped
+            headers["Content-Encoding"] = "gzip"
+    return 200, body, {"Content-Type": "application/json", **cached.headers, **headers}
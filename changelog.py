@@ -0,0 +1,71 @@
+"""Bounded in-memory log of committed mutations, for clients syncing deltas."""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+# Upper bound on the number of changed records kept; older mutations are
+# evicted and clients that need them resync in full.
+MAX_LOGGED_CHANGES = 50000
+
+
+class LoggedMutation(NamedTuple):
+    version: int
+    changes: List[Dict[str, Any]]
+
+
+class ChangeLog:
+    """Recent mutations in version order.
+
+    ``floor`` is the oldest version a client can resume from: everything
+    committed after it is still in the log. ``wait`` lets any number of
+    threads block until the log moves past a version.
+    """
+
+    def __init__(self, max_changes: int = MAX_LOGGED_CHANGES) -> None:
+        self.max_changes = max_changes
+        self.floor = 0
+        self._entries: Deque[LoggedMutation] = deque()
+        self._size = 0
+        self.latest = 0
+        self._changed = threading.Condition()
+
+    def reset(self, version: int) -> None:
+        """Forget everything; history before ``version`` is no longer known."""
+        self._entries.clear()
+        self._size = 0
+        self.floor = version
+        self._advance(version)
+
+    def append(self, version: int, changes: List[Dict[str, Any]]) -> None:
+        self._entries.append(LoggedMutation(version, changes))
+        self._size += len(changes)
+        while self._size > self.max_changes and len(self._entries) > 1:
+            evicted = self._entries.popleft()
+            self._size -= len(evicted.changes)
+            self.floor = evicted.version
+        self._advance(version)
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """Block until something newer than ``version`` is logged; False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.latest != version, timeout)
+
+    def since(self, version: int) -> Optional[List[LoggedMutation]]:
+        """Return mutations after ``version``, or ``None`` if some were evicted."""
+        if version < self.floor:
+            return None
+        newer = []
+        for entry in reversed(self._entries):
+            if entry.version <= version:
+                break
+            newer.append(entry)
+        newer.reverse()
+        return newer
+
+    def _advance(self, version: int) -> None:
+        with self._changed:
+            self.latest = version
+            self._changed.notify_all()
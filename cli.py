@@ -1,15 +1,32 @@
 import argparse
 import json
+import shlex
+import sys
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Iterable, List, NoReturn
 
+import exchange
+import metrics
+import profiling
+from config import Settings
 from equipment_service import EquipmentService
 from people_service import PeopleService
-from storage import JsonStore
+from storage import ConflictError, StagedStore, Storage, is_history, open_storage
 
 
-def _build_store(data_file: str) -> JsonStore:
-    return JsonStore(path=Path(data_file))
+# Export output is written to disk in chunks of this size.
+EXPORT_BUFFER_BYTES = 1024 * 1024
+
+
+def _build_store(data_file: str) -> Storage:
+    settings = Settings.from_env()
+    store = open_storage(
+        data_file, durability=settings.durability, pretty_json=settings.pretty_json
+    )
+    if metrics.active is not None:
+        store = metrics.InstrumentedStore(store, metrics.active)
+    return store
 
 
 def _print_payload(payload: Any) -> None:
@@ -20,6 +37,11 @@ def _handle_error(exc: Exception) -> None:
     raise SystemExit(str(exc))
 
 
+def _add_paging_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many records")
+    parser.add_argument("--limit", type=int, help="Return at most this many records")
+
+
 def _add_equipment_commands(subparsers: argparse._SubParsersAction) -> None:
     equipment_parser = subparsers.add_parser("equipment", help="Manage equipment")
     equipment_subparsers = equipment_parser.add_subparsers(dest="equipment_command", required=True)
@@ -29,26 +51,21 @@ def _add_equipment_commands(subparsers: argparse._SubParsersAction) -> None:
     add_parser.add_argument("--description")
     add_parser.add_argument("--status")
     add_parser.set_defaults(
-        func=lambda args: _print_payload(
-            EquipmentService(_build_store(args.data_file)).add_equipment(
-                args.name, args.description, args.status
-            )
+        func=lambda args, store: EquipmentService(store).add_equipment(
+            args.name, args.description, args.status
         )
     )
 
     list_parser = equipment_subparsers.add_parser("list", help="List equipment")
+    _add_paging_arguments(list_parser)
     list_parser.set_defaults(
-        func=lambda args: _print_payload(
-            EquipmentService(_build_store(args.data_file)).list_equipment()
-        )
+        func=lambda args, store: EquipmentService(store).list_equipment(args.offset, args.limit)
     )
 
     get_parser = equipment_subparsers.add_parser("get", help="Get equipment by id")
     get_parser.add_argument("--id", required=True)
     get_parser.set_defaults(
-        func=lambda args: _print_payload(
-            EquipmentService(_build_store(args.data_file)).get_equipment(args.id)
-        )
+        func=lambda args, store: EquipmentService(store).get_equipment(args.id)
     )
 
     update_parser = equipment_subparsers.add_parser("update", help="Update equipment")
@@ -57,19 +74,15 @@ def _add_equipment_commands(subparsers: argparse._SubParsersAction) -> None:
     update_parser.add_argument("--description")
     update_parser.add_argument("--status")
     update_parser.set_defaults(
-        func=lambda args: _print_payload(
-            EquipmentService(_build_store(args.data_file)).update_equipment(
-                args.id, args.name, args.description, args.status
-            )
+        func=lambda args, store: EquipmentService(store).update_equipment(
+            args.id, args.name, args.description, args.status
         )
     )
 
     delete_parser = equipment_subparsers.add_parser("delete", help="Delete equipment")
     delete_parser.add_argument("--id", required=True)
     delete_parser.set_defaults(
-        func=lambda args: EquipmentService(_build_store(args.data_file)).delete_equipment(
-            args.id
-        )
+        func=lambda args, store: EquipmentService(store).delete_equipment(args.id)
     )
 
 
@@ -82,27 +95,18 @@ def _add_people_commands(subparsers: argparse._SubParsersAction) -> None:
     add_parser.add_argument("--email")
     add_parser.add_argument("--role")
     add_parser.set_defaults(
-        func=lambda args: _print_payload(
-            PeopleService(_build_store(args.data_file)).add_person(
-                args.name, args.email, args.role
-            )
-        )
+        func=lambda args, store: PeopleService(store).add_person(args.name, args.email, args.role)
     )
 
     list_parser = people_subparsers.add_parser("list", help="List people")
+    _add_paging_arguments(list_parser)
     list_parser.set_defaults(
-        func=lambda args: _print_payload(
-            PeopleService(_build_store(args.data_file)).list_people()
-        )
+        func=lambda args, store: PeopleService(store).list_people(args.offset, args.limit)
     )
 
     get_parser = people_subparsers.add_parser("get", help="Get person by id")
     get_parser.add_argument("--id", required=True)
-    get_parser.set_defaults(
-        func=lambda args: _print_payload(
-            PeopleService(_build_store(args.data_file)).get_person(args.id)
-        )
-    )
+    get_parser.set_defaults(func=lambda args, store: PeopleService(store).get_person(args.id))
 
     update_parser = people_subparsers.add_parser("update", help="Update person")
     update_parser.add_argument("--id", required=True)
@@ -110,18 +114,212 @@ def _add_people_commands(subparsers: argparse._SubParsersAction) -> None:
     update_parser.add_argument("--email")
     update_parser.add_argument("--role")
     update_parser.set_defaults(
-        func=lambda args: _print_payload(
-            PeopleService(_build_store(args.data_file)).update_person(
-                args.id, args.name, args.email, args.role
-            )
+        func=lambda args, store: PeopleService(store).update_person(
+            args.id, args.name, args.email, args.role
         )
     )
 
     delete_parser = people_subparsers.add_parser("delete", help="Delete person")
     delete_parser.add_argument("--id", required=True)
-    delete_parser.set_defaults(
-        func=lambda args: PeopleService(_build_store(args.data_file)).delete_person(args.id)
+    delete_parser.set_defaults(func=lambda args, store: PeopleService(store).delete_person(args.id))
+
+
+def _add_batch_command(subparsers: argparse._SubParsersAction) -> None:
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="Run many commands with one load and one save",
+        description=(
+            "Read one command per line, either as CLI arguments (equipment add --name Drill) "
+            'or as a JSON object ({"resource": "equipment", "command": "add", "name": "Drill"}). '
+            "Blank lines and lines starting with # are skipped. One JSON result per command "
+            "is printed as it runs; the successful commands are saved in one transaction at "
+            "the end."
+        ),
+    )
+    batch_parser.add_argument(
+        "script", nargs="?", default="-", help="Command file (default: standard input)"
+    )
+    batch_parser.add_argument(
+        "--atomic",
+        action="store_true",
+        help="Stop at the first failing command and save nothing",
+    )
+    batch_parser.set_defaults(func=_run_batch)
+
+
+def _add_exchange_commands(subparsers: argparse._SubParsersAction) -> None:
+    mapping_help = "Map a file column to a record field, e.g. 'Asset Tag=tag' (repeatable)"
+
+    export_parser = subparsers.add_parser("export", help="Export records as CSV or NDJSON")
+    export_parser.add_argument("collection", choices=sorted(exchange.EXPORT_FIELDS))
+    export_parser.add_argument("--output", "-o", default="-", help="Output file (default: stdout)")
+    export_parser.add_argument("--format", choices=exchange.FORMATS)
+    export_parser.add_argument("--map", action="append", default=[], help=mapping_help)
+    export_parser.set_defaults(func=_run_export)
+
+    import_parser = subparsers.add_parser(
+        "import",
+        help="Import records from CSV or NDJSON",
+        description=(
+            "Rows matching an existing record by tag (equipment) or email (people) update "
+            "it; other rows create a record. Rows are streamed and committed every "
+            f"{exchange.IMPORT_CHUNK_ROWS:,}, but every stored and imported tag or email is "
+            "kept in memory to find matches, so memory grows with their number."
+        ),
+    )
+    import_parser.add_argument("collection", choices=sorted(exchange.IMPORT_FIELDS))
+    import_parser.add_argument("input", help="Input file, or - for stdin")
+    import_parser.add_argument("--format", choices=exchange.FORMATS)
+    import_parser.add_argument("--map", action="append", default=[], help=mapping_help)
+    import_parser.set_defaults(func=_run_import)
+
+
+def _run_export(args: argparse.Namespace, store: Storage) -> None:
+    fields = exchange.EXPORT_FIELDS[args.collection]
+    mapping = exchange.parse_mapping(args.map, args.collection, fields)
+    fmt = exchange.format_for(None if args.output == "-" else args.output, args.format)
+    if args.output == "-":
+        rows = exchange.export_records(store, args.collection, sys.stdout, fmt, mapping)
+    else:
+        with open(
+            args.output, "w", encoding="utf-8", newline="", buffering=EXPORT_BUFFER_BYTES
+        ) as handle:
+            rows = exchange.export_records(store, args.collection, handle, fmt, mapping)
+    print(f"Exported {rows} {args.collection} rows.", file=sys.stderr)
+
+
+def _run_import(args: argparse.Namespace, store: Storage) -> None:
+    fields = exchange.IMPORT_FIELDS[args.collection]
+    mapping = exchange.parse_mapping(args.map, args.collection, fields)
+    fmt = exchange.format_for(None if args.input == "-" else args.input, args.format)
+
+    def report(line: int, message: str) -> None:
+        print(f"line {line}: {message}", file=sys.stderr)
+
+    if args.input == "-":
+        summary = exchange.import_records(store, args.collection, sys.stdin, fmt, mapping, report)
+    else:
+        with open(args.input, encoding="utf-8-sig", newline="") as handle:
+            summary = exchange.import_records(store, args.collection, handle, fmt, mapping, report)
+    print(
+        f"{summary.created} created, {summary.updated} updated, "
+        f"{summary.unchanged} unchanged, {summary.failed} failed.",
+        file=sys.stderr,
     )
+    if summary.failed:
+        raise SystemExit(1)
+
+
+def _add_convert_command(subparsers: argparse._SubParsersAction) -> None:
+    convert_parser = subparsers.add_parser(
+        "convert",
+        help="Copy the data file into another format",
+        description=(
+            "Write every record, including checkout history, to DEST. The format follows "
+            "the suffix: .json, .snap (binary snapshot) or .db/.sqlite; a path ending in "
+            "/ is a directory with one JSON file per collection."
+        ),
+    )
+    convert_parser.add_argument("dest")
+    convert_parser.add_argument("--force", action="store_true", help="Replace DEST if it exists")
+    convert_parser.set_defaults(func=_run_convert)
+
+
+def _run_convert(args: argparse.Namespace, store: Storage) -> None:
+    dest = Path(args.dest)
+    if dest.resolve() == Path(args.data_file).resolve():
+        raise ValueError("Destination is the data file itself")
+    in_use = dest.is_file() or (dest.is_dir() and any(dest.iterdir()))
+    if in_use and not args.force:
+        raise ValueError(f"{dest} already exists; pass --force to replace it")
+    data = store.load()
+    live = [record for record in data.get("checkouts", []) if not is_history("checkouts", record)]
+    data["checkouts"] = list(store.iter_history()) + live
+    # Passed as given: a trailing separator asks for the directory layout.
+    target = _build_store(args.dest)
+    try:
+        target.save(data)
+    finally:
+        target.close()
+    counts = ", ".join(f"{len(records)} {name}" for name, records in data.items())
+    print(f"Wrote {counts} to {dest}.", file=sys.stderr)
+
+
+class _BatchLineParser(argparse.ArgumentParser):
+    """Parses one batch line; reports errors instead of exiting."""
+
+    def error(self, message: str) -> NoReturn:
+        raise ValueError(message)
+
+
+def _build_command_parser(parser_class: type = argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser = parser_class(prog="cli.py batch", add_help=False)
+    subparsers = parser.add_subparsers(dest="resource", required=True)
+    _add_equipment_commands(subparsers)
+    _add_people_commands(subparsers)
+    return parser
+
+
+def _batch_argv(line: str) -> List[str]:
+    if not line.startswith("{"):
+        return shlex.split(line)
+    try:
+        command: Dict[str, Any] = json.loads(line)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON: {exc}") from None
+    if not isinstance(command, dict):
+        raise ValueError("Command must be a JSON object")
+    argv = [str(command.pop("resource", "")), str(command.pop("command", ""))]
+    for key, value in command.items():
+        if value is not None:
+            argv += [f"--{key.replace('_', '-')}", str(value)]
+    return argv
+
+
+def _run_batch(args: argparse.Namespace, store: Storage) -> None:
+    parser = _build_command_parser(_BatchLineParser)
+    staged = StagedStore(store)
+    lines: Iterable[str] = sys.stdin
+    if args.script != "-":
+        lines = Path(args.script).read_text(encoding="utf-8").splitlines()
+
+    succeeded = failed = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            command = parser.parse_args(_batch_argv(line))
+            result = command.func(command, staged)
+        except (KeyError, ValueError) as exc:
+            failed += 1
+            message = exc.args[0] if isinstance(exc, KeyError) and exc.args else str(exc)
+            print(json.dumps({"line": number, "ok": False, "error": message}), flush=True)
+            if args.atomic:
+                raise SystemExit(f"Line {number} failed; nothing was saved.")
+            continue
+        succeeded += 1
+        print(json.dumps({"line": number, "ok": True, "result": result}), flush=True)
+
+    try:
+        version = staged.flush()
+    except ConflictError:
+        raise SystemExit("Data changed while the batch ran; nothing was saved.") from None
+    print(
+        f"{succeeded} succeeded, {failed} failed; saved at version {version}.", file=sys.stderr
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+def _command_name(args: argparse.Namespace) -> str:
+    subcommand = getattr(args, f"{args.resource}_command", None)
+    return f"{args.resource} {subcommand}" if subcommand else args.resource
+
+
+def _report_stats(stats: metrics.Metrics, args: argparse.Namespace, elapsed: float) -> None:
+    stats.command_seconds.observe(elapsed, _command_name(args))
+    print(stats.summary(), file=sys.stderr)
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -129,21 +327,42 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--data-file",
         default=str(Path(__file__).with_name("data.json")),
-        help="Path to the JSON data store",
+        help="Path to the data store (.json, .snap, .db/.sqlite, or a directory)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print storage, lock and command timings to stderr when done",
     )
     subparsers = parser.add_subparsers(dest="resource", required=True)
     _add_equipment_commands(subparsers)
     _add_people_commands(subparsers)
+    _add_batch_command(subparsers)
+    _add_exchange_commands(subparsers)
+    _add_convert_command(subparsers)
     return parser
 
 
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
+    stats = metrics.enable() if args.stats else None
+    # Every command is profiled (no sampling) when EQUIPMENT_ELLIE_PROFILE_DIR is set.
+    profiler = profiling.Profiler.from_settings(Settings.from_env())
+    profile = profiler.start(sampled=False) if profiler is not None else None
+    started = time.perf_counter()
     try:
-        args.func(args)
+        payload = args.func(args, _build_store(args.data_file))
     except (KeyError, ValueError) as exc:
         _handle_error(exc)
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler.stop(profile, _command_name(args), elapsed)
+        if stats is not None:
+            _report_stats(stats, args, elapsed)
+    if payload is not None:
+        _print_payload(payload)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+"""JSON encoding shared by the storage backends, the API and the CLI.
+
+``orjson`` is used when it is installed and the standard library otherwise;
+both produce the same documents. Output is compact unless ``pretty`` is
+asked for (two-space indent, sorted keys), which is only worth it for files
+people read by hand. Set ``EQUIPMENT_ELLIE_JSON=json`` to force the standard
+library.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Codec:
+    """Standard library JSON encoder/decoder."""
+
+    name = "json"
+
+    def dumps(self, value: Any, pretty: bool = False) -> bytes:
+        if pretty:
+            text = json.dumps(value, indent=2, sort_keys=True, ensure_ascii=False)
+        else:
+            text = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        return text.encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    """``orjson`` encoder/decoder; several times faster in both directions."""
+
+    name = "orjson"
+
+    def dumps(self, value: Any, pretty: bool = False) -> bytes:
+        option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0
+        return orjson.dumps(value, option=option)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+def available() -> Dict[str, Codec]:
+    """Return every codec usable in this environment, by name."""
+    codecs: Dict[str, Codec] = {"json": Codec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    return codecs
+
+
+def _default() -> Codec:
+    codecs = available()
+    requested = os.environ.get("EQUIPMENT_ELLIE_JSON")
+    if requested:
+        if requested not in codecs:
+            raise ValueError(
+                f"JSON codec '{requested}' is not available; expected one of "
+                f"{', '.join(codecs)}"
+            )
+        return codecs[requested]
+    return codecs.get("orjson", codecs["json"])
+
+
+active = _default()
+
+
+def dumps(value: Any, pretty: bool = False) -> bytes:
+    """Serialize ``value`` to UTF-8 JSON bytes with the active codec."""
+    return active.dumps(value, pretty)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON bytes or text with the active codec."""
+    return active.loads(data)
@@ -0,0 +1,97 @@
+"""Runtime settings read from ``EQUIPMENT_ELLIE_*`` environment variables."""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# fsync: flush every commit to disk on its own.
+# group: gather concurrent commits and flush them with one fsync.
+# none:  leave flushing to the OS (fastest; recent writes may be lost on power failure).
+DURABILITY_MODES = ("fsync", "group", "none")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Deployment settings shared by the Flask app and the CLI.
+
+    Attributes:
+        data_file: Data file path (``EQUIPMENT_ELLIE_DATA``).
+        durability: One of ``DURABILITY_MODES`` (``EQUIPMENT_ELLIE_DURABILITY``).
+        commit_window_ms: How long the group committer waits for more writes
+            before flushing a batch (``EQUIPMENT_ELLIE_COMMIT_WINDOW_MS``).
+        pretty_json: Indent JSON snapshots for reading by hand instead of writing
+            them compact (``EQUIPMENT_ELLIE_PRETTY_JSON``).
+        metrics: Record request, storage and lock timings and serve them at
+            ``/metrics`` (``EQUIPMENT_ELLIE_METRICS``).
+        profile_dir: Write cProfile captures here; empty turns profiling off
+            (``EQUIPMENT_ELLIE_PROFILE_DIR``).
+        profile_sample: Fraction of API requests to profile
+            (``EQUIPMENT_ELLIE_PROFILE_SAMPLE``).
+        profile_slow_ms: Keep only captures that ran at least this long
+            (``EQUIPMENT_ELLIE_PROFILE_SLOW_MS``).
+        profile_keep: How many captures to retain before deleting the oldest
+            (``EQUIPMENT_ELLIE_PROFILE_KEEP``).
+    """
+
+    data_file: str = os.path.join(BASE_DIR, "data.json")
+    durability: str = "none"
+    commit_window_ms: float = 0.0
+    pretty_json: bool = False
+    metrics: bool = False
+    profile_dir: str = ""
+    profile_sample: float = 0.01
+    profile_slow_ms: float = 0.0
+    profile_keep: int = 50
+
+    def __post_init__(self) -> None:
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"Unknown durability '{self.durability}'; "
+                f"expected one of {', '.join(DURABILITY_MODES)}"
+            )
+        if self.commit_window_ms < 0:
+            raise ValueError("Commit window must not be negative")
+        if not 0 <= self.profile_sample <= 1:
+            raise ValueError("Profile sample must be between 0 and 1")
+        if self.profile_slow_ms < 0:
+            raise ValueError("Profile slow threshold must not be negative")
+        if self.profile_keep < 1:
+            raise ValueError("Profile keep must be at least 1")
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        defaults = cls()
+        return cls(
+            data_file=environ.get("EQUIPMENT_ELLIE_DATA", defaults.data_file),
+            durability=environ.get("EQUIPMENT_ELLIE_DURABILITY", defaults.durability),
+            commit_window_ms=float(
+                environ.get("EQUIPMENT_ELLIE_COMMIT_WINDOW_MS", defaults.commit_window_ms)
+            ),
+            pretty_json=_flag(environ.get("EQUIPMENT_ELLIE_PRETTY_JSON", "")),
+            metrics=_flag(environ.get("EQUIPMENT_ELLIE_METRICS", "")),
+            profile_dir=environ.get("EQUIPMENT_ELLIE_PROFILE_DIR", defaults.profile_dir),
+            profile_sample=float(
+                environ.get("EQUIPMENT_ELLIE_PROFILE_SAMPLE", defaults.profile_sample)
+            ),
+            profile_slow_ms=float(
+                environ.get("EQUIPMENT_ELLIE_PROFILE_SLOW_MS", defaults.profile_slow_ms)
+            ),
+            profile_keep=int(environ.get("EQUIPMENT_ELLIE_PROFILE_KEEP", defaults.profile_keep)),
+        )
+
+    @property
+    def commit_window(self) -> Optional[float]:
+        """Seconds to gather writes into one group commit, or ``None`` to commit each directly."""
+        if self.durability == "fsync":
+            return None
+        if self.durability == "group" or self.commit_window_ms > 0:
+            return self.commit_window_ms / 1000
+        return None
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
@@ -0,0 +1,512 @@
+"""Process-resident data store backing the Flask API."""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from changelog import ChangeLog, LoggedMutation
+from indexes import Position, SearchIndex, SortedIndex
+from journal import delete, put
+from storage import COLLECTIONS, ConflictError, MutationRecord, Storage, is_history
+
+MAX_COMMIT_ATTEMPTS = 8
+
+# Mutations with at least this many changes rebuild the sort and search
+# indexes on the next query instead of updating them record by record.
+DEFERRED_INDEX_CHANGES = 256
+
+# Sortable fields per collection. ``created`` (insertion order) is always
+# available; the others map a record to its sort key.
+SORT_FIELDS: Dict[str, Dict[str, Callable[[dict], Any]]] = {
+    "equipment": {
+        "name": lambda record: (record.get("name") or "").casefold(),
+        "tag": lambda record: (record.get("tag") or "").casefold(),
+        "status": lambda record: record.get("status") or "",
+        "due_at": lambda record: record.get("due_at") or "",
+    },
+    "people": {
+        "name": lambda record: (record.get("name") or "").casefold(),
+        "email": lambda record: (record.get("email") or "").casefold(),
+        "role": lambda record: (record.get("role") or "").casefold(),
+    },
+    "checkouts": {},
+}
+
+
+# Attributes rebuilt by ``_load``, which ``adopt`` takes over from another store.
+STATE_ATTRIBUTES = (
+    "version",
+    "_records",
+    "_active_checkouts",
+    "_borrowers",
+    "_borrowed",
+    "_by_status",
+    "_sorted",
+    "_search",
+    "_due",
+    "_created",
+    "collection_versions",
+)
+
+
+class Mutation(NamedTuple):
+    """Changes an operation wants committed, plus the value to hand back."""
+
+    op: str
+    changes: List[Dict[str, Any]]
+    result: Any
+
+
+class Page(NamedTuple):
+    """One page of query results."""
+
+    items: List[dict]
+    next_position: Optional[Position]
+    total: int
+
+
+class _PendingWrite:
+    """A ``transact`` call waiting for its batch to be committed."""
+
+    __slots__ = ("operation", "done", "result", "error")
+
+    def __init__(self, operation: Callable[["DataStore"], Mutation]) -> None:
+        self.operation = operation
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class DataStore:
+    """Loads the storage backend once and keeps id-indexed records in memory.
+
+    Every mutation is committed to the backend before the call returns, so it
+    stays the source of truth across restarts while reads never touch it.
+    Closed checkouts are history: they are dropped from memory once applied
+    and read back from the backend on demand (``history``).
+
+    Several processes may share one backend. Writes are optimistic: an
+    operation runs against the in-memory state, and its changes are committed
+    with the version that state was read at. If another process got there
+    first, the store catches up from the backend and runs the operation again.
+    Changes are applied in memory only once committed, so readers never see a
+    write that may still fail.
+
+    ``commit_window`` (seconds) turns on group commit: writes arriving while a
+    batch is being gathered or flushed are applied in order and persisted
+    together with a single storage commit.
+    """
+
+    def __init__(self, storage: Storage, commit_window: Optional[float] = None) -> None:
+        self.storage = storage
+        self.commit_window = commit_window
+        self.lock = threading.RLock()
+        # Held from planning a batch until it is committed and applied, so this
+        # process's writers do not plan against the same version.
+        self._write_lock = threading.Lock()
+        self.version = 0
+        self._records: Dict[str, Dict[str, dict]] = {name: {} for name in COLLECTIONS}
+        self._active_checkouts: Dict[str, dict] = {}
+        self._borrowers: Dict[str, str] = {}
+        self._borrowed: Dict[str, set] = {}
+        self._by_status: Dict[str, set] = {}
+        self._sorted: Dict[str, Dict[str, SortedIndex]] = {}
+        self._search: Dict[str, SearchIndex] = {}
+        # Checked-out equipment keyed by ``due_at``.
+        self._due = SortedIndex()
+        self._created = 0
+        # Committed mutations, for clients syncing deltas (``changes_since``).
+        self.changes = ChangeLog()
+        # Version at which each collection last changed, for HTTP caching.
+        self.collection_versions: Dict[str, int] = {name: 0 for name in COLLECTIONS}
+        self._load()
+        self._queue: Optional["queue.Queue[_PendingWrite]"] = None
+        if commit_window is not None:
+            self._queue = queue.Queue()
+            threading.Thread(
+                target=self._run_committer,
+                args=(self._queue, commit_window),
+                name="group-commit",
+                daemon=True,
+            ).start()
+
+    def get(self, collection: str, record_id: Optional[str]) -> Optional[dict]:
+        if record_id is None:
+            return None
+        with self.lock:
+            return self._records[collection].get(record_id)
+
+    def list(self, collection: str) -> List[dict]:
+        with self.lock:
+            return list(self._records[collection].values())
+
+    def count(self, collection: str) -> int:
+        with self.lock:
+            return len(self._records[collection])
+
+    def active_checkout(self, equipment_id: str) -> Optional[dict]:
+        with self.lock:
+            return self._active_checkouts.get(equipment_id)
+
+    def borrowed_by(self, person_id: str) -> List[dict]:
+        with self.lock:
+            equipment = self._records["equipment"]
+            return [equipment[item_id] for item_id in self._borrowed.get(person_id, ())]
+
+    def changes_since(self, version: int) -> Tuple[int, Optional[List[LoggedMutation]]]:
+        """Return the current version and the mutations committed after ``version``.
+
+        The list is ``None`` when the change log no longer reaches back that
+        far (or ``version`` is from the future), and the caller must resync.
+        """
+        with self.lock:
+            if version > self.version:
+                return self.version, None
+            return self.version, self.changes.since(version)
+
+    def history(self, equipment_id: str) -> List[dict]:
+        """Return every checkout of an item, oldest first; reads the backend."""
+        # Active first: if it is closed meanwhile, the backend returns it again.
+        active = self.active_checkout(equipment_id)
+        closed = self.storage.history(equipment_id)
+        if active is None or any(record["id"] == active["id"] for record in closed):
+            return closed
+        return closed + [active]
+
+    def due_before(self, cutoff: str) -> List[dict]:
+        """Return checked-out equipment due before ``cutoff`` (ISO), earliest first."""
+        with self.lock:
+            equipment = self._records["equipment"]
+            return [equipment[item_id] for item_id in self._due.ids_before(cutoff)]
+
+    def query(
+        self,
+        collection: str,
+        sort: str = "created",
+        descending: bool = False,
+        limit: Optional[int] = None,
+        after: Optional[Position] = None,
+        status: Optional[str] = None,
+        checked_out_to: Optional[str] = None,
+        text: Optional[str] = None,
+        now: Optional[str] = None,
+    ) -> Page:
+        """Return records matching the filters, ordered by a sort index.
+
+        ``after`` is the position of the last record of the previous page.
+        ``status`` may also be ``"overdue"``: checked out and due before
+        ``now`` (an ISO timestamp). ``text`` is looked up in the search index
+        (see ``_search_text`` for the fields covered).
+        """
+        with self.lock:
+            index = self._sorted[collection][sort]
+            records = self._records[collection]
+            within: Optional[set] = None
+            if status == "overdue":
+                if now is None:
+                    raise ValueError("The overdue filter needs the current time.")
+                within = set(self._due.ids_before(now))
+            elif status is not None:
+                within = self._by_status.get(status, set())
+            if checked_out_to is not None:
+                borrowed = self._borrowed.get(checked_out_to, set())
+                within = borrowed if within is None else within & borrowed
+            if text and collection in self._search:
+                # A query without searchable words matches nothing.
+                found = self._search[collection].search(text) or set()
+                within = found if within is None else within & found
+
+            ordered = index.iter_ids(after, reverse=descending, within=within)
+            ids = islice(ordered, None if limit is None else limit + 1)
+            items = [records[record_id] for record_id in ids]
+            next_position = None
+            if limit is not None and len(items) > limit:
+                items = items[:limit]
+                next_position = index.position(items[-1]["id"])
+            total = len(records if within is None else within)
+            return Page(items, next_position, total)
+
+    def _search_text(self, collection: str, record: dict) -> str:
+        if collection == "equipment":
+            borrower = self.get("people", record.get("checked_out_to")) or {}
+            fields = (
+                record.get("name"),
+                record.get("tag"),
+                record.get("description"),
+                borrower.get("name"),
+            )
+        else:
+            fields = (record.get("name"), record.get("email"), record.get("role"))
+        return " ".join(value for value in fields if value)
+
+    def transact(self, operation: Callable[["DataStore"], Mutation]) -> Any:
+        """Run ``operation`` and commit its mutation, retrying on conflicts.
+
+        ``operation`` must not modify records it reads; it returns copies in
+        its changes instead, so a retried attempt starts from clean state.
+        Exceptions it raises (validation errors) propagate unchanged.
+
+        With a ``commit_window`` the call is handed to the group committer and
+        returns once the batch it joined has been persisted.
+        """
+        write = _PendingWrite(operation)
+        if self._queue is None:
+            self._commit_batch([write])
+        else:
+            self._queue.put(write)
+            write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _run_committer(self, writes: "queue.Queue[_PendingWrite]", window: float) -> None:
+        while True:
+            batch = [writes.get()]
+            deadline = time.monotonic() + window
+            while True:
+                try:
+                    batch.append(writes.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List["_PendingWrite"]) -> None:
+        """Plan each write in order, then persist all of them with one commit."""
+        try:
+            with self._write_lock:
+                for _ in range(MAX_COMMIT_ATTEMPTS):
+                    with self.lock:
+                        self.refresh()
+                        base_version = self.version
+                        outcomes, mutations = self.plan([write.operation for write in batch])
+                    for write, (result, error) in zip(batch, outcomes):
+                        write.result, write.error = result, error
+                    if not mutations:
+                        return
+                    try:
+                        version = self.storage.commit_many(
+                            mutations, expected_version=base_version
+                        )
+                    except ConflictError:
+                        continue
+                    self.apply_committed(mutations, version)
+                    return
+            conflict = ConflictError("Too many concurrent writers; try again.")
+            for write in batch:
+                write.error = write.error or conflict
+        except Exception as exc:
+            for write in batch:
+                write.error = write.error or exc
+        finally:
+            for write in batch:
+                write.done.set()
+
+    def plan(
+        self, operations: List[Callable[["DataStore"], Mutation]]
+    ) -> Tuple[List[Tuple[Any, Optional[Exception]]], List[MutationRecord]]:
+        """Run ``operations`` in order without committing or keeping their changes.
+
+        Each operation sees the changes of those before it. Returns every
+        operation's ``(result, error)`` and the mutations to commit; the
+        in-memory state is left as it was. This is ``transact`` split in two
+        for a caller that commits the mutations itself and then hands them to
+        ``apply_committed``.
+        """
+        outcomes: List[Tuple[Any, Optional[Exception]]] = []
+        mutations: List[MutationRecord] = []
+        undo: List[List[Dict[str, Any]]] = []
+        with self.lock:
+            try:
+                for operation in operations:
+                    try:
+                        mutation = operation(self)
+                    except Exception as exc:
+                        outcomes.append((None, exc))
+                        continue
+                    outcomes.append((mutation.result, None))
+                    undo.append(self._apply(mutation.changes))
+                    mutations.append((mutation.op, mutation.changes))
+            finally:
+                self._revert(undo)
+        return outcomes, mutations
+
+    def apply_committed(self, mutations: List[MutationRecord], version: int) -> None:
+        """Apply ``mutations`` from ``plan`` once they are committed; ``version`` is the last's."""
+        with self.lock:
+            base_version = version - len(mutations)
+            for offset, (_, changes) in enumerate(mutations, 1):
+                if base_version + offset <= self.version:
+                    # A concurrent ``refresh`` already read it back from the backend.
+                    continue
+                self._apply(changes)
+                self._log(base_version + offset, changes)
+            self.version = version
+
+    def refresh(self) -> None:
+        """Catch up with mutations other processes committed to the backend."""
+        with self.lock:
+            self.catch_up(self.storage.changes_since(self.version))
+
+    def catch_up(self, entries: Optional[List[Dict[str, Any]]]) -> None:
+        """Apply ``storage.changes_since(self.version)``; ``None`` reloads everything."""
+        with self.lock:
+            if entries is None:
+                self._load()
+                return
+            for entry in entries:
+                self._apply(entry["changes"])
+                self.version = entry["version"]
+                self._log(entry["version"], entry["changes"])
+
+    def reloaded(self) -> "DataStore":
+        """Return a new store loaded from the same backend, for ``adopt``.
+
+        Touches only the new store, so it can run in another thread while this
+        one keeps serving reads.
+        """
+        return DataStore(self.storage)
+
+    def adopt(self, other: "DataStore") -> None:
+        """Take over the records and indexes of ``other`` (from ``reloaded``)."""
+        with self.lock:
+            for name in STATE_ATTRIBUTES:
+                setattr(self, name, getattr(other, name))
+            self.changes.reset(self.version)
+
+    def _log(self, version: int, changes: List[Dict[str, Any]]) -> None:
+        for change in changes:
+            self.collection_versions[change["collection"]] = version
+        self.changes.append(version, changes)
+
+    def _apply(self, changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply changes in memory and return the changes that undo them."""
+        undo = []
+        if len(changes) >= DEFERRED_INDEX_CHANGES:
+            for indexes in self._sorted.values():
+                for index in indexes.values():
+                    index.defer()
+            for search in self._search.values():
+                search.defer()
+            self._due.defer()
+        for change in changes:
+            collection = change["collection"]
+            record_id = change["record"]["id"] if change["action"] == "put" else change["id"]
+            previous = self._records[collection].get(record_id)
+            undo.append(put(collection, previous) if previous else delete(collection, record_id))
+            if change["action"] == "put" and not is_history(collection, change["record"]):
+                self._index(collection, change["record"])
+            elif previous is not None:
+                del self._records[collection][record_id]
+                self._unindex(collection, previous)
+        undo.reverse()
+        return undo
+
+    def _revert(self, undo: List[List[Dict[str, Any]]]) -> None:
+        for changes in reversed(undo):
+            self._apply(changes)
+
+    def _index(self, collection: str, record: dict, incremental: bool = True) -> None:
+        previous = self._records[collection].get(record["id"])
+        self._records[collection][record["id"]] = record
+        if incremental:
+            self._sort(collection, record)
+            self._reindex_text(collection, record)
+        if collection == "equipment":
+            self._set_borrower(record["id"], record.get("checked_out_to"))
+            if previous is not None:
+                self._by_status[previous.get("status")].discard(record["id"])
+            self._by_status.setdefault(record.get("status"), set()).add(record["id"])
+            if record.get("status") == "checked_out" and record.get("due_at"):
+                self._due.add(record["id"], record["due_at"])
+            else:
+                self._due.discard(record["id"])
+        elif collection == "checkouts":
+            self._active_checkouts[record["equipment_id"]] = record
+
+    def _unindex(self, collection: str, record: dict) -> None:
+        for index in self._sorted[collection].values():
+            index.discard(record["id"])
+        if collection in self._search:
+            self._search[collection].discard(record["id"])
+        if collection == "people":
+            self._reindex_borrowed(record["id"])
+        if collection == "equipment":
+            self._set_borrower(record["id"], None)
+            self._by_status[record.get("status")].discard(record["id"])
+            self._due.discard(record["id"])
+        elif collection == "checkouts":
+            if self._is_active(record):
+                del self._active_checkouts[record["equipment_id"]]
+
+    def _sort(self, collection: str, record: dict) -> None:
+        indexes = self._sorted[collection]
+        if record["id"] not in indexes["created"]:
+            self._created += 1
+            indexes["created"].add(record["id"], self._created)
+        for name, key in SORT_FIELDS[collection].items():
+            indexes[name].add(record["id"], key(record))
+
+    def _reindex_text(self, collection: str, record: dict) -> None:
+        if collection in self._search:
+            self._search[collection].add(record["id"], self._search_text(collection, record))
+        if collection == "people":
+            self._reindex_borrowed(record["id"])
+
+    def _reindex_borrowed(self, person_id: str) -> None:
+        # Equipment is searchable by its borrower's name.
+        equipment = self._records["equipment"]
+        for equipment_id in self._borrowed.get(person_id, ()):
+            self._search["equipment"].add(
+                equipment_id, self._search_text("equipment", equipment[equipment_id])
+            )
+
+    def _is_active(self, checkout: dict) -> bool:
+        active = self._active_checkouts.get(checkout["equipment_id"])
+        return active is not None and active["id"] == checkout["id"]
+
+    def _set_borrower(self, equipment_id: str, person_id: Optional[str]) -> None:
+        previous = self._borrowers.pop(equipment_id, None)
+        if previous is not None:
+            self._borrowed[previous].discard(equipment_id)
+            if not self._borrowed[previous]:
+                del self._borrowed[previous]
+        if person_id is not None:
+            self._borrowers[equipment_id] = person_id
+            self._borrowed.setdefault(person_id, set()).add(equipment_id)
+
+    def _load(self) -> None:
+        data = self.storage.load()
+        self._records = {name: {} for name in COLLECTIONS}
+        self._active_checkouts = {}
+        self._borrowers = {}
+        self._borrowed = {}
+        self._by_status = {}
+        self._due = SortedIndex()
+        self._due.defer()
+        self._sorted = {}
+        self._search = {"equipment": SearchIndex(), "people": SearchIndex()}
+        for collection in COLLECTIONS:
+            for record in data.get(collection, []):
+                if not is_history(collection, record):
+                    self._index(collection, record, incremental=False)
+        for collection, records in self._records.items():
+            if collection in self._search:
+                for record_id, record in records.items():
+                    self._search[collection].add(record_id, self._search_text(collection, record))
+            self._sorted[collection] = {
+                name: SortedIndex.build(
+                    (record_id, key(record)) for record_id, record in records.items()
+                )
+                for name, key in SORT_FIELDS[collection].items()
+            }
+            self._sorted[collection]["created"] = SortedIndex.build(
+                (record_id, position) for position, record_id in enumerate(records, 1)
+            )
+        self._created = max(len(records) for records in self._records.values())
+        self.version = self.storage.version
+        self.changes.reset(self.version)
+        self.collection_versions = {name: self.version for name in COLLECTIONS}
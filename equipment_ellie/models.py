@@ -13,7 +13,7 @@ class EquipmentStatus(str, Enum):
     CHECKED_OUT = "checked_out"
 
 
-@dataclass
+@dataclass(slots=True)
 class Equipment:
     """Represents a piece of equipment."""
 
@@ -22,7 +22,7 @@ class Equipment:
     status: EquipmentStatus = EquipmentStatus.AVAILABLE
 
 
-@dataclass
+@dataclass(slots=True)
 class Checkout:
     """Represents a checkout record for equipment."""
 
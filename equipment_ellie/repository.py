@@ -2,37 +2,157 @@
 
 from __future__ import annotations
 
+from bisect import bisect_left, insort
 from dataclasses import replace
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from .models import Checkout
 
 
 class CheckoutRepository:
-    """In-memory repository for checkout records."""
+    """In-memory repository for checkout records.
+
+    Open checkouts are keyed by equipment id; closed ones are moved to a
+    separate history segment, so active lookups never touch past records.
+    Secondary indexes give each item's history and the open checkouts in
+    due-date order without scanning.
+    """
 
     def __init__(self) -> None:
-        self._checkouts: Dict[int, Checkout] = {}
+        self._active: Dict[int, Checkout] = {}
+        # The same open checkouts, keyed by checkout id.
+        self._active_by_id: Dict[int, Checkout] = {}
+        self._history: Dict[int, Checkout] = {}
+        self._history_by_equipment: Dict[int, List[int]] = {}
+        # (due_at, equipment_id) for every open checkout, sorted.
+        self._due: List[Tuple[datetime, int]] = []
         self._next_id = 1
 
     def create(self, checkout: Checkout) -> Checkout:
+        """Store ``checkout`` under a new id.
+
+        Raises:
+            ValueError: If it is open and its equipment already has an open checkout.
+        """
         checkout_with_id = replace(checkout, id=self._next_id)
-        self._checkouts[self._next_id] = checkout_with_id
+        self._store(checkout_with_id)
         self._next_id += 1
         return checkout_with_id
 
-    def get_active_for_equipment(self, equipment_id: int) -> Optional[Checkout]:
-        return next(
-            (
-                checkout
-                for checkout in self._checkouts.values()
-                if checkout.equipment_id == equipment_id
-                and checkout.checked_in_at is None
-            ),
-            None,
+    def create_many(self, checkouts: Iterable[Checkout]) -> List[Checkout]:
+        """Store several checkouts, assigning ids in order.
+
+        The due-date index is rebuilt once at the end rather than per record,
+        which keeps loading large histories linear apart from one sort.
+
+        Raises:
+            ValueError: If an open checkout is for equipment that already has
+                one, here or earlier in ``checkouts``; nothing is stored then.
+        """
+        pending = list(checkouts)
+        opening = set()
+        for checkout in pending:
+            if checkout.checked_in_at is None:
+                if checkout.equipment_id in self._active or checkout.equipment_id in opening:
+                    raise ValueError(
+                        f"Equipment {checkout.equipment_id} already has an active checkout"
+                    )
+                opening.add(checkout.equipment_id)
+        created = []
+        for offset, checkout in enumerate(pending):
+            checkout_with_id = replace(checkout, id=self._next_id + offset)
+            self._store(checkout_with_id, index_due=False)
+            created.append(checkout_with_id)
+        self._next_id += len(created)
+        self._due.extend(
+            (item.due_at, item.equipment_id) for item in created if item.checked_in_at is None
         )
+        self._due.sort()
+        return created
+
+    def get_active_for_equipment(self, equipment_id: int) -> Optional[Checkout]:
+        return self._active.get(equipment_id)
+
+    def history(self) -> List[Checkout]:
+        """Return closed checkouts in the order they were closed."""
+        return list(self._history.values())
+
+    def history_for_equipment(self, equipment_id: int) -> List[Checkout]:
+        """Return closed checkouts of one item, oldest first."""
+        checkout_ids = self._history_by_equipment.get(equipment_id, ())
+        return [self._history[checkout_id] for checkout_id in checkout_ids]
+
+    def due_before(self, when: datetime) -> List[Checkout]:
+        """Return open checkouts due before ``when``, earliest first."""
+        end = bisect_left(self._due, (when,))
+        return [self._active[equipment_id] for _, equipment_id in self._due[:end]]
 
     def update(self, checkout: Checkout) -> None:
-        if checkout.id not in self._checkouts:
+        """Replace the stored checkout with the same id, re-indexing it.
+
+        Raises:
+            KeyError: If no checkout has that id.
+            ValueError: If it is open and its equipment already has another
+                open checkout; nothing is changed then.
+        """
+        previous = self._active_by_id.get(checkout.id) or self._history.get(checkout.id)
+        if previous is None:
             raise KeyError(f"Checkout {checkout.id} not found")
-        self._checkouts[checkout.id] = checkout
+        active = self._active.get(checkout.equipment_id)
+        if checkout.checked_in_at is None and active is not None and active.id != checkout.id:
+            raise ValueError(f"Equipment {checkout.equipment_id} already has an active checkout")
+        if previous.checked_in_at is None:
+            self._remove_active(previous)
+        else:
+            self._remove_history(previous)
+        self._store(checkout)
+
+    def checkin_many(
+        self, equipment_ids: Iterable[int], checked_in_at: datetime
+    ) -> List[Checkout]:
+        """Close the open checkout of every listed item.
+
+        Raises:
+            KeyError: If an item has no open checkout; nothing is changed then.
+        """
+        closing = []
+        for equipment_id in dict.fromkeys(equipment_ids):
+            active = self._active.get(equipment_id)
+            if active is None:
+                raise KeyError(f"No active checkout for equipment {equipment_id}")
+            closing.append(active)
+        closed = []
+        for active in closing:
+            self._remove_active(active)
+            updated = replace(active, checked_in_at=checked_in_at)
+            self._store(updated)
+            closed.append(updated)
+        return closed
+
+    def _store(self, checkout: Checkout, index_due: bool = True) -> None:
+        if checkout.checked_in_at is None:
+            if checkout.equipment_id in self._active:
+                raise ValueError(
+                    f"Equipment {checkout.equipment_id} already has an active checkout"
+                )
+            self._active[checkout.equipment_id] = checkout
+            self._active_by_id[checkout.id] = checkout
+            if index_due:
+                insort(self._due, (checkout.due_at, checkout.equipment_id))
+        else:
+            self._history[checkout.id] = checkout
+            # Ids grow with creation time, so sorted ids keep the history oldest first.
+            insort(self._history_by_equipment.setdefault(checkout.equipment_id, []), checkout.id)
+
+    def _remove_active(self, checkout: Checkout) -> None:
+        del self._active[checkout.equipment_id]
+        del self._active_by_id[checkout.id]
+        del self._due[bisect_left(self._due, (checkout.due_at, checkout.equipment_id))]
+
+    def _remove_history(self, checkout: Checkout) -> None:
+        del self._history[checkout.id]
+        ids = self._history_by_equipment[checkout.equipment_id]
+        ids.remove(checkout.id)
+        if not ids:
+            del self._history_by_equipment[checkout.equipment_id]
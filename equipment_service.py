@@ -2,7 +2,8 @@ import uuid
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
-from storage import JsonStore
+from journal import delete, put
+from storage import Storage
 
 
 class ValidationError(ValueError):
@@ -11,11 +12,12 @@ class ValidationError(ValueError):
 
 @dataclass
 class EquipmentService:
-    store: JsonStore
+    store: Storage
 
-    def list_equipment(self) -> List[Dict[str, Any]]:
-        data = self.store.load()
-        return list(data.get("equipment", []))
+    def list_equipment(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if limit is None:
+            return self.store.list("equipment")[offset:]
+        return self.store.list_page("equipment", offset, limit)
 
     def get_equipment(self, equipment_id: str) -> Dict[str, Any]:
         equipment = self._find_equipment(equipment_id)
@@ -30,15 +32,13 @@ class EquipmentService:
         status: Optional[str] = None,
     ) -> Dict[str, Any]:
         self._require_field("name", name)
-        data = self.store.load()
         equipment = {
             "id": str(uuid.uuid4()),
             "name": name,
             "description": description,
             "status": status,
         }
-        data.setdefault("equipment", []).append(equipment)
-        self.store.save(data)
+        self.store.commit("create", [put("equipment", equipment)])
         return equipment
 
     def update_equipment(
@@ -50,8 +50,7 @@ class EquipmentService:
     ) -> Dict[str, Any]:
         if name is None and description is None and status is None:
             raise ValidationError("At least one field must be provided to update equipment")
-        data = self.store.load()
-        equipment = self._find_equipment(equipment_id, data)
+        equipment = self._find_equipment(equipment_id)
         if equipment is None:
             raise KeyError(f"Equipment '{equipment_id}' not found")
         if name is not None:
@@ -61,28 +60,17 @@ class EquipmentService:
             equipment["description"] = description
         if status is not None:
             equipment["status"] = status
-        self.store.save(data)
+        self.store.commit("update", [put("equipment", equipment)])
         return equipment
 
     def delete_equipment(self, equipment_id: str) -> None:
-        data = self.store.load()
-        equipment = self._find_equipment(equipment_id, data)
+        equipment = self._find_equipment(equipment_id)
         if equipment is None:
             raise KeyError(f"Equipment '{equipment_id}' not found")
-        data["equipment"] = [
-            item for item in data.get("equipment", []) if item["id"] != equipment_id
-        ]
-        self.store.save(data)
+        self.store.commit("delete", [delete("equipment", equipment_id)])
 
-    def _find_equipment(
-        self, equipment_id: str, data: Optional[Dict[str, Any]] = None
-    ) -> Optional[Dict[str, Any]]:
-        if data is None:
-            data = self.store.load()
-        for equipment in data.get("equipment", []):
-            if equipment.get("id") == equipment_id:
-                return equipment
-        return None
+    def _find_equipment(self, equipment_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get("equipment", equipment_id)
 
     @staticmethod
     def _require_field(field_name: str, value: Optional[str]) -> None:
@@ -0,0 +1,82 @@
+"""Server-Sent Events fan-out of the data store's change log."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Iterator, Optional
+
+import codec
+import inventory
+from datastore import DataStore
+
+# Idle streams send a comment this often so proxies and dead clients notice.
+HEARTBEAT_SECONDS = 15.0
+# How often the hub looks for writes made by other worker processes.
+POLL_SECONDS = 1.0
+
+
+def frame(delta: dict) -> str:
+    """Format an ``inventory.delta`` as an SSE ``change`` or ``resync`` event."""
+    event = "resync" if delta["resync"] else "change"
+    data = codec.dumps(delta).decode("utf-8")
+    return f"id: {delta['version']}\nevent: {event}\ndata: {data}\n\n"
+
+
+class EventHub:
+    """Streams store changes to any number of subscribers.
+
+    Subscribers block on the change log's condition variable, so an idle
+    stream costs a parked thread and no polling of its own. Writes from this
+    process wake them directly; one shared poller picks up writes from other
+    processes while anyone is subscribed.
+    """
+
+    def __init__(self, store: DataStore, poll_interval: float = POLL_SECONDS) -> None:
+        self.store = store
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = 0
+        self._poller: Optional[threading.Thread] = None
+
+    def subscribe(self, since: int) -> Iterator[str]:
+        """Yield SSE frames for every change after ``since``, forever."""
+        self._join()
+        try:
+            yield "retry: 3000\n\n"
+            version = since
+            while True:
+                if version == self.store.version and not self.store.changes.wait(
+                    version, HEARTBEAT_SECONDS
+                ):
+                    yield ": keepalive\n\n"
+                    continue
+                delta = inventory.delta(self.store, version)
+                if delta["version"] == version:
+                    continue
+                version = delta["version"]
+                yield frame(delta)
+        finally:
+            self._leave()
+
+    def _join(self) -> None:
+        with self._lock:
+            self._subscribers += 1
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(
+                    target=self._poll, name="event-hub-poller", daemon=True
+                )
+                self._poller.start()
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._subscribers -= 1
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._poller = None
+                    return
+            self.store.refresh()
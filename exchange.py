@@ -0,0 +1,242 @@
+"""Streaming CSV and NDJSON import/export of equipment, people and checkouts.
+
+Exports are written row by row from the storage iterators, so their memory use
+does not grow with the number of rows. Imports read rows lazily and commit
+them in chunks, matching existing records by equipment tag or person email;
+they keep one tag or email per record in memory, not the records.
+"""
+
+from __future__ import annotations
+
+import csv
+import uuid
+from dataclasses import dataclass
+from itertools import chain
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import codec
+from journal import put
+from storage import Storage, is_history
+
+FORMATS = ("csv", "ndjson")
+
+EXPORT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "equipment": ("id", "name", "tag", "description", "status", "checked_out_to", "due_at"),
+    "people": ("id", "name", "email", "role"),
+    "checkouts": (
+        "id",
+        "equipment_id",
+        "person_id",
+        "checked_out_at",
+        "due_at",
+        "checked_in_at",
+        "handoff",
+        "handoff_from",
+    ),
+}
+IMPORT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "equipment": ("name", "tag", "description"),
+    "people": ("name", "email", "role"),
+}
+# Imported rows that share this field (case-insensitively) with a stored
+# record update it instead of creating a duplicate.
+DEDUPE_FIELDS = {"equipment": "tag", "people": "email"}
+
+# Rows committed per transaction while importing.
+IMPORT_CHUNK_ROWS = 1000
+
+Mapping = List[Tuple[str, str]]
+
+
+@dataclass
+class ImportSummary:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+
+def format_for(path: Optional[str], requested: Optional[str]) -> str:
+    """Return ``requested``, or guess the format from the file suffix (CSV by default)."""
+    if requested:
+        return requested
+    if path and Path(path).suffix.lower() in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return "csv"
+
+
+def parse_mapping(pairs: Iterable[str], collection: str, fields: Tuple[str, ...]) -> Mapping:
+    """Parse ``COLUMN=FIELD`` pairs into ``(column, field)`` tuples, in order."""
+    mapping = []
+    for pair in pairs:
+        column, sep, field = pair.partition("=")
+        if not sep or not column:
+            raise ValueError(f"Invalid mapping '{pair}'; expected COLUMN=FIELD")
+        if field not in fields:
+            raise ValueError(
+                f"Unknown {collection} field '{field}'; expected one of {', '.join(fields)}"
+            )
+        mapping.append((column, field))
+    return mapping
+
+
+def export_records(
+    store: Storage, collection: str, handle: IO[str], fmt: str, mapping: Mapping
+) -> int:
+    """Write every record of ``collection`` to ``handle``; return the row count.
+
+    ``checkouts`` includes closed checkouts from the history. ``mapping``
+    selects and renames columns; by default every field is written under
+    its own name.
+    """
+    columns = mapping or [(field, field) for field in EXPORT_FIELDS[collection]]
+    rows = 0
+    if fmt == "csv":
+        writer = csv.writer(handle)
+        writer.writerow([column for column, _ in columns])
+        for record in _iter_records(store, collection):
+            writer.writerow([_cell(record.get(field)) for _, field in columns])
+            rows += 1
+    else:
+        for record in _iter_records(store, collection):
+            row = {column: record.get(field) for column, field in columns}
+            handle.write(codec.dumps(row).decode("utf-8") + "\n")
+            rows += 1
+    return rows
+
+
+def import_records(
+    store: Storage,
+    collection: str,
+    handle: IO[str],
+    fmt: str,
+    mapping: Mapping,
+    on_error: Callable[[int, str], None],
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+) -> ImportSummary:
+    """Create or update ``collection`` records from the rows read from ``handle``.
+
+    A row whose tag (equipment) or email (people) matches a stored record, or
+    an earlier row, updates that record; other rows create one and need a
+    name. Invalid rows are passed to ``on_error`` with their line number and
+    skipped. Changes are committed every ``chunk_rows`` rows.
+
+    Only the tag or email of each record is kept in memory, with its id;
+    stored records that rows update are fetched a chunk at a time.
+    """
+    columns = mapping or [(field, field) for field in IMPORT_FIELDS[collection]]
+    dedupe_field = DEDUPE_FIELDS[collection]
+    known: Dict[str, str] = {}
+    for record in store.iter_records(collection):
+        key = _dedupe_key(record.get(dedupe_field))
+        if key:
+            known[key] = record["id"]
+    summary = ImportSummary()
+    pending: Dict[str, Dict[str, Any]] = {}
+    # Rows updating stored records not yet fetched: (line, record id, values).
+    deferred: List[Tuple[int, str, Dict[str, str]]] = []
+
+    def update(line: int, existing: Dict[str, Any], values: Dict[str, str]) -> None:
+        record = dict(existing, **values)
+        if record == existing:
+            summary.unchanged += 1
+        elif not record.get("name"):
+            summary.failed += 1
+            on_error(line, "Name cannot be empty.")
+        else:
+            summary.updated += 1
+            pending[record["id"]] = record
+
+    def flush() -> None:
+        if deferred:
+            stored = store.get_many(collection, {record_id for _, record_id, _ in deferred})
+            for line, record_id, values in deferred:
+                existing = pending.get(record_id) or stored.get(record_id)
+                if existing is None:
+                    summary.failed += 1
+                    on_error(line, "The matching record was deleted during the import.")
+                else:
+                    update(line, existing, values)
+            deferred.clear()
+        _commit(store, collection, pending)
+
+    for line, row in _read_rows(handle, fmt):
+        if not isinstance(row, dict):
+            summary.failed += 1
+            on_error(line, "Row must be a JSON object.")
+            continue
+        values = {
+            field: "" if row[column] is None else str(row[column]).strip()
+            for column, field in columns
+            if column in row
+        }
+        key = _dedupe_key(values.get(dedupe_field))
+        record_id = known.get(key) if key else None
+        if record_id in pending:
+            update(line, pending[record_id], values)
+        elif record_id is not None:
+            deferred.append((line, record_id, values))
+        elif not values.get("name"):
+            summary.failed += 1
+            on_error(line, "Name is required.")
+        else:
+            record = _new_record(collection, values)
+            summary.created += 1
+            if key:
+                known[key] = record["id"]
+            pending[record["id"]] = record
+        if len(pending) + len(deferred) >= chunk_rows:
+            flush()
+    flush()
+    return summary
+
+
+def _iter_records(store: Storage, collection: str) -> Iterator[Dict[str, Any]]:
+    if collection != "checkouts":
+        return store.iter_records(collection)
+    # Some backends keep closed checkouts elsewhere; they are streamed separately.
+    records = store.iter_records("checkouts")
+    active = (record for record in records if not is_history("checkouts", record))
+    return chain(store.iter_history(), active)
+
+
+def _read_rows(handle: IO[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    if fmt == "csv":
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(handle, 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, codec.loads(text)
+        except ValueError:
+            yield line, None
+
+
+def _new_record(collection: str, values: Dict[str, str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"id": str(uuid.uuid4())}
+    record.update((field, values.get(field, "")) for field in IMPORT_FIELDS[collection])
+    if collection == "equipment":
+        record.update(status="available", checked_out_to=None, due_at=None)
+    return record
+
+
+def _commit(store: Storage, collection: str, pending: Dict[str, Dict[str, Any]]) -> None:
+    if pending:
+        store.commit("import", [put(collection, record) for record in pending.values()])
+        pending.clear()
+
+
+def _dedupe_key(value: Any) -> str:
+    return str(value).strip().casefold() if value else ""
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
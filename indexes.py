@@ -0,0 +1,219 @@
+"""Secondary indexes kept by the in-memory data store."""
+
+from __future__ import annotations
+
+import heapq
+import re
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Collection, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Keys are plain str/int values so a position survives a JSON round trip in a
+# pagination cursor. Ties are broken by record id.
+Position = Tuple[Any, str]
+
+# Walking the whole index and skipping non-members stops early when members
+# are dense; below this fraction of the index, ordering the members with a heap
+# is cheaper.
+_SUBSET_HEAP_RATIO = 4
+
+# Once a search is down to this many candidates, remaining query tokens are
+# checked against each candidate's own tokens.
+_SEARCH_FILTER_LIMIT = 256
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into case-folded word tokens."""
+    return _TOKEN.findall(text.casefold())
+
+
+class _Descending:
+    """Heap entry wrapper that inverts the ordering of a position."""
+
+    __slots__ = ("position",)
+
+    def __init__(self, position: Position) -> None:
+        self.position = position
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.position < self.position
+
+
+class SortedIndex:
+    """Record ids ordered by a sort key, supporting keyset pagination.
+
+    Single changes keep the order up to date with ``insort``. Before a large
+    batch of changes call ``defer``: the order is then rebuilt with one sort
+    on the next read instead.
+    """
+
+    def __init__(self) -> None:
+        self._entries: List[Position] = []
+        self._keys: Dict[str, Any] = {}
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, record_id: object) -> bool:
+        return record_id in self._keys
+
+    @classmethod
+    def build(cls, keys: Iterable[Tuple[str, Any]]) -> "SortedIndex":
+        """Create an index from ``(record_id, key)`` pairs, sorted on first read."""
+        index = cls()
+        index._keys = dict(keys)
+        index._stale = True
+        return index
+
+    def defer(self) -> None:
+        self._stale = True
+
+    def add(self, record_id: str, key: Any) -> None:
+        if record_id in self._keys:
+            if self._keys[record_id] == key:
+                return
+            self.discard(record_id)
+        self._keys[record_id] = key
+        if not self._stale:
+            insort(self._entries, (key, record_id))
+
+    def discard(self, record_id: str) -> None:
+        if record_id not in self._keys:
+            return
+        key = self._keys.pop(record_id)
+        if not self._stale:
+            del self._entries[bisect_left(self._entries, (key, record_id))]
+
+    def position(self, record_id: str) -> Position:
+        return (self._keys[record_id], record_id)
+
+    def iter_ids(
+        self,
+        after: Optional[Position] = None,
+        reverse: bool = False,
+        within: Optional[Collection[str]] = None,
+    ) -> Iterator[str]:
+        """Yield ids in key order, starting after ``after``.
+
+        ``within`` restricts the result to a set of ids. Small sets are
+        ordered on their own instead of scanning the whole index.
+        """
+        if within is not None and len(within) * _SUBSET_HEAP_RATIO < len(self._keys):
+            return self._iter_subset(within, after, reverse)
+        return self._iter_entries(self._sorted_entries(), after, reverse, within)
+
+    def ids_before(self, key: Any) -> List[str]:
+        """Return ids whose key is below ``key``, in order."""
+        entries = self._sorted_entries()
+        return [record_id for _, record_id in entries[: bisect_left(entries, (key,))]]
+
+    def _sorted_entries(self) -> List[Position]:
+        if self._stale:
+            self._entries = sorted((key, record_id) for record_id, key in self._keys.items())
+            self._stale = False
+        return self._entries
+
+    def _iter_subset(
+        self, within: Collection[str], after: Optional[Position], reverse: bool
+    ) -> Iterator[str]:
+        keys = self._keys
+        positions = [(keys[record_id], record_id) for record_id in within if record_id in keys]
+        if after is not None:
+            positions = [p for p in positions if (p < after if reverse else p > after)]
+        # Heapify is linear; each popped id costs log(len(within)).
+        heap: List[Any] = [_Descending(p) for p in positions] if reverse else positions
+        heapq.heapify(heap)
+        while heap:
+            entry = heapq.heappop(heap)
+            yield (entry.position if reverse else entry)[1]
+
+    @staticmethod
+    def _iter_entries(
+        entries: List[Position],
+        after: Optional[Position],
+        reverse: bool,
+        within: Optional[Collection[str]],
+    ) -> Iterator[str]:
+        if reverse:
+            end = bisect_left(entries, after) if after is not None else len(entries)
+            positions = range(end - 1, -1, -1)
+        else:
+            start = bisect_right(entries, after) if after is not None else 0
+            positions = range(start, len(entries))
+        for position in positions:
+            record_id = entries[position][1]
+            if within is None or record_id in within:
+                yield record_id
+
+
+class SearchIndex:
+    """Inverted index from word tokens to record ids, with prefix lookup.
+
+    A query matches a record when every query token is a prefix of one of the
+    record's tokens, so "cam 50" finds "Camera 5000". Prefixes are resolved
+    with a sorted vocabulary, which is built on the first search and then
+    kept up to date until ``defer`` drops it ahead of a large batch.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._tokens: Dict[str, FrozenSet[str]] = {}
+        self._vocabulary: Optional[List[str]] = None
+
+    def add(self, record_id: str, text: str) -> None:
+        tokens = frozenset(tokenize(text))
+        previous = self._tokens.get(record_id, frozenset())
+        if tokens == previous:
+            return
+        self._remove_tokens(record_id, previous - tokens)
+        for token in tokens - previous:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                if self._vocabulary is not None:
+                    insort(self._vocabulary, token)
+            postings.add(record_id)
+        self._tokens[record_id] = tokens
+
+    def defer(self) -> None:
+        self._vocabulary = None
+
+    def discard(self, record_id: str) -> None:
+        self._remove_tokens(record_id, self._tokens.pop(record_id, frozenset()))
+
+    def search(self, query: str) -> Optional[Set[str]]:
+        """Return ids matching every token of ``query`` (``None`` if it has none)."""
+        tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not tokens:
+            return None
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        matches: Optional[Set[str]] = None
+        for token in tokens:
+            if matches is not None and len(matches) <= _SEARCH_FILTER_LIMIT:
+                # Cheaper to check the few candidates than to merge postings.
+                matches = {
+                    record_id
+                    for record_id in matches
+                    if any(word.startswith(token) for word in self._tokens[record_id])
+                }
+                continue
+            found: Set[str] = set()
+            start = bisect_left(self._vocabulary, token)
+            for word in self._vocabulary[start:bisect_left(self._vocabulary, token + "\U0010ffff")]:
+                found |= self._postings[word]
+            matches = found if matches is None else matches & found
+            if not matches:
+                break
+        return matches
+
+    def _remove_tokens(self, record_id: str, tokens: Iterable[str]) -> None:
+        for token in tokens:
+            postings = self._postings[token]
+            postings.discard(record_id)
+            if not postings:
+                del self._postings[token]
+                if self._vocabulary is not None:
+                    del self._vocabulary[bisect_left(self._vocabulary, token)]
@@ -0,0 +1,521 @@
+"""Equipment library operations shared by the API servers.
+
+Each operation reads the current state from a ``DataStore`` and returns a
+``Mutation`` describing the records to write; ``DataStore.transact`` commits
+it. Records read from the store are copied before being changed so that an
+operation can be retried after a write conflict.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import codec
+from datastore import SORT_FIELDS, DataStore, Mutation, Page
+from journal import delete, put
+
+MAX_PAGE_SIZE = 500
+SEARCH_LIMIT = 20
+MAX_DUE_WINDOW_HOURS = 24 * 365
+EQUIPMENT_STATUSES = ("available", "checked_out", "overdue")
+NDJSON_MIMETYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+BULK_ACTIONS = {"POST": "create", "PUT": "update", "DELETE": "delete"}
+
+
+class NotFoundError(LookupError):
+    """Raised when a referenced record does not exist."""
+
+
+class ValidationError(ValueError):
+    """Raised when a request cannot be applied to the current state."""
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def _due_iso() -> str:
+    return (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0).isoformat() + "Z"
+
+
+def _iso_in(hours: float) -> str:
+    return (datetime.utcnow() + timedelta(hours=hours)).replace(microsecond=0).isoformat() + "Z"
+
+
+def _require(store: DataStore, collection: str, record_id: Optional[str], label: str) -> dict:
+    record = store.get(collection, record_id)
+    if not record:
+        raise NotFoundError(f"{label} not found.")
+    return dict(record)
+
+
+def _encode_cursor(sort: str, position: Tuple[Any, str]) -> str:
+    raw = json.dumps([sort, *position], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[Any, str]:
+    """Return the position in ``cursor``, which must come from a list with the same ``sort``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, record_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValidationError("Invalid cursor.") from None
+    if cursor_sort != sort:
+        raise ValidationError("The cursor belongs to a list with a different sort.")
+    # ``created`` positions are numbers; every other sort key is text.
+    key_type = int if sort.lstrip("-") == "created" else str
+    if type(key) is not key_type or not isinstance(record_id, str):
+        raise ValidationError("Invalid cursor.")
+    return key, record_id
+
+
+def _limit(params: Mapping[str, str], default: Optional[int] = None) -> Optional[int]:
+    if not params.get("limit"):
+        return default
+    try:
+        limit = int(params["limit"])
+    except ValueError:
+        raise ValidationError("limit must be an integer.") from None
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValidationError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return limit
+
+
+def list_records(
+    store: DataStore, collection: str, params: Mapping[str, str]
+) -> Tuple[Page, Optional[str]]:
+    """Run a list query from request parameters; return the page and next cursor.
+
+    Supports ``limit``, ``cursor``, ``sort`` (a field, ``-`` prefix for
+    descending) and ``q``; equipment also takes ``status`` and
+    ``checked_out_to``. Without ``limit`` every match is returned.
+    """
+    limit = _limit(params)
+    sort = params.get("sort") or "created"
+    field = sort[1:] if sort.startswith("-") else sort
+    if field != "created" and field not in SORT_FIELDS[collection]:
+        choices = ", ".join(("created", *SORT_FIELDS[collection]))
+        raise ValidationError(f"Cannot sort by '{field}'; expected one of {choices}.")
+
+    status = params.get("status") or None
+    checked_out_to = params.get("checked_out_to") or None
+    if collection != "equipment" and (status or checked_out_to):
+        raise ValidationError("status and checked_out_to only apply to equipment.")
+    if status is not None and status not in EQUIPMENT_STATUSES:
+        raise ValidationError(f"status must be one of {', '.join(EQUIPMENT_STATUSES)}.")
+
+    page = store.query(
+        collection,
+        sort=field,
+        descending=sort.startswith("-"),
+        limit=limit,
+        after=_decode_cursor(params["cursor"], sort) if params.get("cursor") else None,
+        status=status,
+        checked_out_to=checked_out_to,
+        text=(params.get("q") or "").strip() or None,
+        now=_now_iso(),
+    )
+    next_cursor = _encode_cursor(sort, page.next_position) if page.next_position else None
+    return page, next_cursor
+
+
+def list_page(
+    store: DataStore, collection: str, params: Mapping[str, str]
+) -> Tuple[List[dict], Dict[str, str]]:
+    """Run ``list_records`` and return the page's records with its response headers."""
+    # Read before listing: a client resuming from an older version only
+    # sees a change twice, never misses one.
+    version = store.version
+    page, next_cursor = list_records(store, collection, params)
+    headers = {"X-Data-Version": str(version), "X-Total-Count": str(page.total)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return page.items, headers
+
+
+def list_collections(collection: str, params: Mapping[str, str]) -> Tuple[str, ...]:
+    """Return the collections a list response for ``params`` depends on, for caching."""
+    # Equipment search also matches borrower names.
+    if collection == "equipment" and params.get("q"):
+        return (collection, "people")
+    return (collection,)
+
+
+def search(store: DataStore, params: Mapping[str, str]) -> Dict[str, Any]:
+    """Return the best name-ordered matches for ``q`` in equipment and people."""
+    text = (params.get("q") or "").strip()
+    if not text:
+        raise ValidationError("Search query is required.")
+    limit = _limit(params, default=SEARCH_LIMIT)
+    results: Dict[str, Any] = {}
+    for collection in ("equipment", "people"):
+        page = store.query(collection, sort="name", limit=limit, text=text)
+        results[collection] = page.items
+        results[f"{collection}_total"] = page.total
+    return results
+
+
+def bootstrap(store: DataStore, params: Mapping[str, str]) -> Dict[str, Any]:
+    """Return everything the dashboard needs for its first paint.
+
+    ``equipment`` is the first page of the equipment list for the given list
+    parameters, each item with its ``borrower`` (id, name, email) embedded;
+    ``people`` holds every person by name.
+    """
+    # Read first so a client syncing from this version never misses a change.
+    version = store.version
+    page, next_cursor = list_records(store, "equipment", params)
+    people = store.query("people", sort="name")
+    equipment = []
+    for item in page.items:
+        person = store.get("people", item.get("checked_out_to"))
+        borrower = None
+        if person is not None:
+            borrower = {key: person.get(key) for key in ("id", "name", "email")}
+        equipment.append(dict(item, borrower=borrower))
+    return {
+        "version": version,
+        "equipment": equipment,
+        "equipment_total": page.total,
+        "next_cursor": next_cursor,
+        "people": people.items,
+    }
+
+
+def checkout_history(store: DataStore, equipment_id: str) -> List[Dict[str, Any]]:
+    _require(store, "equipment", equipment_id, "Equipment")
+    return store.history(equipment_id)
+
+
+def parse_version(value: Optional[str], label: str = "since") -> int:
+    try:
+        return int(value or "")
+    except ValueError:
+        raise ValidationError(f"{label} must be an integer version.") from None
+
+
+def changes(store: DataStore, params: Mapping[str, str]) -> Dict[str, Any]:
+    """Return records changed since the client's ``since`` version."""
+    return delta(store, parse_version(params.get("since")))
+
+
+def delta(store: DataStore, since: int) -> Dict[str, Any]:
+    """Coalesce the mutations after ``since`` into one delta.
+
+    Each collection lists its latest ``updated`` records and ``deleted`` ids.
+    ``resync`` is set instead when the change log cannot cover the gap; the
+    client should then reload everything.
+    """
+    version, entries = store.changes_since(since)
+    if entries is None:
+        return {"version": version, "resync": True}
+
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for entry in entries:
+        for change in entry.changes:
+            record_id = change["record"]["id"] if change["action"] == "put" else change["id"]
+            latest[(change["collection"], record_id)] = change
+    result: Dict[str, Any] = {"version": version, "resync": False}
+    for collection in ("equipment", "people", "checkouts"):
+        result[collection] = {"updated": [], "deleted": []}
+    for (collection, record_id), change in latest.items():
+        if change["action"] == "put":
+            result[collection]["updated"].append(change["record"])
+        else:
+            result[collection]["deleted"].append(record_id)
+    return result
+
+
+def overdue(store: DataStore, params: Mapping[str, str]) -> List[Dict[str, Any]]:
+    """Return overdue equipment, earliest due first, each with its ``borrower``.
+
+    ``within_hours`` widens the report to everything due within that many
+    hours from now.
+    """
+    hours = 0.0
+    if params.get("within_hours"):
+        try:
+            hours = float(params["within_hours"])
+        except ValueError:
+            raise ValidationError("within_hours must be a number.") from None
+        if not 0 <= hours <= MAX_DUE_WINDOW_HOURS:
+            raise ValidationError(
+                f"within_hours must be between 0 and {MAX_DUE_WINDOW_HOURS}."
+            )
+    items = store.due_before(_iso_in(hours))
+    limit = _limit(params)
+    if limit is not None:
+        items = items[:limit]
+    return [
+        dict(item, borrower=store.get("people", item.get("checked_out_to"))) for item in items
+    ]
+
+
+def create_equipment(store: DataStore, payload: Dict[str, Any]) -> Mutation:
+    name = payload.get("name", "").strip()
+    if not name:
+        raise ValidationError("Equipment name is required.")
+
+    new_equipment = {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "tag": payload.get("tag", "").strip(),
+        "description": payload.get("description", "").strip(),
+        "status": "available",
+        "checked_out_to": None,
+        "due_at": None,
+    }
+    return Mutation("create", [put("equipment", new_equipment)], new_equipment)
+
+
+def create_person(store: DataStore, payload: Dict[str, Any]) -> Mutation:
+    name = payload.get("name", "").strip()
+    if not name:
+        raise ValidationError("Person name is required.")
+
+    new_person = {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "email": payload.get("email", "").strip(),
+        "role": payload.get("role", "").strip(),
+    }
+    return Mutation("create", [put("people", new_person)], new_person)
+
+
+def update_equipment(store: DataStore, equipment_id: str, payload: Dict[str, Any]) -> Mutation:
+    equipment = _require(store, "equipment", equipment_id, "Equipment")
+    if "name" in payload and not payload["name"].strip():
+        raise ValidationError("Equipment name is required.")
+
+    for key in ["name", "tag", "description"]:
+        if key in payload:
+            equipment[key] = payload[key].strip()
+    return Mutation("update", [put("equipment", equipment)], equipment)
+
+
+def update_person(store: DataStore, person_id: str, payload: Dict[str, Any]) -> Mutation:
+    person = _require(store, "people", person_id, "Person")
+    if "name" in payload and not payload["name"].strip():
+        raise ValidationError("Person name is required.")
+
+    for key in ["name", "email", "role"]:
+        if key in payload:
+            person[key] = payload[key].strip()
+    return Mutation("update", [put("people", person)], person)
+
+
+def delete_equipment(store: DataStore, equipment_id: str) -> Mutation:
+    equipment = _require(store, "equipment", equipment_id, "Equipment")
+    if equipment["status"] == "checked_out":
+        raise ValidationError("Cannot delete checked-out equipment.")
+    return Mutation("delete", [delete("equipment", equipment_id)], {"status": "deleted"})
+
+
+def delete_person(store: DataStore, person_id: str) -> Mutation:
+    _require(store, "people", person_id, "Person")
+    if store.borrowed_by(person_id):
+        raise ValidationError("Person currently has equipment checked out.")
+    return Mutation("delete", [delete("people", person_id)], {"status": "deleted"})
+
+
+def checkout(store: DataStore, payload: Dict[str, Any]) -> Mutation:
+    equipment_id = payload.get("equipment_id")
+    person_id = payload.get("person_id")
+    equipment = _require(store, "equipment", equipment_id, "Equipment")
+    _require(store, "people", person_id, "Person")
+    if equipment["status"] == "checked_out":
+        raise ValidationError("Equipment already checked out.")
+
+    checkout_record = {
+        "id": str(uuid.uuid4()),
+        "equipment_id": equipment_id,
+        "person_id": person_id,
+        "checked_out_at": _now_iso(),
+        "due_at": _due_iso(),
+        "checked_in_at": None,
+        "handoff": False,
+    }
+
+    equipment["status"] = "checked_out"
+    equipment["checked_out_to"] = person_id
+    equipment["due_at"] = checkout_record["due_at"]
+    return Mutation(
+        "checkout",
+        [put("equipment", equipment), put("checkouts", checkout_record)],
+        checkout_record,
+    )
+
+
+def checkin(store: DataStore, payload: Dict[str, Any]) -> Mutation:
+    equipment_id = payload.get("equipment_id")
+    equipment = _require(store, "equipment", equipment_id, "Equipment")
+    if equipment["status"] != "checked_out":
+        raise ValidationError("Equipment is not checked out.")
+
+    active = store.active_checkout(equipment_id)
+    if not active:
+        raise ValidationError("Active checkout not found.")
+
+    checkout_record = dict(active, checked_in_at=_now_iso())
+    equipment["status"] = "available"
+    equipment["checked_out_to"] = None
+    equipment["due_at"] = None
+    return Mutation(
+        "checkin",
+        [put("equipment", equipment), put("checkouts", checkout_record)],
+        {"status": "checked_in"},
+    )
+
+
+def transfer(store: DataStore, payload: Dict[str, Any]) -> Mutation:
+    equipment_id = payload.get("equipment_id")
+    person_id = payload.get("person_id")
+    equipment = _require(store, "equipment", equipment_id, "Equipment")
+    _require(store, "people", person_id, "Person")
+    if equipment["status"] != "checked_out":
+        raise ValidationError("Equipment is not checked out.")
+
+    active = store.active_checkout(equipment_id)
+    if not active:
+        raise ValidationError("Active checkout not found.")
+
+    checkout_record = dict(active, checked_in_at=_now_iso(), handoff=True)
+    new_checkout = {
+        "id": str(uuid.uuid4()),
+        "equipment_id": equipment_id,
+        "person_id": person_id,
+        "checked_out_at": _now_iso(),
+        "due_at": _due_iso(),
+        "checked_in_at": None,
+        "handoff": True,
+        "handoff_from": checkout_record["person_id"],
+    }
+
+    equipment["checked_out_to"] = person_id
+    equipment["due_at"] = new_checkout["due_at"]
+    return Mutation(
+        "transfer",
+        [
+            put("equipment", equipment),
+            put("checkouts", checkout_record),
+            put("checkouts", new_checkout),
+        ],
+        new_checkout,
+    )
+
+
+class _BulkView:
+    """Store view that also sees changes staged earlier in the same bulk request."""
+
+    def __init__(self, store: DataStore) -> None:
+        self._store = store
+        self._staged: Dict[Tuple[str, Optional[str]], Optional[dict]] = {}
+
+    def get(self, collection: str, record_id: Optional[str]) -> Optional[dict]:
+        key = (collection, record_id)
+        if key in self._staged:
+            return self._staged[key]
+        return self._store.get(collection, record_id)
+
+    def active_checkout(self, equipment_id: str) -> Optional[dict]:
+        return self._store.active_checkout(equipment_id)
+
+    def borrowed_by(self, person_id: str) -> List[dict]:
+        return self._store.borrowed_by(person_id)
+
+    def stage(self, changes: List[Dict[str, Any]]) -> None:
+        for change in changes:
+            if change["action"] == "put":
+                self._staged[(change["collection"], change["record"]["id"])] = change["record"]
+            else:
+                self._staged[(change["collection"], change["id"])] = None
+
+
+def _row_object(row: Any) -> Dict[str, Any]:
+    if not isinstance(row, dict):
+        raise ValidationError("Row must be a JSON object.")
+    return row
+
+
+def _row_id(row: Any) -> Optional[str]:
+    return row if isinstance(row, str) else _row_object(row).get("id")
+
+
+_BULK_OPERATIONS: Dict[Tuple[str, str], Callable[[Any, Any], Mutation]] = {
+    ("equipment", "create"): lambda view, row: create_equipment(view, _row_object(row)),
+    ("equipment", "update"): lambda view, row: update_equipment(
+        view, _row_id(row), _row_object(row)
+    ),
+    ("equipment", "delete"): lambda view, row: delete_equipment(view, _row_id(row)),
+    ("people", "create"): lambda view, row: create_person(view, _row_object(row)),
+    ("people", "update"): lambda view, row: update_person(view, _row_id(row), _row_object(row)),
+    ("people", "delete"): lambda view, row: delete_person(view, _row_id(row)),
+}
+
+
+def bulk_rows(body: bytes, mimetype: str) -> List[Any]:
+    """Read bulk rows from a JSON array body or NDJSON (one object per line).
+
+    An NDJSON line that is not valid JSON becomes ``None``, which ``bulk``
+    reports as an invalid row.
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        rows = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(codec.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+    try:
+        payload = codec.loads(body)
+    except ValueError:
+        raise ValidationError("Request body must be JSON.") from None
+    if not isinstance(payload, list):
+        raise ValidationError("Expected a JSON array or NDJSON rows.")
+    return payload
+
+
+def bulk(store: DataStore, collection: str, action: str, rows: List[Any]) -> Mutation:
+    """Validate every row and combine the valid ones into a single mutation.
+
+    Rows are checked in order against the current state plus the rows before
+    them, so e.g. deleting the same id twice fails on the second row. Invalid
+    rows are reported per row and do not stop the others.
+    """
+    if not rows:
+        raise ValidationError("No rows provided.")
+    operation = _BULK_OPERATIONS[(collection, action)]
+    view = _BulkView(store)
+    changes: List[Dict[str, Any]] = []
+    results: List[Dict[str, Any]] = []
+    for index, row in enumerate(rows):
+        try:
+            mutation = operation(view, row)
+        except NotFoundError as exc:
+            results.append({"index": index, "status": 404, "error": str(exc)})
+            continue
+        except ValidationError as exc:
+            results.append({"index": index, "status": 400, "error": str(exc)})
+            continue
+        except (AttributeError, TypeError):
+            results.append({"index": index, "status": 400, "error": "Invalid field value."})
+            continue
+        view.stage(mutation.changes)
+        changes.extend(mutation.changes)
+        first = mutation.changes[0]
+        record_id = first["record"]["id"] if first["action"] == "put" else first["id"]
+        status = 201 if action == "create" else 200
+        results.append({"index": index, "status": status, "id": record_id})
+
+    succeeded = sum(1 for result in results if "id" in result)
+    summary = {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+    return Mutation(f"bulk_{action}", changes, summary)
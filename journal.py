@@ -0,0 +1,445 @@
+"""Append-only mutation journal with snapshot compaction.
+
+A data file is stored as a snapshot (the familiar ``data.json`` document) plus
+a ``<snapshot>.journal`` file holding one compact JSON mutation per line.
+Loading replays the journal over the snapshot; compaction folds the current
+state into a fresh snapshot and truncates the journal.
+
+The snapshot can also be split into one file per collection next to a small
+state file (``write_split_snapshot``), so a reader that needs one collection
+does not parse the others.
+
+Records that are no longer needed on the hot path (closed checkouts) can be
+archived to ``<snapshot>.history``, an append-only file of one record per line.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from collections import deque
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import codec
+
+Records = Dict[str, Dict[str, dict]]
+
+JOURNAL_SUFFIX = ".journal"
+HISTORY_SUFFIX = ".history"
+MIN_COMPACT_BYTES = 1024 * 1024
+# Entries a ``Journal`` keeps in memory for ``read_since``.
+RECENT_ENTRIES = 1024
+
+
+def put(collection: str, record: dict) -> Dict[str, Any]:
+    """Build a change that inserts or replaces ``record``."""
+    return {"action": "put", "collection": collection, "record": record}
+
+
+def delete(collection: str, record_id: str) -> Dict[str, Any]:
+    """Build a change that removes the record with ``record_id``."""
+    return {"action": "delete", "collection": collection, "id": record_id}
+
+
+def apply_changes(records: Records, changes: Iterable[Dict[str, Any]]) -> None:
+    """Apply journal changes to id-keyed ``records`` in place."""
+    for change in changes:
+        collection = records.setdefault(change["collection"], {})
+        if change["action"] == "put":
+            record = change["record"]
+            collection[record["id"]] = record
+        else:
+            collection.pop(change["id"], None)
+
+
+def to_records(data: Dict[str, Any]) -> Records:
+    return {
+        name: {item["id"]: item for item in items}
+        for name, items in data.items()
+        if isinstance(items, list)
+    }
+
+
+def to_document(records: Records) -> Dict[str, List[dict]]:
+    return {name: list(items.values()) for name, items in records.items()}
+
+
+def read_snapshot(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as handle:
+        return codec.loads(handle.read())
+
+
+def write_snapshot(
+    path: str, data: Dict[str, Any], fsync: bool = False, pretty: bool = False
+) -> None:
+    """Atomically replace ``path`` with ``data`` serialized as JSON.
+
+    With ``fsync`` the file contents and the rename are flushed to disk
+    before returning; ``pretty`` indents the document for human readers.
+    """
+    atomic_write(path, lambda handle: handle.write(codec.dumps(data, pretty)), fsync)
+
+
+def atomic_write(path: str, write: Callable[[BinaryIO], Any], fsync: bool = False) -> None:
+    """Replace ``path`` with what ``write`` puts in a temporary file next to it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            write(handle)
+            if fsync:
+                handle.flush()
+                os.fsync(handle.fileno())
+        os.replace(temp_path, path)
+        if fsync:
+            _fsync_directory(directory)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def collection_path(path: str, name: str) -> str:
+    """Return the file holding collection ``name`` of the split snapshot at ``path``."""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name + ".json")
+
+
+def read_collection(path: str, name: str) -> List[dict]:
+    """Return one collection of the split snapshot at ``path`` without reading the others."""
+    return read_snapshot(collection_path(path, name)).get(name, [])
+
+
+def read_split_snapshot(path: str) -> Dict[str, Any]:
+    """Read a snapshot written by ``write_split_snapshot`` as one document."""
+    state = read_snapshot(path)
+    data: Dict[str, Any] = {
+        name: read_collection(path, name) for name in state.get("collections", ())
+    }
+    data["version"] = state.get("version", 0)
+    return data
+
+
+def write_split_snapshot(
+    path: str, data: Dict[str, Any], fsync: bool = False, pretty: bool = False
+) -> None:
+    """Write each collection to its own file next to ``path``, then ``path`` itself.
+
+    ``path`` holds the version and the collection names. It is replaced last,
+    so after a crash part-way the collection files are at least as new as it
+    says; replaying the journal over them still ends in the same state.
+    """
+    version = data.get("version", 0)
+    names = [name for name, items in data.items() if isinstance(items, list)]
+    for name in names:
+        document = {"version": version, name: data[name]}
+        write_snapshot(collection_path(path, name), document, fsync, pretty)
+    write_snapshot(path, {"version": version, "collections": names}, fsync, pretty)
+
+
+def read_entries(
+    journal_path: str, offset: int = 0, containing: Optional[bytes] = None
+) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """Yield ``(entry, end_offset)`` pairs from ``offset``, stopping at a torn line.
+
+    With ``containing``, lines without those bytes are skipped undecoded.
+    """
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path, "rb") as handle:
+        handle.seek(offset)
+        for line in handle:
+            if not line.endswith(b"\n"):
+                return
+            if containing is not None and containing not in line:
+                offset += len(line)
+                continue
+            try:
+                entry = codec.loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield entry, offset
+
+
+def replay(
+    records: Records, journal_path: str, collections: Optional[Iterable[str]] = None
+) -> int:
+    """Apply the journal's changes to ``records`` and return how many entries it holds.
+
+    Stops at a torn line, like ``read_entries``. With ``collections`` only
+    their changes are applied, and lines that mention none of them are
+    counted without being decoded.
+    """
+    wanted = None if collections is None else set(collections)
+    needles = [codec.dumps(name) for name in wanted] if wanted is not None else []
+    count = 0
+    if not os.path.exists(journal_path):
+        return count
+    with open(journal_path, "rb") as handle:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+            if wanted is not None and not any(needle in line for needle in needles):
+                count += 1
+                continue
+            try:
+                entry = codec.loads(line)
+            except ValueError:
+                break
+            count += 1
+            changes = entry["changes"]
+            if wanted is not None:
+                changes = [change for change in changes if change["collection"] in wanted]
+            apply_changes(records, changes)
+    return count
+
+
+def read_state(path: str, read: Callable[[str], Dict[str, Any]] = read_snapshot) -> Records:
+    """Return snapshot plus journal as records, without any ``Journal`` bookkeeping.
+
+    ``read`` loads the snapshot, as for ``Journal``.
+    """
+    data = read(path)
+    data.pop("version", None)
+    records = to_records(data)
+    replay(records, path + JOURNAL_SUFFIX)
+    return records
+
+
+def append_mutations(
+    journal_path: str, mutations: List[Tuple[str, List[Dict[str, Any]]]], fsync: bool = False
+) -> None:
+    """Append ``(op, changes)`` mutations to ``journal_path`` without a ``Journal``.
+
+    The caller holds the exclusive lock. A torn last line from an interrupted
+    append is cut off first, as for ``Journal.append_many``.
+    """
+    data = b"".join(_encode({"op": op, "changes": changes}) for op, changes in mutations)
+    _append(journal_path, data, fsync, repair=True)
+
+
+def append_history(path: str, records: List[dict], fsync: bool = False) -> None:
+    """Append ``records`` to the history file next to the snapshot at ``path``."""
+    history_path = path + HISTORY_SUFFIX
+    # A torn last line from an interrupted append is left on its own line.
+    data = b"\n" if _size(history_path) and not _ends_with_newline(history_path) else b""
+    data += b"".join(_encode(record) for record in records)
+    with open(history_path, "ab") as handle:
+        handle.write(data)
+        if fsync:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+def read_history(path: str) -> Iterator[dict]:
+    """Yield archived records in the order they were appended, skipping torn lines."""
+    history_path = path + HISTORY_SUFFIX
+    if not os.path.exists(history_path):
+        return
+    with open(history_path, "rb") as handle:
+        for line in handle:
+            try:
+                record = codec.loads(line)
+            except ValueError:
+                continue
+            if line.endswith(b"\n") and isinstance(record, dict):
+                yield record
+
+
+class Journal:
+    """Snapshot file plus an append-only log of mutation records.
+
+    The snapshot stores the data version it was written at; each journal line
+    implicitly bumps it by one. ``read_new`` tails lines appended by other
+    processes, and reports ``None`` once the snapshot itself was replaced.
+    ``read_since`` also answers from the last ``RECENT_ENTRIES`` entries this
+    instance read or appended, for callers a little behind it.
+
+    Compaction is due once the journal outgrows the snapshot it extends, which
+    keeps the amortized cost of a write proportional to the size of the change.
+    Callers are responsible for locking (see ``locking.FileLock``).
+
+    ``read`` and ``write`` load and replace the snapshot; they default to the
+    JSON document format (``read_snapshot`` / ``write_snapshot``).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        min_compact_bytes: int = MIN_COMPACT_BYTES,
+        fsync: bool = False,
+        pretty: bool = False,
+        read: Callable[[str], Dict[str, Any]] = read_snapshot,
+        write: Callable[..., None] = write_snapshot,
+    ) -> None:
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.min_compact_bytes = min_compact_bytes
+        self.fsync = fsync
+        self.pretty = pretty
+        self.read_snapshot = read
+        self.write_snapshot = write
+        self.version = 0
+        self._offset = 0
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._synced = False
+        self._recent: "deque[Dict[str, Any]]" = deque(maxlen=RECENT_ENTRIES)
+
+    def load(self) -> Records:
+        data = self.read_snapshot(self.path)
+        self._stamp = _stamp(self.path)
+        self.version = data.pop("version", 0)
+        self._offset = 0
+        self._synced = True
+        self._recent.clear()
+        records = to_records(data)
+        for entry in self.read_new() or ():
+            apply_changes(records, entry["changes"])
+        if _size(self.journal_path) > self._offset:
+            with open(self.journal_path, "r+b") as handle:
+                handle.truncate(self._offset)
+        return records
+
+    def read_new(self) -> Optional[List[Dict[str, Any]]]:
+        """Return entries appended since the last load or read, tagged with versions.
+
+        Returns ``None`` when the snapshot changed underneath us (another
+        process compacted) and a full ``load`` is required.
+        """
+        if not self._synced or _stamp(self.path) != self._stamp:
+            return None
+        entries = []
+        for entry, offset in read_entries(self.journal_path, self._offset):
+            self.version += 1
+            self._offset = offset
+            entry["version"] = self.version
+            entries.append(entry)
+        self._recent.extend(entries)
+        return entries
+
+    def read_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Return entries after ``version``, tagged with versions, reading new ones first.
+
+        Unlike ``read_new`` this also covers entries this instance already read
+        or appended, as long as they are among the recent ones it keeps.
+        Returns ``None`` when they are not, or the snapshot was replaced.
+        """
+        if self.read_new() is None or version > self.version:
+            return None
+        if version == self.version:
+            return []
+        entries = [entry for entry in self._recent if entry["version"] > version]
+        if not entries or entries[0]["version"] != version + 1:
+            return None
+        return entries
+
+    def changed_on_disk(self) -> bool:
+        """Whether anything was written since this instance last synced."""
+        return (
+            not self._synced
+            or _stamp(self.path) != self._stamp
+            or _size(self.journal_path) != self._offset
+        )
+
+    def append(self, op: str, changes: List[Dict[str, Any]]) -> int:
+        """Append one mutation and return the resulting version."""
+        return self.append_many([(op, changes)])
+
+    def append_many(self, mutations: List[Tuple[str, List[Dict[str, Any]]]]) -> int:
+        """Append ``(op, changes)`` mutations with a single write and return the version.
+
+        Appending to a journal this instance has not synced with is allowed
+        (blind writes from the CLI), but leaves ``version`` unknown until the
+        next ``load``. Such a journal may end in a torn line from a crashed
+        append; it is cut off first, or the new lines would be joined to it and
+        dropped with it on the next load.
+        """
+        in_sync = not self.changed_on_disk()
+        data = b"".join(_encode({"op": op, "changes": changes}) for op, changes in mutations)
+        _append(self.journal_path, data, self.fsync, repair=not in_sync)
+        if in_sync:
+            for op, changes in mutations:
+                self.version += 1
+                self._recent.append({"op": op, "changes": changes, "version": self.version})
+            self._offset += len(data)
+        else:
+            self._synced = False
+        return self.version
+
+    def compaction_due(self) -> bool:
+        return _size(self.journal_path) > max(self.min_compact_bytes, _size(self.path))
+
+    def compact(self, records: Records, version: Optional[int] = None) -> None:
+        """Write ``records`` as the new snapshot and empty the journal."""
+        if version is not None and version != self.version:
+            # Versions in between were never journaled.
+            self.version = version
+            self._recent.clear()
+        document: Dict[str, Any] = to_document(records)
+        document["version"] = self.version
+        self.write_snapshot(self.path, document, fsync=self.fsync, pretty=self.pretty)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._stamp = _stamp(self.path)
+        self._offset = 0
+        self._synced = True
+
+
+def _append(path: str, data: bytes, fsync: bool, repair: bool) -> None:
+    if repair:
+        _drop_torn_tail(path)
+    with open(path, "ab") as handle:
+        handle.write(data)
+        if fsync:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+def _drop_torn_tail(path: str) -> None:
+    """Truncate ``path`` after its last newline, removing a partially written line."""
+    end = _size(path)
+    if not end or _ends_with_newline(path):
+        return
+    with open(path, "r+b") as handle:
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            handle.seek(start)
+            newline = handle.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                handle.truncate(start + newline + 1)
+                return
+            end = start
+        handle.truncate(0)
+
+
+def _encode(entry: Dict[str, Any]) -> bytes:
+    return codec.dumps(entry) + b"\n"
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as handle:
+        handle.seek(-1, os.SEEK_END)
+        return handle.read(1) == b"\n"
+
+
+def _fsync_directory(directory: str) -> None:
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,64 @@
+"""Inter-process file locks for the JSON storage backend."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class FileLock:
+    """Reader/writer lock shared by every process that opens the same path.
+
+    Uses ``flock`` where available. Threads of one process are serialized with
+    an in-process lock first, since ``flock`` does not exclude them from each
+    other. Without ``fcntl`` only the in-process lock applies.
+
+    ``on_wait``, when set, is called with the seconds each acquisition spent
+    waiting for the lock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.on_wait: Optional[Callable[[float], None]] = None
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: int = -1
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._acquire(fcntl.LOCK_EX if fcntl else 0):
+            yield
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._acquire(fcntl.LOCK_SH if fcntl else 0):
+            yield
+
+    @contextmanager
+    def _acquire(self, mode: int) -> Iterator[None]:
+        started = time.perf_counter() if self.on_wait is not None else 0.0
+        with self._thread_lock:
+            # Re-entrant use keeps whatever lock the outermost caller took.
+            if self._depth == 0 and fcntl is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, mode)
+            if self.on_wait is not None:
+                self.on_wait(time.perf_counter() - started)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                    os.close(self._fd)
+                    self._fd = -1
@@ -0,0 +1,347 @@
+"""Request, storage and lock instrumentation, rendered in the Prometheus text format.
+
+Nothing is measured until ``enable`` is called (``EQUIPMENT_ELLIE_METRICS=1``
+for the API, ``cli.py --stats`` for the CLI). The API then registers its
+request hooks and ``/metrics``, and wraps its storage in ``InstrumentedStore``
+and times waits for its locks; left disabled, none of that is installed and
+the hot paths run as before.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from locking import FileLock
+from storage import MutationRecord, Storage
+
+# Upper bounds (seconds) of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative latency buckets plus sum, count and maximum per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Labels = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> [bucket counts..., count, sum, max]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2) + [0.0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-3] += 1
+            series[-2] += value
+            series[-1] = max(series[-1], value)
+
+    def series(self) -> Dict[Labels, Dict[str, float]]:
+        """Return ``count``, ``sum`` and ``max`` for every label set observed."""
+        with self._lock:
+            return {
+                labels: {"count": values[-3], "sum": values[-2], "max": values[-1]}
+                for labels, values in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            snapshot = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = _format_labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {values[-3]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {values[-2]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {values[-3]}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_number(value)}"
+            for labels, value in sorted(self.values().items())
+        ]
+
+
+class Gauge(Counter):
+    """A value that is set rather than added to, or read from ``collect`` at render time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Labels = (),
+        collect: Optional[Callable[[], Dict[Labels, float]]] = None,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self) -> Dict[Labels, float]:
+        values = super().values()
+        if self.collect is not None:
+            values.update(self.collect())
+        return values
+
+
+class Metrics:
+    """Every metric the app and the CLI record."""
+
+    def __init__(self) -> None:
+        self.request_seconds = Histogram(
+            "equipment_ellie_http_request_duration_seconds",
+            "Time to handle an API request, by method, route and status.",
+            ("method", "route", "status"),
+        )
+        self.encode_seconds = Histogram(
+            "equipment_ellie_response_encode_seconds", "Time to encode a JSON response body."
+        )
+        self.storage_seconds = Histogram(
+            "equipment_ellie_storage_operation_duration_seconds",
+            "Time spent in storage calls, by backend and operation.",
+            ("backend", "operation"),
+        )
+        self.storage_bytes = Counter(
+            "equipment_ellie_storage_bytes_total",
+            "Data file bytes read by loads and written by saves.",
+            ("backend", "operation"),
+        )
+        self.disk_bytes = Gauge(
+            "equipment_ellie_storage_disk_bytes",
+            "Size of the data files at the last load, commit or save.",
+            ("backend",),
+        )
+        self.lock_wait_seconds = Histogram(
+            "equipment_ellie_lock_wait_seconds",
+            "Time spent waiting to acquire a lock, by lock.",
+            ("lock",),
+        )
+        self.command_seconds = Histogram(
+            "equipment_ellie_cli_command_duration_seconds",
+            "Time to run a CLI command, including loading and saving.",
+            ("command",),
+        )
+        self.records = Gauge(
+            "equipment_ellie_records",
+            "Live records held in memory, by collection.",
+            ("collection",),
+        )
+
+    def all(self) -> List[Any]:
+        return [value for value in vars(self).values() if hasattr(value, "render")]
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.all():
+            body = metric.render()
+            if body:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Return a table of every timing recorded, for ``cli.py --stats``."""
+        rows = []
+        for metric in self.all():
+            if isinstance(metric, Histogram):
+                for labels, values in sorted(metric.series().items()):
+                    count = int(values["count"])
+                    rows.append(
+                        (
+                            metric.name.replace("equipment_ellie_", "") + " " + " ".join(labels),
+                            f"{count:>7} {values['sum'] * 1000:>11.2f} "
+                            f"{values['sum'] * 1000 / count:>10.3f} {values['max'] * 1000:>10.3f}",
+                        )
+                    )
+        lines = [f"{'timing':<60} {'count':>7} {'total ms':>11} {'mean ms':>10} {'max ms':>10}"]
+        lines.extend(f"{name:<60} {numbers}" for name, numbers in rows)
+        sizes = [
+            (metric.name.replace("equipment_ellie_", "") + " " + " ".join(labels), value)
+            for metric in (self.storage_bytes, self.disk_bytes)
+            for labels, value in sorted(metric.values().items())
+        ]
+        if sizes:
+            lines.append(f"{'size':<60} {'bytes':>11}")
+            lines.extend(f"{name:<60} {int(value):>11}" for name, value in sizes)
+        return "\n".join(lines)
+
+
+active: Optional[Metrics] = None
+
+
+def enable() -> Metrics:
+    """Start recording; return the process-wide ``Metrics``."""
+    global active
+    if active is None:
+        active = Metrics()
+    return active
+
+
+def _observe_wait(histogram: Histogram, name: str, seconds: float) -> None:
+    histogram.observe(seconds, name)
+
+
+class TimedLock:
+    """Wraps a ``threading`` lock and records how long each acquisition waited."""
+
+    def __init__(self, lock: Any, name: str, metrics: Metrics) -> None:
+        self._lock = lock
+        self._name = name
+        self._histogram = metrics.lock_wait_seconds
+
+    def __enter__(self) -> bool:
+        started = time.perf_counter()
+        acquired = self._lock.__enter__()
+        self._histogram.observe(time.perf_counter() - started, self._name)
+        return acquired
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self._lock.__exit__(*exc_info)
+
+
+class InstrumentedStore(Storage):
+    """Times every call to ``backend`` and tracks the size of its data files.
+
+    Waits for the backend's ``FileLock``, if it has one, are recorded as the
+    ``file`` lock.
+    """
+
+    def __init__(self, backend: Storage, metrics: Metrics) -> None:
+        self.backend = backend
+        self.metrics = metrics
+        self.name = type(backend).__name__
+        lock = getattr(backend, "lock", None)
+        if isinstance(lock, FileLock):
+            lock.on_wait = partial(_observe_wait, metrics.lock_wait_seconds, "file")
+
+    @property  # type: ignore[override]
+    def version(self) -> int:
+        return self.backend.version
+
+    def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        data = self._timed("load", self.backend.load)
+        self._count_bytes("load")
+        return data
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        return self._timed("get", self.backend.get, collection, record_id)
+
+    def get_many(self, collection: str, record_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return self._timed("get_many", self.backend.get_many, collection, record_ids)
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        return self._timed("list", self.backend.list, collection)
+
+    def list_page(self, collection: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        return self._timed("list_page", self.backend.list_page, collection, offset, limit)
+
+    def commit_many(
+        self, mutations: List[MutationRecord], expected_version: Optional[int] = None
+    ) -> int:
+        version = self._timed("commit", self.backend.commit_many, mutations, expected_version)
+        self.metrics.disk_bytes.set(self.backend.disk_bytes(), self.name)
+        return version
+
+    def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        return self._timed("changes_since", self.backend.changes_since, version)
+
+    def history(self, equipment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self._timed("history", self.backend.history, equipment_id)
+
+    def iter_records(self, collection: str) -> Iterator[Dict[str, Any]]:
+        return self.backend.iter_records(collection)
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        return self.backend.iter_history()
+
+    def save(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
+        self._timed("save", self.backend.save, data)
+        self._count_bytes("save")
+
+    def compact(self) -> None:
+        self._timed("compact", self.backend.compact)
+        self.metrics.disk_bytes.set(self.backend.disk_bytes(), self.name)
+
+    def data_files(self) -> List[str]:
+        return self.backend.data_files()
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def _timed(self, operation: str, call: Callable[..., Any], *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.storage_seconds.observe(elapsed, self.name, operation)
+
+    def _count_bytes(self, operation: str) -> None:
+        size = self.backend.disk_bytes()
+        self.metrics.storage_bytes.inc(size, self.name, operation)
+        self.metrics.disk_bytes.set(size, self.name)
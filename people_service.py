@@ -2,7 +2,8 @@ import uuid
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
-from storage import JsonStore
+from journal import delete, put
+from storage import Storage
 
 
 class ValidationError(ValueError):
@@ -11,11 +12,12 @@ class ValidationError(ValueError):
 
 @dataclass
 class PeopleService:
-    store: JsonStore
+    store: Storage
 
-    def list_people(self) -> List[Dict[str, Any]]:
-        data = self.store.load()
-        return list(data.get("people", []))
+    def list_people(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if limit is None:
+            return self.store.list("people")[offset:]
+        return self.store.list_page("people", offset, limit)
 
     def get_person(self, person_id: str) -> Dict[str, Any]:
         person = self._find_person(person_id)
@@ -30,15 +32,13 @@ class PeopleService:
         role: Optional[str] = None,
     ) -> Dict[str, Any]:
         self._require_field("name", name)
-        data = self.store.load()
         person = {
             "id": str(uuid.uuid4()),
             "name": name,
             "email": email,
             "role": role,
         }
-        data.setdefault("people", []).append(person)
-        self.store.save(data)
+        self.store.commit("create", [put("people", person)])
         return person
 
     def update_person(
@@ -50,8 +50,7 @@ class PeopleService:
     ) -> Dict[str, Any]:
         if name is None and email is None and role is None:
             raise ValidationError("At least one field must be provided to update a person")
-        data = self.store.load()
-        person = self._find_person(person_id, data)
+        person = self._find_person(person_id)
         if person is None:
             raise KeyError(f"Person '{person_id}' not found")
         if name is not None:
@@ -61,26 +60,17 @@ class PeopleService:
             person["email"] = email
         if role is not None:
             person["role"] = role
-        self.store.save(data)
+        self.store.commit("update", [put("people", person)])
         return person
 
     def delete_person(self, person_id: str) -> None:
-        data = self.store.load()
-        person = self._find_person(person_id, data)
+        person = self._find_person(person_id)
         if person is None:
             raise KeyError(f"Person '{person_id}' not found")
-        data["people"] = [item for item in data.get("people", []) if item["id"] != person_id]
-        self.store.save(data)
+        self.store.commit("delete", [delete("people", person_id)])
 
-    def _find_person(
-        self, person_id: str, data: Optional[Dict[str, Any]] = None
-    ) -> Optional[Dict[str, Any]]:
-        if data is None:
-            data = self.store.load()
-        for person in data.get("people", []):
-            if person.get("id") == person_id:
-                return person
-        return None
+    def _find_person(self, person_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get("people", person_id)
 
     @staticmethod
     def _require_field(field_name: str, value: Optional[str]) -> None:
@@ -0,0 +1,131 @@
+"""cProfile capture for sampled API requests and CLI commands.
+
+Nothing is profiled unless ``EQUIPMENT_ELLIE_PROFILE_DIR`` is set. The API then
+profiles ``EQUIPMENT_ELLIE_PROFILE_SAMPLE`` of its requests and ``cli.py``
+profiles every command; a run is kept only if it took at least
+``EQUIPMENT_ELLIE_PROFILE_SLOW_MS``. Each kept run is written as a ``.prof``
+file for ``pstats``/snakeviz and a ``.txt`` summary of its top functions, and
+only the newest ``EQUIPMENT_ELLIE_PROFILE_KEEP`` runs are retained.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from config import Settings
+
+# Functions listed in each ``.txt`` summary, by cumulative time.
+DEFAULT_TOP = 30
+
+
+class Profiler:
+    """Starts cProfile for a sampled share of runs and writes the slow ones to ``directory``.
+
+    One run is profiled at a time: cProfile hooks the interpreter, so a second
+    profile started while another is running would skew both (and on newer
+    Pythons fails outright). Runs that arrive meanwhile go unprofiled.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample: float = 1.0,
+        slow_ms: float = 0.0,
+        keep: int = 50,
+        top: int = DEFAULT_TOP,
+        chance: Callable[[], float] = random.random,
+    ) -> None:
+        self.directory = Path(directory)
+        self.sample = sample
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self.top = top
+        self._chance = chance
+        self._busy = threading.Lock()
+        self._sequence = itertools.count()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["Profiler"]:
+        """Return a profiler for ``settings``, or ``None`` when profiling is off."""
+        if not settings.profile_dir:
+            return None
+        return cls(
+            settings.profile_dir,
+            sample=settings.profile_sample,
+            slow_ms=settings.profile_slow_ms,
+            keep=settings.profile_keep,
+        )
+
+    def start(self, sampled: bool = True) -> Optional[cProfile.Profile]:
+        """Begin profiling the current thread if this run is sampled; return the profile."""
+        if sampled and self.sample < 1 and self._chance() >= self.sample:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, coverage) already owns the hook.
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(
+        self, profile: Optional[cProfile.Profile], label: str, elapsed: float
+    ) -> Optional[Path]:
+        """Finish ``profile`` and write it out if it ran for at least ``slow_ms``."""
+        if profile is None:
+            return None
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < self.slow_ms:
+            return None
+        path = self._write(profile, label, elapsed_ms)
+        self._rotate()
+        return path
+
+    def _write(self, profile: cProfile.Profile, label: str, elapsed_ms: float) -> Path:
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")[:60] or "run"
+        stem = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._sequence):06d}"
+            f"-{slug}-{elapsed_ms:.0f}ms"
+        )
+        path = self.directory / f"{stem}.prof"
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        summary.write(f"{label}\n{elapsed_ms:.1f} ms\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        path.with_suffix(".txt").write_text(summary.getvalue(), encoding="utf-8")
+        return path
+
+    def _rotate(self) -> None:
+        # Oldest first; several workers may share the directory.
+        runs: List[Tuple[int, Path]] = []
+        for path in self.directory.glob("*.prof"):
+            try:
+                runs.append((path.stat().st_mtime_ns, path))
+            except FileNotFoundError:
+                continue
+        runs.sort()
+        for _, path in runs[: max(len(runs) - self.keep, 0)]:
+            for stale in (path, path.with_suffix(".txt")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    # Another worker rotated it first.
+                    pass
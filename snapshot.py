@@ -0,0 +1,189 @@
+"""Binary snapshot format that can be read in place through ``mmap``.
+
+Layout (integers little-endian)::
+
+    magic (8 bytes) | header offset (u64)
+    records:  u32 JSON size | u16 id size | id | JSON record
+    per collection: u64 record offsets in insertion order,
+                    u64 record offsets sorted by id
+    header:   JSON {"version": ..., "collections": {name: {"count", "order", "by_id"}}}
+
+Opening a snapshot reads only the header. ``get`` binary-searches the sorted
+offsets and decodes one record; ``page`` decodes only the records it returns.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import codec
+from journal import atomic_write
+
+MAGIC = b"EESNAP01"
+
+_PREFIX = struct.Struct("<8sQ")
+_RECORD = struct.Struct("<IH")
+_OFFSET = struct.Struct("<Q")
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable binary snapshot."""
+
+
+class SnapshotReader:
+    """Read-only view of a snapshot file; use as a context manager."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as handle:
+            try:
+                self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path} is empty") from None
+        if len(self._map) < _PREFIX.size:
+            self.close()
+            raise SnapshotError(f"{path} is not a snapshot")
+        magic, header_offset = _PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotError(f"{path} is not a snapshot")
+        header = codec.loads(self._map[header_offset:])
+        self.version: int = header["version"]
+        self._collections: Dict[str, Dict[str, int]] = header["collections"]
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._map.close()
+
+    @property
+    def collections(self) -> List[str]:
+        return list(self._collections)
+
+    def count(self, collection: str) -> int:
+        return self._collections.get(collection, {}).get("count", 0)
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        offset = self._find(collection, record_id)
+        return None if offset is None else self._record(offset)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return self._find(*key) is not None
+
+    def ids(self, collection: str, start: int = 0) -> Iterator[Tuple[str, int]]:
+        """Yield ``(id, offset)`` in insertion order from position ``start``, decoding no JSON."""
+        meta = self._collections.get(collection)
+        if meta is None:
+            return
+        for position in range(start, meta["count"]):
+            offset = self._offset(meta["order"], position)
+            yield self._id_at(offset), offset
+
+    def record_at(self, offset: int) -> Dict[str, Any]:
+        return self._record(offset)
+
+    def page(self, collection: str, start: int, limit: int) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` records from position ``start`` in insertion order."""
+        meta = self._collections.get(collection)
+        if meta is None:
+            return []
+        end = min(meta["count"], start + limit)
+        return [self._record(self._offset(meta["order"], p)) for p in range(start, end)]
+
+    def document(self) -> Dict[str, Any]:
+        """Decode everything into the same shape ``journal.read_snapshot`` returns."""
+        data: Dict[str, Any] = {
+            name: self.page(name, 0, meta["count"]) for name, meta in self._collections.items()
+        }
+        data["version"] = self.version
+        return data
+
+    def _find(self, collection: str, record_id: str) -> Optional[int]:
+        meta = self._collections.get(collection)
+        if meta is None:
+            return None
+        target = record_id.encode("utf-8")
+        low, high = 0, meta["count"]
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._offset(meta["by_id"], middle)
+            if self._id_bytes(offset) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < meta["count"]:
+            offset = self._offset(meta["by_id"], low)
+            if self._id_bytes(offset) == target:
+                return offset
+        return None
+
+    def _offset(self, table: int, position: int) -> int:
+        return _OFFSET.unpack_from(self._map, table + position * _OFFSET.size)[0]
+
+    def _id_bytes(self, offset: int) -> bytes:
+        _, id_size = _RECORD.unpack_from(self._map, offset)
+        start = offset + _RECORD.size
+        return self._map[start : start + id_size]
+
+    def _id_at(self, offset: int) -> str:
+        return self._id_bytes(offset).decode("utf-8")
+
+    def _record(self, offset: int) -> Dict[str, Any]:
+        size, id_size = _RECORD.unpack_from(self._map, offset)
+        start = offset + _RECORD.size + id_size
+        return codec.loads(self._map[start : start + size])
+
+
+def read_document(path: str) -> Dict[str, Any]:
+    """Return the whole snapshot at ``path`` decoded, or ``{}`` if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with SnapshotReader(path) as reader:
+        return reader.document()
+
+
+def write_document(
+    path: str, data: Dict[str, Any], fsync: bool = False, pretty: bool = False
+) -> None:
+    """Atomically replace ``path`` with ``data`` (collections of records plus ``version``).
+
+    Takes the same arguments as ``journal.write_snapshot``; ``pretty`` has no
+    effect on a binary file.
+    """
+    atomic_write(path, lambda handle: _write(handle, data), fsync)
+
+
+def _write(handle: BinaryIO, data: Dict[str, Any]) -> None:
+    handle.write(_PREFIX.pack(MAGIC, 0))
+    position = _PREFIX.size
+    collections: Dict[str, Dict[str, int]] = {}
+    offsets: Dict[str, List[Tuple[bytes, int]]] = {}
+    for name, records in data.items():
+        if not isinstance(records, list):
+            continue
+        entries = offsets[name] = []
+        for record in records:
+            record_id = str(record["id"]).encode("utf-8")
+            body = codec.dumps(record)
+            handle.write(_RECORD.pack(len(body), len(record_id)))
+            handle.write(record_id)
+            handle.write(body)
+            entries.append((record_id, position))
+            position += _RECORD.size + len(record_id) + len(body)
+    for name, entries in offsets.items():
+        order = position
+        handle.write(b"".join(_OFFSET.pack(offset) for _, offset in entries))
+        position += len(entries) * _OFFSET.size
+        by_id = position
+        handle.write(b"".join(_OFFSET.pack(offset) for _, offset in sorted(entries)))
+        position += len(entries) * _OFFSET.size
+        collections[name] = {"count": len(entries), "order": order, "by_id": by_id}
+    handle.write(codec.dumps({"version": data.get("version", 0), "collections": collections}))
+    handle.seek(0)
+    handle.write(_PREFIX.pack(MAGIC, position))
@@ -2,10 +2,32 @@
 
 from __future__ import annotations
 
-import json
 import os
-import tempfile
-from typing import Any, Dict
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+# Run as a script, so make the shared modules at the repository root importable.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from journal import (  # noqa: E402
+    JOURNAL_SUFFIX,
+    append_mutations,
+    read_collection,
+    read_history,
+    read_snapshot,
+    replay,
+    to_document,
+    to_records,
+)
+from storage import (  # noqa: E402
+    DIRECTORY_STATE_FILE,
+    ConflictError,
+    DirectoryStore,
+    JsonStore,
+    open_storage,
+)
 
 
 SCHEMA: Dict[str, Any] = {
@@ -15,6 +37,7 @@ SCHEMA: Dict[str, Any] = {
     "additionalProperties": False,
     "required": ["equipment", "people", "checkouts"],
     "properties": {
+        "version": {"type": "integer", "minimum": 0},
         "equipment": {
             "type": "array",
             "items": {
@@ -73,36 +96,106 @@ def default_data() -> Dict[str, Any]:
     return {"equipment": [], "people": [], "checkouts": []}
 
 
-def load_data(path: str) -> Dict[str, Any]:
-    """Load data from a JSON file.
+def is_directory_layout(path: str) -> bool:
+    """Return whether ``path`` names a directory data store rather than one JSON file."""
+    return path.endswith(("/", os.sep)) or os.path.isdir(path)
 
-    Returns a default structure if the file does not exist.
+
+def snapshot_path(path: str) -> str:
+    """Return the snapshot file whose journal holds the mutations for ``path``."""
+    return os.path.join(path, DIRECTORY_STATE_FILE) if is_directory_layout(path) else path
+
+
+def journal_path(path: str) -> str:
+    """Return the path of the append-only mutation journal for ``path``."""
+    return snapshot_path(path) + JOURNAL_SUFFIX
+
+
+def _store(path: str) -> JsonStore:
+    store = open_storage(path)
+    if not isinstance(store, JsonStore):
+        raise ValueError(f"{path} is a SQLite database; use cli.py to work with it.")
+    return store
+
+
+def load_data(path: str, collections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Load data from a snapshot (JSON, ``.snap`` or a directory) and replay its journal.
+
+    Returns a default structure if neither file exists. A torn trailing
+    journal line (from a crash mid-append) is ignored. ``version`` counts the
+    mutations applied, matching the numbering used by the API server.
+
+    ``collections`` limits the result to those names. For a directory data
+    store only their files are read, and journal lines that do not mention
+    them are counted without being parsed. Checkouts include those that
+    compaction moved to the history archive.
+
+    Files are read under the data file's shared lock, so a concurrent
+    compaction is never seen half done.
+    """
+    store = _store(path)
+    snapshot = str(store.path)
+    with store.lock.shared():
+        if collections is not None and isinstance(store, DirectoryStore):
+            version = read_snapshot(snapshot).get("version", 0)
+            document = {name: read_collection(snapshot, name) for name in collections}
+        else:
+            document = store.snapshot_reader(snapshot)
+            version = document.pop("version", 0)
+        records = to_records(document)
+        if collections is None:
+            for name in default_data():
+                records.setdefault(name, {})
+        else:
+            records = {name: records.get(name, {}) for name in collections}
+        if "checkouts" in records:
+            # Closed checkouts archived by compaction; newer copies in the snapshot win.
+            archived = {record["id"]: record for record in read_history(snapshot)}
+            archived.update(records["checkouts"])
+            records["checkouts"] = archived
+        version += replay(records, store.journal.journal_path, collections)
+    data: Dict[str, Any] = to_document(records)
+    data["version"] = version
+    return data
+
+
+def append_mutation(path: str, op: str, changes: List[Dict[str, Any]]) -> None:
+    """Append one mutation record to the journal next to ``path``.
+
+    Each change is ``{"action": "put", "collection": ..., "record": {...}}`` or
+    ``{"action": "delete", "collection": ..., "id": ...}``.
     """
-    if not os.path.exists(path):
-        return default_data()
-    with open(path, "r", encoding="utf-8") as handle:
-        return json.load(handle)
+    store = _store(path)
+    with store.lock.exclusive():
+        append_mutations(store.journal.journal_path, [(op, changes)])
 
 
 def save_data(path: str, data: Dict[str, Any]) -> None:
-    """Atomically save data to a JSON file.
+    """Replace the data at ``path`` with ``data`` in the format it is stored in.
+
+    Goes through the same storage backend as the API server, under the data
+    file lock: the snapshot is replaced atomically, the journal discarded and
+    closed checkouts moved to the history archive (those already archived are
+    not written again).
 
-    Writes to a temporary file in the same directory before replacing the target.
+    Raises:
+        ConflictError: If ``data`` has the ``version`` returned by ``load_data``
+            and another process has written since.
     """
-    directory = os.path.dirname(os.path.abspath(path)) or "."
-    os.makedirs(directory, exist_ok=True)
-    with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=directory) as tmp:
-        json.dump(data, tmp, indent=2, sort_keys=True)
-        tmp.write("\n")
-        temp_name = tmp.name
-    os.replace(temp_name, path)
+    store = _store(path)
+    archived = {record["id"] for record in read_history(str(store.path))}
+    checkouts = [record for record in data.get("checkouts", []) if record["id"] not in archived]
+    with store.lock.exclusive():
+        store.load()
+        if data.get("version", store.version) != store.version:
+            raise ConflictError("Data changed since it was loaded; load it again.")
+        store.save({**data, "checkouts": checkouts})
 
 
 def main() -> None:
-    """Simple entry point to initialize data storage."""
+    """Simple entry point to initialize data storage and compact its journal."""
     data_path = os.environ.get("EQUIPMENT_ELLIE_DATA", "equipment_data.json")
-    data = load_data(data_path)
-    save_data(data_path, data)
+    _store(data_path).compact()
     print(f"Data stored at {data_path}")
 
 
@@ -1,9 +1,17 @@
+const PAGE_SIZE = 50;
+
 const state = {
   equipment: [],
+  equipmentTotal: 0,
+  nextCursor: null,
   people: [],
+  peopleById: new Map(),
   filter: "all",
   search: "",
   selectedId: null,
+  selected: null,
+  version: null,
+  stream: null,
   editingEquipmentId: null,
   editingPersonId: null,
 };
@@ -56,7 +64,7 @@ const showToast = (message, isError = false) => {
   setTimeout(() => elements.toast.classList.remove("show"), 2400);
 };
 
-const api = async (path, options = {}) => {
+const request = async (path, options = {}) => {
   const response = await fetch(path, {
     headers: { "Content-Type": "application/json" },
     ...options,
@@ -71,53 +79,224 @@ const api = async (path, options = {}) => {
   if (!response.ok) {
     throw new Error((data && data.error) || text || "Something went wrong");
   }
-  return data;
+  return { data, headers: response.headers };
+};
+
+const api = async (path, options = {}) => (await request(path, options)).data;
+
+// Filtering, search and paging happen on the server; the browser only holds
+// the pages it has shown. Stale responses are dropped via the sequence number.
+let equipmentRequest = 0;
+
+const equipmentParams = (cursor) => {
+  const params = new URLSearchParams({ limit: PAGE_SIZE, sort: "name" });
+  if (state.filter !== "all") params.set("status", state.filter);
+  if (state.search.trim()) params.set("q", state.search.trim());
+  if (cursor) params.set("cursor", cursor);
+  return params;
+};
+
+const loadEquipment = async (append = false) => {
+  const sequence = ++equipmentRequest;
+  const { data, headers } = await request(
+    `/api/equipment?${equipmentParams(append ? state.nextCursor : null)}`
+  );
+  if (sequence !== equipmentRequest) return null;
+  state.equipment = append ? state.equipment.concat(data) : data;
+  state.equipmentTotal = Number(headers.get("X-Total-Count") || state.equipment.length);
+  state.nextCursor = headers.get("X-Next-Cursor");
+  return Number(headers.get("X-Data-Version"));
+};
+
+const setPeople = (people) => {
+  state.people = people;
+  state.peopleById = new Map(people.map((person) => [person.id, person]));
+};
+
+const loadSelected = async () => {
+  if (!state.selectedId) {
+    state.selected = null;
+    return;
+  }
+  state.selected =
+    state.equipment.find((item) => item.id === state.selectedId) ||
+    (await api(`/api/equipment/${state.selectedId}`).catch(() => null));
 };
 
+// One request for the first page of equipment (borrowers embedded), all
+// people and the data version they were read at.
 const loadData = async () => {
   try {
-    state.equipment = await api("/api/equipment");
-    state.people = await api("/api/people");
+    const sequence = ++equipmentRequest;
+    const data = await api(`/api/bootstrap?${equipmentParams(null)}`);
+    if (sequence === equipmentRequest) {
+      state.equipment = data.equipment;
+      state.equipmentTotal = data.equipment_total;
+      state.nextCursor = data.next_cursor;
+    }
+    setPeople(data.people);
+    state.version = data.version;
+    await loadSelected();
   } catch (error) {
     state.equipment = [];
-    state.people = [];
+    state.equipmentTotal = 0;
+    state.nextCursor = null;
+    setPeople([]);
     showToast("API unavailable. Showing empty state.", true);
   }
   render();
 };
 
-const filteredEquipment = () => {
-  const search = state.search.toLowerCase();
-  return state.equipment.filter((item) => {
-    const matchesSearch =
-      item.name.toLowerCase().includes(search) ||
-      (item.tag || "").toLowerCase().includes(search) ||
-      personName(item.checked_out_to).toLowerCase().includes(search);
-
-    if (!matchesSearch) return false;
-
-    if (state.filter === "all") return true;
-    if (state.filter === "available") return item.status === "available";
-    if (state.filter === "checked_out") return item.status === "checked_out";
-    if (state.filter === "overdue") {
-      return (
-        item.status === "checked_out" &&
-        item.due_at &&
-        new Date(item.due_at) < now()
-      );
+const byName = (a, b) => a.name.localeCompare(b.name, undefined, { sensitivity: "base" });
+
+// Only used for the handful of records in a delta, never to filter the list.
+const matchesFilter = (item) => {
+  if (state.filter === "all") return true;
+  if (state.filter === "overdue") {
+    return item.status === "checked_out" && item.due_at && new Date(item.due_at) < now();
+  }
+  return item.status === state.filter;
+};
+
+const applyPeopleChanges = ({ updated, deleted }) => {
+  if (!updated.length && !deleted.length) return;
+  updated.forEach((person) => state.peopleById.set(person.id, person));
+  deleted.forEach((personId) => state.peopleById.delete(personId));
+  state.people = [...state.peopleById.values()].sort(byName);
+  // Drop embedded borrowers that may now be stale.
+  const changed = new Set([...updated.map((person) => person.id), ...deleted]);
+  state.equipment = state.equipment.map((item) =>
+    item.borrower && changed.has(item.borrower.id) ? { ...item, borrower: null } : item
+  );
+  if (state.selected && state.selected.borrower && changed.has(state.selected.borrower.id)) {
+    state.selected = { ...state.selected, borrower: null };
+  }
+};
+
+const applyEquipmentChanges = ({ updated, deleted }) => {
+  const changed = new Map(updated.map((item) => [item.id, item]));
+  const removed = new Set(deleted);
+  const loaded = new Set(state.equipment.map((item) => item.id));
+  // Search matching happens on the server, so with a query active loaded
+  // items are only patched; membership is refreshed on the next search.
+  const searching = Boolean(state.search.trim());
+  const items = [];
+  state.equipment.forEach((item) => {
+    const next = changed.get(item.id) || item;
+    if (removed.has(item.id) || (!searching && !matchesFilter(next))) {
+      state.equipmentTotal -= 1;
+      return;
+    }
+    items.push(next);
+  });
+  // With every page loaded, an unseen match is new to this view.
+  if (!searching && !state.nextCursor) {
+    updated
+      .filter((item) => !loaded.has(item.id) && matchesFilter(item))
+      .forEach((item) => {
+        items.push(item);
+        state.equipmentTotal += 1;
+      });
+    items.sort(byName);
+  }
+  state.equipment = items;
+
+  if (state.selected) {
+    if (removed.has(state.selected.id)) {
+      state.selectedId = null;
+      state.selected = null;
+    } else {
+      state.selected = changed.get(state.selected.id) || state.selected;
+    }
+  }
+};
+
+const applyDelta = (delta) => {
+  applyPeopleChanges(delta.people);
+  applyEquipmentChanges(delta.equipment);
+  state.version = delta.version;
+};
+
+// Fetch only what changed since the last sync and patch local state.
+const syncChanges = async () => {
+  if (state.version === null) {
+    await loadData();
+    return;
+  }
+  try {
+    const delta = await api(`/api/changes?since=${state.version}`);
+    if (delta.resync) {
+      await loadData();
+      return;
     }
-    return true;
+    applyDelta(delta);
+  } catch (error) {
+    showToast(error.message, true);
+  }
+  render();
+};
+
+// Changes made at other desks arrive over Server-Sent Events.
+const subscribe = () => {
+  if (!window.EventSource || state.stream || state.version === null) return;
+  state.stream = new EventSource(`/api/stream?since=${state.version}`);
+  state.stream.addEventListener("change", (event) => {
+    const delta = JSON.parse(event.data);
+    if (delta.version <= state.version) return;
+    const selectedId = state.selectedId;
+    const touchesSelection =
+      delta.equipment.updated.some((item) => item.id === selectedId) ||
+      delta.equipment.deleted.includes(selectedId) ||
+      delta.people.updated.length > 0 ||
+      delta.people.deleted.length > 0;
+    applyDelta(delta);
+    renderEquipmentList();
+    // Leave the details panel alone unless it shows stale data, so a
+    // half-filled assignment form is not reset by unrelated changes.
+    if (touchesSelection) renderDetailsPanel();
   });
+  state.stream.addEventListener("resync", () => loadData());
+};
+
+const reloadEquipment = async () => {
+  try {
+    await loadEquipment();
+  } catch (error) {
+    showToast(error.message, true);
+  }
+  renderEquipmentList();
 };
 
-const personName = (personId) => {
-  const person = state.people.find((p) => p.id === personId);
+const loadMoreEquipment = async () => {
+  try {
+    await loadEquipment(true);
+  } catch (error) {
+    showToast(error.message, true);
+  }
+  renderEquipmentList();
+};
+
+const debounce = (fn, delay) => {
+  let timer = null;
+  return (...args) => {
+    clearTimeout(timer);
+    timer = setTimeout(() => fn(...args), delay);
+  };
+};
+
+// Bootstrap embeds the borrower; items loaded or changed later are joined
+// through the people map.
+const borrowerName = (equipment) => {
+  if (equipment.borrower && equipment.borrower.id === equipment.checked_out_to) {
+    return equipment.borrower.name;
+  }
+  const person = state.peopleById.get(equipment.checked_out_to);
   return person ? person.name : "";
 };
 
 const renderEquipmentList = () => {
-  const items = filteredEquipment();
-  elements.equipmentCount.textContent = items.length;
+  const items = state.equipment;
+  elements.equipmentCount.textContent = state.equipmentTotal;
   elements.equipmentList.innerHTML = "";
 
   items.forEach((equipment) => {
@@ -133,7 +312,7 @@ const renderEquipmentList = () => {
           ${equipment.tag ? `Tag: ${equipment.tag}` : "No tag"} ·
           ${
             equipment.status === "checked_out"
-              ? `With ${personName(equipment.checked_out_to) || "Unknown"}`
+              ? `With ${borrowerName(equipment) || "Unknown"}`
               : "Available"
           }
         </div>
@@ -147,14 +326,23 @@ const renderEquipmentList = () => {
     `;
     card.addEventListener("click", () => {
       state.selectedId = equipment.id;
+      state.selected = equipment;
       render();
     });
     elements.equipmentList.appendChild(card);
   });
+
+  if (state.nextCursor) {
+    const more = document.createElement("button");
+    more.className = "secondary load-more";
+    more.textContent = `Load more (${state.equipmentTotal - items.length} left)`;
+    more.addEventListener("click", loadMoreEquipment);
+    elements.equipmentList.appendChild(more);
+  }
 };
 
 const renderDetailsPanel = () => {
-  const equipment = state.equipment.find((item) => item.id === state.selectedId);
+  const equipment = state.selected;
   if (!equipment) {
     elements.detailsPanel.innerHTML = `
       <div class="details-empty">
@@ -166,7 +354,7 @@ const renderDetailsPanel = () => {
   }
 
   const status = statusLabel(equipment);
-  const assignedName = personName(equipment.checked_out_to) || "Unassigned";
+  const assignedName = borrowerName(equipment) || "Unassigned";
 
   elements.detailsPanel.innerHTML = `
     <div class="details-section">
@@ -245,7 +433,7 @@ const attachDetailEvents = (equipment) => {
           body: JSON.stringify({ equipment_id: equipment.id, person_id: personId }),
         });
         showToast("Equipment assigned.");
-        await loadData();
+        await syncChanges();
       } catch (error) {
         showToast(error.message, true);
       }
@@ -260,7 +448,7 @@ const attachDetailEvents = (equipment) => {
           body: JSON.stringify({ equipment_id: equipment.id }),
         });
         showToast("Checked in.");
-        await loadData();
+        await syncChanges();
       } catch (error) {
         showToast(error.message, true);
       }
@@ -280,7 +468,7 @@ const attachDetailEvents = (equipment) => {
           body: JSON.stringify({ equipment_id: equipment.id, person_id: personId }),
         });
         showToast("Equipment transferred.");
-        await loadData();
+        await syncChanges();
       } catch (error) {
         showToast(error.message, true);
       }
@@ -294,7 +482,8 @@ const attachDetailEvents = (equipment) => {
       await api(`/api/equipment/${equipment.id}`, { method: "DELETE" });
       showToast("Equipment deleted.");
       state.selectedId = null;
-      await loadData();
+      state.selected = null;
+      await syncChanges();
     } catch (error) {
       showToast(error.message, true);
     }
@@ -338,7 +527,7 @@ const renderPeopleList = () => {
       try {
         await api(`/api/people/${personId}`, { method: "DELETE" });
         showToast("Person deleted.");
-        await loadData();
+        await syncChanges();
         renderPeopleList();
       } catch (error) {
         showToast(error.message, true);
@@ -410,7 +599,7 @@ const handleEquipmentSubmit = async (event) => {
       showToast("Equipment added.");
     }
     closeDialog("equipmentDialog");
-    await loadData();
+    await syncChanges();
   } catch (error) {
     showToast(error.message, true);
   }
@@ -438,16 +627,17 @@ const handlePeopleSubmit = async (event) => {
       showToast("Person added.");
     }
     closeDialog("peopleDialog");
-    await loadData();
+    await syncChanges();
   } catch (error) {
     showToast(error.message, true);
   }
 };
 
 const bindEvents = () => {
+  const searchEquipment = debounce(reloadEquipment, 200);
   elements.searchInput.addEventListener("input", (event) => {
     state.search = event.target.value;
-    renderEquipmentList();
+    searchEquipment();
   });
 
   elements.filterButtons.forEach((button) => {
@@ -455,7 +645,7 @@ const bindEvents = () => {
       elements.filterButtons.forEach((btn) => btn.classList.remove("active"));
       button.classList.add("active");
       state.filter = button.dataset.filter;
-      renderEquipmentList();
+      reloadEquipment();
     });
   });
 
@@ -471,4 +661,4 @@ const bindEvents = () => {
 };
 
 bindEvents();
-loadData();
+loadData().then(subscribe);
@@ -1,17 +1,812 @@
-import json
-from dataclasses import dataclass
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import codec
+import snapshot
+from journal import (
+    Journal,
+    Records,
+    append_history,
+    apply_changes,
+    collection_path,
+    delete,
+    put,
+    read_collection,
+    read_entries,
+    read_history,
+    read_snapshot,
+    read_split_snapshot,
+    read_state,
+    replay,
+    to_document,
+    to_records,
+    write_snapshot,
+    write_split_snapshot,
+)
+from locking import FileLock
+
+COLLECTIONS = ("equipment", "people", "checkouts")
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+SNAPSHOT_SUFFIXES = (".snap",)
+# File naming the collections of a directory data store, see ``DirectoryStore``.
+DIRECTORY_STATE_FILE = "state.json"
+
+# An ``(op, changes)`` pair as passed to ``Storage.commit_many``.
+MutationRecord = Tuple[str, List[Dict[str, Any]]]
+
+
+def is_history(collection: str, record: Dict[str, Any]) -> bool:
+    """Whether ``record`` belongs to history (a closed checkout) rather than live state."""
+    return collection == "checkouts" and record.get("checked_in_at") is not None
+
+
+class ConflictError(RuntimeError):
+    """Raised when storage changed since the caller's ``expected_version``."""
+
+
+class Storage(ABC):
+    """Persistence backend shared by the services, the CLI and the Flask API.
+
+    Records are plain dicts with a string ``id``. Mutations are expressed as
+    journal changes (see ``journal.put`` / ``journal.delete``) and a single
+    ``commit`` applies all of them atomically. Every commit bumps ``version``,
+    which writers pass back as ``expected_version`` to detect lost updates from
+    other processes.
+    """
+
+    version: int = 0
+
+    @abstractmethod
+    def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Return every collection as a list of records and sync ``version``.
+
+        Archived history (see ``is_history``) may be left out; use ``history``.
+        """
+
+    @abstractmethod
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Return one record by id, or ``None``."""
+
+    def get_many(self, collection: str, record_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the records with these ids, keyed by id; missing ones are left out."""
+        found = {}
+        for record_id in record_ids:
+            record = self.get(collection, record_id)
+            if record is not None:
+                found[record_id] = record
+        return found
+
+    @abstractmethod
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        """Return all records of a collection in insertion order."""
+
+    def list_page(self, collection: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Return ``limit`` records of ``list(collection)`` starting at ``offset``."""
+        return self.list(collection)[offset : offset + limit]
+
+    def commit(
+        self,
+        op: str,
+        changes: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+    ) -> int:
+        """Persist ``changes`` as one atomic mutation named ``op``.
+
+        Raises:
+            ConflictError: If ``expected_version`` is given and another writer
+                committed since.
+        """
+        return self.commit_many([(op, changes)], expected_version)
+
+    @abstractmethod
+    def commit_many(
+        self,
+        mutations: List[MutationRecord],
+        expected_version: Optional[int] = None,
+    ) -> int:
+        """Persist several ``(op, changes)`` mutations with one write and flush.
+
+        Either all of them are committed or none is; each bumps ``version``.
+        """
+
+    @abstractmethod
+    def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Return mutations committed after ``version`` (each with its ``version``).
+
+        Returns ``None`` when they are no longer available and the caller must
+        ``load`` again.
+        """
+
+    @abstractmethod
+    def history(self, equipment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return closed checkouts, optionally for one item, oldest first."""
+
+    def iter_records(self, collection: str) -> Iterator[Dict[str, Any]]:
+        """Yield every record of ``collection`` like ``list``, without listing them first."""
+        return iter(self.list(collection))
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        """Yield every closed checkout, in no particular order, without listing them first."""
+        return iter(self.history())
+
+    @abstractmethod
+    def save(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Replace the whole dataset with ``data``."""
+
+    def compact(self) -> None:
+        """Fold pending log entries into the main data file; a no-op where there are none."""
+
+    def data_files(self) -> List[str]:
+        """Return the paths of the files holding live data (not history or locks)."""
+        return []
+
+    def disk_bytes(self) -> int:
+        """Return the combined size of ``data_files`` that exist."""
+        return sum(os.path.getsize(path) for path in self.data_files() if os.path.exists(path))
+
+    def close(self) -> None:
+        pass
 
 
 @dataclass
-class JsonStore:
+class JsonStore(Storage):
+    """Snapshot JSON file plus an append-only journal; suited to small installs.
+
+    A ``<path>.lock`` file serializes writers across processes. Unless
+    ``durability`` is ``"none"``, journal appends and snapshots are fsynced.
+    Compaction moves closed checkouts out of the snapshot into
+    ``<path>.history``, so loading stays proportional to live state. The
+    snapshot is compact JSON unless ``pretty`` is set.
+    """
+
     path: Path
+    durability: str = "none"
+    pretty: bool = False
+    journal: Journal = field(init=False, repr=False)
+    lock: FileLock = field(init=False, repr=False)
+
+    # Snapshot file format, see ``Journal``.
+    snapshot_reader: ClassVar[Callable[[str], Dict[str, Any]]] = staticmethod(read_snapshot)
+    snapshot_writer: ClassVar[Callable[..., None]] = staticmethod(write_snapshot)
+
+    def __post_init__(self) -> None:
+        self.journal = Journal(
+            str(self.path),
+            fsync=self.durability != "none",
+            pretty=self.pretty,
+            read=self.snapshot_reader,
+            write=self.snapshot_writer,
+        )
+        self.lock = FileLock(str(self.path) + ".lock")
+
+    @property
+    def version(self) -> int:
+        return self.journal.version
 
     def load(self) -> Dict[str, Any]:
-        if not self.path.exists():
-            return {"equipment": [], "people": []}
-        return json.loads(self.path.read_text())
+        with self.lock.shared():
+            records = self.journal.load()
+        data: Dict[str, Any] = {name: [] for name in COLLECTIONS}
+        data.update(to_document(records))
+        return data
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        for record in self.list(collection):
+            if record.get("id") == record_id:
+                return record
+        return None
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        return list(self.load().get(collection, []))
+
+    def iter_records(self, collection: str) -> Iterator[Dict[str, Any]]:
+        # The snapshot is parsed whole, but only this collection is kept.
+        with self.lock.shared():
+            records = self._read_collection(collection)
+        return iter(records.values())
+
+    def get_many(self, collection: str, record_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        # One read of the collection rather than one per id.
+        with self.lock.shared():
+            records = self._read_collection(collection)
+        return {record_id: records[record_id] for record_id in record_ids if record_id in records}
 
     def save(self, data: Dict[str, Any]) -> None:
-        self.path.write_text(json.dumps(data, indent=2, sort_keys=True))
+        """Write ``data`` as a fresh snapshot, discarding the journal."""
+        with self.lock.exclusive():
+            self.journal.load()
+            self._compact(to_records(data), version=self.journal.version + 1)
+
+    def compact(self) -> None:
+        """Fold the journal into a fresh snapshot now, archiving closed checkouts."""
+        with self.lock.exclusive():
+            self._compact(self.journal.load())
+
+    def commit_many(
+        self,
+        mutations: List[MutationRecord],
+        expected_version: Optional[int] = None,
+    ) -> int:
+        """Journal ``mutations`` without rewriting the snapshot."""
+        with self.lock.exclusive():
+            if expected_version is not None and (
+                expected_version != self.journal.version or self.journal.changed_on_disk()
+            ):
+                raise ConflictError("Data changed since it was read; retry.")
+            version = self.journal.append_many(mutations)
+            if self.journal.compaction_due():
+                self._compact(self.journal.load())
+                version = self.journal.version
+            return version
+
+    def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        # ``version`` may trail the journal while this process's own commit is
+        # being applied; ``read_since`` still has those entries in memory.
+        with self.lock.shared():
+            return self.journal.read_since(version)
+
+    def history(self, equipment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        path = str(self.path)
+        with self.lock.shared():
+            closed = {record["id"]: record for record in read_history(path)}
+            for record in self._read_collection("checkouts").values():
+                if is_history("checkouts", record):
+                    closed[record["id"]] = record
+        return sorted(
+            (
+                record
+                for record in closed.values()
+                if equipment_id is None or record.get("equipment_id") == equipment_id
+            ),
+            key=lambda record: record.get("checked_out_at") or "",
+        )
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        path = str(self.path)
+        with self.lock.shared():
+            checkouts = self._read_collection("checkouts")
+        closed = {
+            record_id: record
+            for record_id, record in checkouts.items()
+            if is_history("checkouts", record)
+        }
+        # The archive is append-only and readers skip a torn tail, so it is
+        # streamed without holding the lock. Only ids are kept to drop repeats.
+        seen = set(closed)
+        for record in read_history(path):
+            if record["id"] not in seen:
+                seen.add(record["id"])
+                yield record
+        yield from closed.values()
+
+    def data_files(self) -> List[str]:
+        return [str(self.path), self.journal.journal_path]
+
+    def _read_collection(self, name: str) -> Dict[str, Dict[str, Any]]:
+        """Return collection ``name`` as of the journal's end, keyed by id; hold the lock."""
+        return read_state(str(self.path), self.snapshot_reader).get(name, {})
+
+    def _compact(self, records: Records, version: Optional[int] = None) -> None:
+        checkouts = records.get("checkouts", {})
+        closed = [record for record in checkouts.values() if is_history("checkouts", record)]
+        if closed:
+            # Archive first: a crash before the snapshot is replaced only
+            # leaves duplicates in the history, which readers collapse by id.
+            append_history(str(self.path), closed, fsync=self.journal.fsync)
+            for record in closed:
+                del checkouts[record["id"]]
+        self.journal.compact(records, version=version)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS equipment (
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    checked_out_to TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS equipment_status ON equipment (status);
+CREATE INDEX IF NOT EXISTS equipment_checked_out_to ON equipment (checked_out_to);
+CREATE TABLE IF NOT EXISTS people (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkouts (
+    id TEXT PRIMARY KEY,
+    equipment_id TEXT,
+    checked_in_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checkouts_equipment_id ON checkouts (equipment_id);
+CREATE INDEX IF NOT EXISTS checkouts_active
+    ON checkouts (equipment_id) WHERE checked_in_at IS NULL;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    changes TEXT NOT NULL
+);
+"""
+
+# Record fields mirrored into indexed columns, per table.
+_SQLITE_COLUMNS: Dict[str, tuple] = {
+    "equipment": ("status", "checked_out_to"),
+    "people": (),
+    "checkouts": ("equipment_id", "checked_in_at"),
+}
+
+# Committed mutations kept in the ``changes`` table for other processes to tail.
+CHANGE_RETENTION = 10000
+# Rows fetched per query by ``SqliteStore.iter_records`` and ``iter_history``.
+ROWS_PER_CHUNK = 1000
+# Ids bound per ``IN (...)`` query; older SQLite builds allow at most 999 parameters.
+IDS_PER_QUERY = 500
+
+
+class SnapshotStore(JsonStore):
+    """``JsonStore`` whose snapshot is the binary format in ``snapshot.py``.
+
+    Loading the whole dataset costs about the same as JSON, but ``get`` and
+    ``list_page`` read the memory-mapped snapshot in place and only scan the
+    journal for newer versions of what they return, so one-off lookups stay
+    fast however large the file grows.
+    """
+
+    snapshot_reader = staticmethod(snapshot.read_document)
+    snapshot_writer = staticmethod(snapshot.write_document)
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock.shared():
+            record = None
+            if self.path.exists():
+                with snapshot.SnapshotReader(str(self.path)) as reader:
+                    record = reader.get(collection, record_id)
+            needle = codec.dumps(record_id)
+            for entry, _ in read_entries(self.journal.journal_path, containing=needle):
+                for change in entry["changes"]:
+                    if change["collection"] != collection:
+                        continue
+                    if change["action"] == "put" and change["record"]["id"] == record_id:
+                        record = change["record"]
+                    elif change["action"] == "delete" and change["id"] == record_id:
+                        record = None
+        return record
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        return self.list_page(collection, 0, sys.maxsize)
+
+    def list_page(self, collection: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        with self.lock.shared():
+            newer = self._newer(collection)
+            if not self.path.exists():
+                added = [record for record in newer.values() if record is not None]
+                return added[offset : offset + limit]
+            with snapshot.SnapshotReader(str(self.path)) as reader:
+                if not newer:
+                    return reader.page(collection, offset, limit)
+                selected = islice(self._merged(reader, collection, newer), offset, offset + limit)
+                return [
+                    reader.record_at(item) if isinstance(item, int) else item for item in selected
+                ]
+
+    def iter_records(self, collection: str) -> Iterator[Dict[str, Any]]:
+        with self.lock.shared():
+            newer = self._newer(collection)
+            reader = snapshot.SnapshotReader(str(self.path)) if self.path.exists() else None
+        if reader is None:
+            yield from (record for record in newer.values() if record is not None)
+            return
+        # The mapping stays readable after a compaction replaces the file, so
+        # records are decoded one at a time without holding the lock.
+        with reader:
+            for item in self._merged(reader, collection, newer):
+                yield reader.record_at(item) if isinstance(item, int) else item
+
+    def get_many(self, collection: str, record_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        with self.lock.shared():
+            newer = self._newer(collection)
+            reader = snapshot.SnapshotReader(str(self.path)) if self.path.exists() else None
+        found: Dict[str, Dict[str, Any]] = {}
+        # As in ``iter_records``, the mapping is read after the lock is released.
+        with reader if reader is not None else nullcontext():
+            for record_id in record_ids:
+                if record_id in newer:
+                    record = newer[record_id]
+                elif reader is not None:
+                    record = reader.get(collection, record_id)
+                else:
+                    record = None
+                if record is not None:
+                    found[record_id] = record
+        return found
+
+    def _newer(self, collection: str) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Return journaled versions of ``collection``'s records; ``None`` marks a delete."""
+        newer: Dict[str, Optional[Dict[str, Any]]] = {}
+        needle = codec.dumps(collection)
+        for entry, _ in read_entries(self.journal.journal_path, containing=needle):
+            for change in entry["changes"]:
+                if change["collection"] != collection:
+                    continue
+                if change["action"] == "put":
+                    newer[change["record"]["id"]] = change["record"]
+                else:
+                    newer[change["id"]] = None
+        return newer
+
+    @staticmethod
+    def _merged(
+        reader: snapshot.SnapshotReader,
+        collection: str,
+        newer: Dict[str, Optional[Dict[str, Any]]],
+    ) -> Iterator[Union[int, Dict[str, Any]]]:
+        """Yield the collection in order: snapshot offsets (still undecoded) or newer records."""
+        for record_id, position in reader.ids(collection):
+            if record_id not in newer:
+                yield position
+            elif newer[record_id] is not None:
+                yield newer[record_id]
+        for record_id, record in newer.items():
+            if record is not None and (collection, record_id) not in reader:
+                yield record
+
+
+class SqliteStore(Storage):
+    """SQLite backend: single-row transactional updates and indexed lookups.
+
+    Commits run under ``BEGIN IMMEDIATE`` so concurrent processes serialize on
+    SQLite's own write lock, and the ``meta`` version row detects stale writers.
+    """
+
+    def __init__(self, path: Union[str, Path], durability: str = "none") -> None:
+        self.path = Path(path)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs the WAL on every commit; a group commit is one transaction.
+        synchronous = "OFF" if durability == "none" else "FULL"
+        self._connection.execute(f"PRAGMA synchronous={synchronous}")
+        self._connection.executescript(_SQLITE_SCHEMA)
+
+    def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._transaction("BEGIN"):
+            data = {
+                collection: self._select_all(collection, live_only=True)
+                for collection in COLLECTIONS
+            }
+            self.version = self._current_version()
+        return data
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT data FROM {_table(collection)} WHERE id = ?", (record_id,)
+            ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def get_many(self, collection: str, record_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        record_ids = list(record_ids)
+        found = {}
+        for start in range(0, len(record_ids), IDS_PER_QUERY):
+            chunk = record_ids[start : start + IDS_PER_QUERY]
+            placeholders = ", ".join("?" * len(chunk))
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT id, data FROM {_table(collection)} WHERE id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            found.update((record_id, codec.loads(data)) for record_id, data in rows)
+        return found
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._select_all(collection)
+
+    def commit_many(
+        self,
+        mutations: List[MutationRecord],
+        expected_version: Optional[int] = None,
+    ) -> int:
+        with self._transaction("BEGIN IMMEDIATE"):
+            version = self._current_version()
+            if expected_version is not None and expected_version != version:
+                raise ConflictError("Data changed since it was read; retry.")
+            for op, changes in mutations:
+                for change in changes:
+                    table = _table(change["collection"])
+                    if change["action"] == "put":
+                        self._upsert(table, change["record"])
+                    else:
+                        self._connection.execute(
+                            f"DELETE FROM {table} WHERE id = ?", (change["id"],)
+                        )
+                version += 1
+                self._connection.execute(
+                    "INSERT INTO changes (version, op, changes) VALUES (?, ?, ?)",
+                    (version, op, codec.dumps(changes).decode("utf-8")),
+                )
+            self._connection.execute(
+                "DELETE FROM changes WHERE version <= ?", (version - CHANGE_RETENTION,)
+            )
+            self._set_version(version)
+        return version
+
+    def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        with self._transaction("BEGIN"):
+            current = self._current_version()
+            rows = self._connection.execute(
+                "SELECT version, op, changes FROM changes WHERE version > ? ORDER BY version",
+                (version,),
+            ).fetchall()
+        if len(rows) != current - version:
+            return None
+        self.version = current
+        return [
+            {"version": row_version, "op": op, "changes": codec.loads(changes)}
+            for row_version, op, changes in rows
+        ]
+
+    def history(self, equipment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT data FROM checkouts WHERE checked_in_at IS NOT NULL"
+        params: tuple = ()
+        if equipment_id is not None:
+            query += " AND equipment_id = ?"
+            params = (equipment_id,)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY rowid", params).fetchall()
+        return [codec.loads(data) for (data,) in rows]
+
+    def iter_records(self, collection: str) -> Iterator[Dict[str, Any]]:
+        return self._iter_rows(_table(collection))
+
+    def iter_history(self) -> Iterator[Dict[str, Any]]:
+        return self._iter_rows("checkouts", "checked_in_at IS NOT NULL AND ")
+
+    def save(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
+        with self._transaction("BEGIN IMMEDIATE"):
+            for collection in COLLECTIONS:
+                self._connection.execute(f"DELETE FROM {collection}")
+            for collection, records in data.items():
+                table = _table(collection)
+                for record in records:
+                    self._upsert(table, record)
+            # Dropping the change history makes other processes reload in full.
+            self._connection.execute("DELETE FROM changes")
+            self._set_version(self._current_version() + 1)
+
+    def compact(self) -> None:
+        with self._lock:
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def data_files(self) -> List[str]:
+        return [str(self.path), str(self.path) + "-wal"]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @contextmanager
+    def _transaction(self, begin: str) -> Iterator[None]:
+        with self._lock:
+            self._connection.execute(begin)
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _current_version(self) -> int:
+        return self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()[0]
+
+    def _set_version(self, version: int) -> None:
+        self._connection.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+        self.version = version
+
+    def _iter_rows(self, table: str, condition: str = "") -> Iterator[Dict[str, Any]]:
+        """Yield ``table``'s records in rowid order, ``ROWS_PER_CHUNK`` per query."""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT rowid, data FROM {table} "
+                    f"WHERE {condition}rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, ROWS_PER_CHUNK),
+                ).fetchall()
+            for _, data in rows:
+                yield codec.loads(data)
+            if len(rows) < ROWS_PER_CHUNK:
+                return
+            last_rowid = rows[-1][0]
+
+    def _select_all(self, collection: str, live_only: bool = False) -> List[Dict[str, Any]]:
+        if live_only and collection == "checkouts":
+            # Served by the partial ``checkouts_active`` index; ordering by
+            # rowid would force a scan over the whole history.
+            query = "SELECT data FROM checkouts WHERE checked_in_at IS NULL"
+        else:
+            query = f"SELECT data FROM {_table(collection)} ORDER BY rowid"
+        rows = self._connection.execute(query).fetchall()
+        return [codec.loads(data) for (data,) in rows]
+
+    def _upsert(self, table: str, record: Dict[str, Any]) -> None:
+        columns = _SQLITE_COLUMNS[table]
+        names = ", ".join(("id",) + columns + ("data",))
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        updates = ", ".join(f"{name} = excluded.{name}" for name in columns + ("data",))
+        self._connection.execute(
+            f"INSERT INTO {table} ({names}) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}",
+            (
+                record["id"],
+                *(record.get(name) for name in columns),
+                codec.dumps(record).decode("utf-8"),
+            ),
+        )
+
+
+class StagedStore(Storage):
+    """Reads ``backend`` once and buffers commits in memory until ``flush``.
+
+    Reads see the buffered changes, so a script of many service calls costs
+    one load and one write. ``save`` is buffered too, as the puts and deletes
+    that turn the current records into the new ones. ``flush`` commits everything in one transaction
+    and fails with ``ConflictError`` if another writer got in first.
+    """
+
+    def __init__(self, backend: Storage) -> None:
+        self.backend = backend
+        self._records = to_records(backend.load())
+        self.base_version = self.version = backend.version
+        self.pending: List[MutationRecord] = []
+
+    def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        data: Dict[str, List[Dict[str, Any]]] = {name: [] for name in COLLECTIONS}
+        data.update(
+            (name, [dict(record) for record in records.values()])
+            for name, records in self._records.items()
+        )
+        return data
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        record = self._records.get(collection, {}).get(record_id)
+        return dict(record) if record is not None else None
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        return [dict(record) for record in self._records.get(collection, {}).values()]
+
+    def commit_many(
+        self,
+        mutations: List[MutationRecord],
+        expected_version: Optional[int] = None,
+    ) -> int:
+        if expected_version is not None and expected_version != self.version:
+            raise ConflictError("Data changed since it was read; retry.")
+        for op, changes in mutations:
+            apply_changes(self._records, changes)
+            self.pending.append((op, changes))
+            self.version += 1
+        return self.version
+
+    def changes_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        return None
+
+    def history(self, equipment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.backend.history(equipment_id)
+
+    def save(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Buffer replacing the records with ``data``, as one mutation of the differences.
+
+        ``flush`` then commits it like any other write, so a concurrent writer
+        still causes a ``ConflictError`` instead of being overwritten.
+        """
+        changes = []
+        for collection in dict.fromkeys([*COLLECTIONS, *self._records, *data]):
+            current = self._records.get(collection, {})
+            wanted = {record["id"]: record for record in data.get(collection, [])}
+            changes.extend(
+                delete(collection, record_id) for record_id in current if record_id not in wanted
+            )
+            changes.extend(
+                put(collection, dict(record))
+                for record_id, record in wanted.items()
+                if current.get(record_id) != record
+            )
+        if changes:
+            self.commit("save", changes)
+
+    def data_files(self) -> List[str]:
+        return self.backend.data_files()
+
+    def flush(self) -> int:
+        """Commit the buffered mutations to the backend; return its new version."""
+        if self.pending:
+            self.backend.commit_many(self.pending, expected_version=self.base_version)
+            self.pending = []
+        self.base_version = self.version = self.backend.version
+        return self.version
+
+
+class DirectoryStore(JsonStore):
+    """``JsonStore`` split into one snapshot file per collection inside a directory.
+
+    ``path`` is the directory's ``state.json``, which holds the version and
+    the collection names; the journal, lock and history sit next to it.
+    ``get`` and ``list`` read only their collection's file plus the journal
+    lines that mention it, so listing people does not parse checkouts.
+    """
+
+    snapshot_reader = staticmethod(read_split_snapshot)
+    snapshot_writer = staticmethod(write_split_snapshot)
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock.shared():
+            return self._read_collection(collection).get(record_id)
+
+    def list(self, collection: str) -> List[Dict[str, Any]]:
+        with self.lock.shared():
+            return list(self._read_collection(collection).values())
+
+    def data_files(self) -> List[str]:
+        path = str(self.path)
+        return super().data_files() + [collection_path(path, name) for name in COLLECTIONS]
+
+    def _read_collection(self, name: str) -> Dict[str, Dict[str, Any]]:
+        path = str(self.path)
+        records = {name: {record["id"]: record for record in read_collection(path, name)}}
+        replay(records, self.journal.journal_path, [name])
+        return records[name]
+
+
+def _table(collection: str) -> str:
+    if collection not in _SQLITE_COLUMNS:
+        raise KeyError(f"Unknown collection '{collection}'")
+    return collection
+
+
+def open_storage(
+    path: Union[str, Path], durability: str = "none", pretty_json: bool = False
+) -> Storage:
+    """Pick a backend from the data file suffix.
+
+    ``.db``/``.sqlite`` selects SQLite and ``.snap`` the binary snapshot. A
+    directory (an existing one, or any path ending in a separator) holds one
+    JSON file per collection; anything else is a single JSON file.
+    ``pretty_json`` indents JSON snapshots.
+    """
+    if str(path).endswith(("/", os.sep)) or os.path.isdir(path):
+        state = Path(path) / DIRECTORY_STATE_FILE
+        return DirectoryStore(path=state, durability=durability, pretty=pretty_json)
+    path = Path(path)
+    if path.suffix in SQLITE_SUFFIXES:
+        return SqliteStore(path, durability=durability)
+    if path.suffix in SNAPSHOT_SUFFIXES:
+        return SnapshotStore(path=path, durability=durability)
+    return JsonStore(path=path, durability=durability, pretty=pretty_json)
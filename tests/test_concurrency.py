@@ -0,0 +1,99 @@
+"""Parallel checkouts of one item from several worker processes sharing a data file."""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+
+import pytest
+
+from journal import put
+from storage import open_storage
+
+WORKERS = 8
+ATTEMPTS = 5
+EQUIPMENT_ID = "item-1"
+
+
+def _checkout_worker(path, person_id, barrier, results):
+    # Each process gets its own app module, DataStore and file handles, as a
+    # gunicorn worker would.
+    os.environ["EQUIPMENT_ELLIE_DATA"] = path
+    import app
+
+    client = app.app.test_client()
+    barrier.wait()
+    statuses = []
+    for _ in range(ATTEMPTS):
+        response = client.post(
+            "/api/checkout", json={"equipment_id": EQUIPMENT_ID, "person_id": person_id}
+        )
+        statuses.append(response.status_code)
+    results.put(statuses)
+
+
+def _compactor(path, stop):
+    store = open_storage(path)
+    try:
+        while not stop.is_set():
+            store.compact()
+    finally:
+        store.close()
+
+
+def _seed(path):
+    store = open_storage(path)
+    store.load()
+    equipment = {
+        "id": EQUIPMENT_ID,
+        "name": "Camera",
+        "tag": "",
+        "description": "",
+        "status": "available",
+        "checked_out_to": None,
+        "due_at": None,
+    }
+    people = [
+        {"id": f"person-{number}", "name": f"Person {number}", "email": "", "role": ""}
+        for number in range(WORKERS)
+    ]
+    store.commit(
+        "seed", [put("equipment", equipment)] + [put("people", person) for person in people]
+    )
+    store.close()
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.db"])
+def test_one_checkout_wins_across_processes(tmp_path, name):
+    path = str(tmp_path / name)
+    _seed(path)
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(WORKERS)
+    results = context.Queue()
+    stop = context.Event()
+    workers = [
+        context.Process(target=_checkout_worker, args=(path, f"person-{number}", barrier, results))
+        for number in range(WORKERS)
+    ]
+    compactor = context.Process(target=_compactor, args=(path, stop))
+    compactor.start()
+    for worker in workers:
+        worker.start()
+    statuses = [status for _ in workers for status in results.get(timeout=120)]
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+    stop.set()
+    compactor.join(timeout=30)
+    assert compactor.exitcode == 0
+
+    assert statuses.count(201) == 1
+    assert set(statuses) <= {201, 400, 409}
+    store = open_storage(path)
+    data = store.load()
+    store.close()
+    active = [record for record in data["checkouts"] if record["checked_in_at"] is None]
+    assert len(active) == 1
+    (equipment,) = data["equipment"]
+    assert equipment["status"] == "checked_out"
+    assert equipment["checked_out_to"] == active[0]["person_id"]
@@ -0,0 +1,57 @@
+"""In-memory ``DataStore`` behaviour against the storage backends."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+import inventory
+from datastore import DataStore
+from storage import open_storage
+
+WRITES = 300
+READERS = 4
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.snap", "data/", "data.db"])
+def test_reads_during_writes_do_not_reload(tmp_path, monkeypatch, name):
+    store = DataStore(open_storage(str(tmp_path / name)))
+    start_version = store.version
+    loads = []
+    original_load = DataStore._load
+
+    def counting_load(self):
+        loads.append(self.version)
+        original_load(self)
+
+    monkeypatch.setattr(DataStore, "_load", counting_load)
+    done = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not done.is_set():
+                # What every Flask request does before it is handled.
+                store.refresh()
+                store.list("people")
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    readers = [threading.Thread(target=read) for _ in range(READERS)]
+    for reader in readers:
+        reader.start()
+    try:
+        for number in range(WRITES):
+            store.transact(lambda view: inventory.create_person(view, {"name": f"P{number}"}))
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert loads == []
+    assert store.count("people") == WRITES
+    version, mutations = store.changes_since(start_version)
+    assert version == start_version + WRITES
+    assert mutations is not None and len(mutations) == WRITES
@@ -0,0 +1,54 @@
+"""CSV imports that update stored records by tag across commit chunks."""
+
+from __future__ import annotations
+
+import io
+
+import pytest
+
+import exchange
+from journal import put
+from storage import open_storage
+
+CSV = """name,tag,description
+Camera,CAM-1,new lens
+,cam-2,
+Tripod,TRI-1,
+Tripod XL,tri-1,
+Camera,cam-1,new lens
+Light,LIG-1,
+,NEW-9,
+Drill,DRL-1,
+"""
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.snap", "data/", "data.db"])
+def test_import_updates_by_tag_across_chunks(tmp_path, name):
+    store = open_storage(str(tmp_path / name))
+    store.load()
+    stored = [
+        {"id": "e1", "name": "Camera", "tag": "cam-1", "description": "", "status": "available"},
+        {"id": "e2", "name": "Drill", "tag": "DRL-1", "description": "", "status": "available"},
+    ]
+    store.commit("seed", [put("equipment", record) for record in stored])
+    errors = []
+
+    summary = exchange.import_records(
+        store,
+        "equipment",
+        io.StringIO(CSV),
+        "csv",
+        [],
+        lambda line, message: errors.append(line),
+        chunk_rows=2,
+    )
+
+    assert (summary.created, summary.updated, summary.unchanged, summary.failed) == (2, 3, 1, 2)
+    assert errors == [3, 8]
+    records = {record["tag"].casefold(): record for record in store.list("equipment")}
+    assert sorted(records) == ["cam-1", "drl-1", "lig-1", "tri-1"]
+    assert records["cam-1"]["id"] == "e1"
+    assert records["cam-1"]["description"] == "new lens"
+    assert records["tri-1"]["name"] == "Tripod XL"
+    assert records["drl-1"]["status"] == "available"
+    store.close()
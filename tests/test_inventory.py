@@ -0,0 +1,38 @@
+"""List parameters that used to fail with a server error."""
+
+from __future__ import annotations
+
+import pytest
+
+import inventory
+from datastore import DataStore
+from storage import open_storage
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DataStore(open_storage(str(tmp_path / "data.json")))
+    for number in range(5):
+        store.transact(lambda view: inventory.create_equipment(view, {"name": f"Cam {number}"}))
+    return store
+
+
+@pytest.mark.parametrize(
+    ("first", "second"), [("name", "created"), ("created", "name"), ("name", "-name")]
+)
+def test_cursor_from_another_sort_is_rejected(store, first, second):
+    _, cursor = inventory.list_records(store, "equipment", {"sort": first, "limit": "2"})
+    with pytest.raises(inventory.ValidationError):
+        inventory.list_records(store, "equipment", {"sort": second, "cursor": cursor})
+
+
+def test_cursor_continues_its_own_sort(store):
+    _, cursor = inventory.list_records(store, "equipment", {"sort": "name", "limit": "2"})
+    page, _ = inventory.list_records(store, "equipment", {"sort": "name", "cursor": cursor})
+    assert [item["name"] for item in page.items] == ["Cam 2", "Cam 3", "Cam 4"]
+
+
+def test_query_without_search_words_matches_nothing(store):
+    page, _ = inventory.list_records(store, "equipment", {"q": "!!!"})
+    assert page.items == [] and page.total == 0
+    assert inventory.search(store, {"q": "!!!"})["equipment"] == []
@@ -0,0 +1,24 @@
+"""Journal appends after a crash left a torn last line."""
+
+from __future__ import annotations
+
+from journal import Journal, append_mutations, put
+
+
+def _person(record_id):
+    return [put("people", {"id": record_id, "name": record_id})]
+
+
+def test_blind_append_after_torn_line_survives_reload(tmp_path):
+    path = str(tmp_path / "data.json")
+    append_mutations(path + ".journal", [("create", _person("first"))])
+    with open(path + ".journal", "ab") as handle:
+        handle.write(b'{"op":"create","changes":[{"act')
+
+    # A journal that never loaded the file appends blindly, as the CLI does.
+    Journal(path).append_many([("create", _person("second"))])
+    append_mutations(path + ".journal", [("create", _person("third"))])
+
+    journal = Journal(path)
+    assert sorted(journal.load()["people"]) == ["first", "second", "third"]
+    assert journal.version == 3
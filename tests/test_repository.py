@@ -0,0 +1,50 @@
+"""``CheckoutRepository`` updates that move a checkout between items."""
+
+from __future__ import annotations
+
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+
+from equipment_ellie.models import Checkout
+from equipment_ellie.repository import CheckoutRepository
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+def _open(equipment_id):
+    return Checkout(
+        id=0,
+        equipment_id=equipment_id,
+        checked_out_at=NOW,
+        due_at=NOW + timedelta(days=equipment_id),
+    )
+
+
+def test_update_moves_an_active_checkout_to_other_equipment():
+    repository = CheckoutRepository()
+    checkout = repository.create(_open(1))
+
+    repository.update(replace(checkout, equipment_id=2))
+
+    assert repository.get_active_for_equipment(1) is None
+    assert repository.get_active_for_equipment(2).id == checkout.id
+    assert [item.equipment_id for item in repository.due_before(NOW + timedelta(days=9))] == [2]
+
+
+def test_update_onto_equipment_with_an_open_checkout_changes_nothing():
+    repository = CheckoutRepository()
+    first = repository.create(_open(1))
+    second = repository.create(_open(2))
+
+    with pytest.raises(ValueError):
+        repository.update(replace(first, equipment_id=2))
+
+    assert repository.get_active_for_equipment(1) == first
+    assert repository.get_active_for_equipment(2) == second
+
+
+def test_update_of_unknown_checkout_raises_key_error():
+    with pytest.raises(KeyError):
+        CheckoutRepository().update(replace(_open(1), id=7))
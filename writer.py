@@ -0,0 +1,135 @@
+"""Single asyncio task that applies every mutation for the ASGI server."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from datastore import MAX_COMMIT_ATTEMPTS, DataStore, Mutation
+from storage import ConflictError
+
+# Most writes folded into one storage commit.
+MAX_BATCH = 512
+# How often an idle writer looks for writes made by other processes.
+POLL_SECONDS = 1.0
+
+Operation = Callable[[DataStore], Mutation]
+
+
+class Writer:
+    """Funnels mutations through one task so they are applied in arrival order.
+
+    Writes queue up while the previous batch is being persisted and are then
+    planned against the in-memory state and committed together, with the
+    disk I/O run in a thread. The store only changes once a batch is on disk,
+    and only on the event loop, so readers on the loop never wait for the
+    disk or see writes that may yet fail.
+    """
+
+    def __init__(self, store: DataStore, poll_interval: float = POLL_SECONDS) -> None:
+        self.store = store
+        self.poll_interval = poll_interval
+        self._queue: "Optional[asyncio.Queue[Optional[Tuple[Operation, asyncio.Future]]]]" = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._changed: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """Start the writer task on the running loop, unless it is already running."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._changed = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Finish the writes already queued, then stop."""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    async def submit(self, operation: Operation) -> Any:
+        """Queue ``operation`` and return its result once it is committed.
+
+        Exceptions the operation raises (validation errors) are re-raised here.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    async def wait(self, version: int, timeout: float) -> bool:
+        """Wait until the store moves past ``version``; ``False`` if ``timeout`` passed first."""
+        self.start()
+        if self.store.version != version:
+            return True
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return self.store.version != version
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), self.poll_interval)
+            except asyncio.TimeoutError:
+                version = self.store.version
+                try:
+                    await self._catch_up()
+                except Exception:
+                    # The backend is unavailable; the next poll or write tries again.
+                    continue
+                if self.store.version != version:
+                    self._notify()
+                continue
+            batch = [first]
+            while len(batch) < MAX_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            writes = [write for write in batch if write is not None]
+            if writes:
+                await self._commit(writes)
+                self._notify()
+            if len(writes) < len(batch):
+                return
+
+    async def _catch_up(self) -> None:
+        entries = await asyncio.to_thread(self.store.storage.changes_since, self.store.version)
+        if entries is None:
+            # The log no longer reaches back this far: rebuild everything, off the loop.
+            self.store.adopt(await asyncio.to_thread(self.store.reloaded))
+        else:
+            self.store.catch_up(entries)
+
+    async def _commit(self, writes: List[Tuple[Operation, asyncio.Future]]) -> None:
+        try:
+            for _ in range(MAX_COMMIT_ATTEMPTS):
+                # Another process may have written since the last batch.
+                await self._catch_up()
+                base_version = self.store.version
+                outcomes, mutations = self.store.plan([operation for operation, _ in writes])
+                if mutations:
+                    try:
+                        version = await asyncio.to_thread(
+                            self.store.storage.commit_many, mutations, base_version
+                        )
+                    except ConflictError:
+                        continue
+                    self.store.apply_committed(mutations, version)
+                for (_, future), (result, error) in zip(writes, outcomes):
+                    if future.done():
+                        continue
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+                return
+            raise ConflictError("Too many concurrent writers; try again.")
+        except Exception as exc:
+            for _, future in writes:
+                if not future.done():
+                    future.set_exception(exc)
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()